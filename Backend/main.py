@@ -1,4 +1,5 @@
 from fastapi import FastAPI , HTTPException 
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 import traceback
@@ -12,7 +13,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db_test import test_astra_connection
 from src.graphs.graph_builder import Graph_builder
-from routers import invoke , resume , init 
+from src.registry.resource_registry import get_registry
+from src.checkpointers.checkpointer import checkpointer
+from src.cache.llm_cache import llm_cache_stats
+from src.states.chunk_store import get_chunk_store
+from src.llms.llm_scheduler import llm_scheduler_stats
+from src.llms.admission_controller import get_admission_controller
+from src.metrics.graph_metrics import get_graph_metrics
+import asyncio
+from routers import invoke , resume , init , stream 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -25,6 +34,8 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     global compiled_graph
     global datastax_status
+    graph_checkpointer = None
+    pruner = None
     
     try:
         logger.info("Checking Datastax Astra DB connection...")
@@ -35,8 +46,11 @@ async def lifespan(app: FastAPI):
             logger.error("Datastax Astra DB connection failed!")
             raise ValueError("Cannot connect to Datastax Astra DB")
         logger.info("Initializing RAG system...")
-        graph_builder = Graph_builder()
-        compiled_graph = graph_builder.build_graph()
+        graph_checkpointer = checkpointer()
+        logger.info(f"Using the {graph_checkpointer.backend} checkpointer backend")
+        graph_builder = Graph_builder(checkpointer=await graph_checkpointer.aget_checkpointer())
+        compiled_graph = graph_builder.build_async_graph()
+        pruner = asyncio.create_task(graph_checkpointer.arun_pruner(compiled_graph))
         logger.info("RAG system initialized successfully!")
         
         yield
@@ -47,6 +61,11 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         logger.info("Shutting down RAG system...")
+        if pruner is not None:
+            pruner.cancel()
+        if graph_checkpointer is not None:
+            await graph_checkpointer.aclose()
+        await get_registry().aclose()
 
 
 
@@ -69,6 +88,7 @@ app.add_middleware(
 app.include_router(invoke.router)
 app.include_router(resume.router)
 app.include_router(init.router)
+app.include_router(stream.router)
 
 
 @app.get("/health")
@@ -84,4 +104,14 @@ async def health_check():
     
     return {
        "message": "RAG system is online , Datastax Astra DB connection is online",
-    }
\ No newline at end of file
+       "llm_cache": await asyncio.to_thread(llm_cache_stats),
+       "chunk_store": await asyncio.to_thread(lambda: get_chunk_store().stats()),
+       "llm_scheduler": llm_scheduler_stats(),
+       "admission": get_admission_controller().stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-node latency, LLM call, token and retry metrics in the Prometheus text format"""
+    return PlainTextResponse(get_graph_metrics().render_prometheus(), media_type="text/plain; version=0.0.4")
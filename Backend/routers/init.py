@@ -1,5 +1,16 @@
 from fastapi import APIRouter, HTTPException
 from schemas import GraphResponse
+from src.cache.semantic_cache import get_semantic_cache, semantic_cache
+from src.metrics.graph_metrics import graph_run_tracer, get_graph_metrics
+from src.routing.retry_controller import get_request_budget_tracker
+from src.states.chunk_store import get_chunk_store, chunk_missing
+from src.llms.admission_controller import admission_rejected, get_admission_controller
+from src.llms.llm_scheduler import provider_rate_limited
+import logging
+import asyncio
+import math
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -8,25 +19,105 @@ def get_compiled_graph():
     from main import compiled_graph
     return compiled_graph
 
-async def run_graph_and_response(input_state, config):
+def graph_config(thread_id, retrieval=None):
+    """
+    Run config of a thread, with the retrieval parameters of the request when it overrides them,
+    a RetrievalConfig or the dict kept in the "retrieval" key of the thread state. Node, LLM and
+    retrieval timings of the run are recorded in the graph metrics, its LLM calls and wall time
+    count against the retry budget of the request.
+    """
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [graph_run_tracer(thread_id), get_request_budget_tracker()]}
+    if retrieval is not None:
+        config["configurable"]["retrieval"] = retrieval.model_dump() if hasattr(retrieval, "model_dump") else dict(retrieval)
+    return config
+
+def unavailable(error):
+    """
+    The 503 of a request turned away by admission control or rate limited by the LLM provider,
+    telling the client when to come back.
+    """
+    return HTTPException(status_code=503, detail=str(error),
+                         headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))})
+
+async def cache_state(question, tenant=None):
+    """
+    Semantic cache keys of the initial state of a run: the question its accepted answer is
+    cached under (None to skip caching), the cache generation the run starts with, and no
+    answer_status yet. They stay in the thread, so a resumed run caches its answer too.
+    """
+    cache = get_semantic_cache(tenant) if question else None
+    generation = await cache.acurrent_generation() if cache is not None else None
+    return {"cache_question": question if cache is not None else None, "cache_generation": generation, "answer_status": None}
+
+async def run_graph_and_response(input_state, config, debug=False):
     compiled_graph = get_compiled_graph()
     
     if compiled_graph is None:
         raise HTTPException(status_code=503, detail="RAG system not initialized.")
 
-    result = compiled_graph.invoke(input_state, config)
-    state = compiled_graph.get_state(config)
-    print(state)
+    try:
+        with get_admission_controller().admitted_run():
+            result = await compiled_graph.ainvoke(input_state, config)
+        return await build_graph_response(compiled_graph, result, config, debug)
+    except (admission_rejected, provider_rate_limited) as e:
+        raise unavailable(e)
+    except chunk_missing as e:
+        # The thread outlived its documents, it cannot go on
+        raise HTTPException(status_code=410, detail=f"{str(e)}, ask the question again")
+
+
+async def build_graph_response(compiled_graph, result, config, debug=False):
+    """
+    Build the GraphResponse of a run that stopped, either finished or interrupted before
+    human_in_the_loop, and cache accepted answers under the cache_question of the thread.
+    With debug, the timing breakdown of the thread is attached.
+    """
+    state = await compiled_graph.aget_state(config)
+    logger.debug(f"Graph state: {state}")
     next_nodes = state.next
     thread_id = config["configurable"]["thread_id"]
     if next_nodes and "human_in_the_loop" in next_nodes:
             run_status = "human_in_the_loop"
     else:
             run_status = "finished"
+
+    # Only answers that passed grading or were approved by a human are reused for similar questions
+    cache_question = result.get("cache_question")
+    cache = get_semantic_cache(result.get("tenant")) if cache_question else None
+    if cache is not None and run_status == "finished" and result.get("answer_status") == "accepted":
+        await cache.astore(
+            cache_question,
+            result.get("generation"),
+            semantic_cache.sources_from_documents(await asyncio.to_thread(get_chunk_store().resolve, result.get("documents"))),
+            result.get("source_type"),
+            cache_generation=result.get("cache_generation")
+        )
+
     return GraphResponse(
                 thread_id=thread_id,
                 run_status=run_status,
                 answer=result.get("generation", None),
                 number_of_documents_tries=result.get("number_of_documents_tries", 0),
-                answer_source=result.get("source_type", None)
-            )
\ No newline at end of file
+                answer_source=result.get("source_type", None),
+                timings=get_graph_metrics().thread_breakdown(thread_id) if debug else None
+            )
+
+
+async def cached_response(question, thread_id, tenant=None):
+    """
+    Return a finished GraphResponse from the semantic cache of the tenant, or None on a miss.
+    """
+    cache = get_semantic_cache(tenant)
+    if cache is None:
+        return None
+    hit = await cache.alookup(question)
+    if hit is None:
+        return None
+    return GraphResponse(
+        thread_id=thread_id,
+        run_status="finished",
+        answer=hit["generation"],
+        number_of_documents_tries=0,
+        answer_source=hit["source_type"],
+        cached=True
+    )
@@ -1,7 +1,7 @@
 from fastapi import APIRouter
 from uuid import uuid4
 from schemas import GraphResponse, initRequest , resumeRequest
-from routers.init import run_graph_and_response
+from routers.init import run_graph_and_response, cached_response, graph_config, cache_state
 
 router = APIRouter()
 
@@ -11,10 +11,20 @@ router = APIRouter()
 async def start_graph(request: initRequest):
     
     thread_id = str(uuid4())
-    config = {"configurable": {"thread_id": thread_id}}
+    # Cached answers were produced with the default retrieval parameters
+    cache_question = request.question if request.retrieval is None else None
+    cached = await cached_response(cache_question, thread_id, request.tenant) if cache_question else None
+    if cached is not None:
+        return cached
+
+    config = graph_config(thread_id, request.retrieval)
     initial_state = {
         "question": request.question,
-        "number_of_documents_tries": request.number_of_documents_tries
+        "number_of_documents_tries": request.number_of_documents_tries,
+        "tenant": request.tenant,
+        # Kept in the thread so a resumed run retrieves with the same parameters
+        "retrieval": request.retrieval.model_dump() if request.retrieval is not None else None,
+        **await cache_state(cache_question, request.tenant)
     }
 
-    return await run_graph_and_response(initial_state, config)
\ No newline at end of file
+    return await run_graph_and_response(initial_state, config, debug=request.debug)
\ No newline at end of file
@@ -1,7 +1,10 @@
 from fastapi import APIRouter
 from uuid import uuid4
 from schemas import GraphResponse, initRequest , resumeRequest
-from routers.init import run_graph_and_response, get_compiled_graph
+from routers.init import run_graph_and_response, get_compiled_graph, graph_config
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -12,9 +15,11 @@ router = APIRouter()
 @router.post("/graph/resume", response_model=GraphResponse)
 async def resume_graph(request: resumeRequest):
     compiled_graph = get_compiled_graph()
-    config = {"configurable": {"thread_id": request.thread_id}}
+    # The run resumes with the retrieval parameters it started with
+    snapshot = await compiled_graph.aget_state(graph_config(request.thread_id))
+    config = graph_config(request.thread_id, snapshot.values.get("retrieval"))
     state = {"upload_status": request.upload_status}
-    print(f"State to update: {state}")
-    compiled_graph.update_state(config, state)
+    logger.debug(f"State to update: {state}")
+    await compiled_graph.aupdate_state(config, state)
 
-    return await run_graph_and_response(None, config)
\ No newline at end of file
+    return await run_graph_and_response(None, config, debug=request.debug)
\ No newline at end of file
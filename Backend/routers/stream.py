@@ -0,0 +1,142 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from uuid import uuid4
+from schemas import initRequest
+from routers.init import get_compiled_graph, build_graph_response, cached_response, graph_config, cache_state, unavailable
+from src.llms.admission_controller import admission_rejected, get_admission_controller
+from src.llms.llm_scheduler import provider_rate_limited
+import json
+
+router = APIRouter()
+
+# Edge functions, reported as routing decisions (async variants carry an "a" prefix)
+EDGE_FUNCTIONS = {
+    "route_question",
+    "route_after_speculation",
+    "route_question_after_attempts",
+    "route_after_transform",
+    "grade_generation_v_documents_and_question",
+    "decide_to_upload",
+}
+
+# Only the answer generation is streamed token by token, grader and router outputs are JSON
+STREAMED_NODES = {"generate"}
+
+
+def sse_event(event, data):
+    """
+    Format one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def edge_function_name(name):
+    if name in EDGE_FUNCTIONS:
+        return name
+    if name.startswith("a") and name[1:] in EDGE_FUNCTIONS:
+        return name[1:]
+    return None
+
+
+async def stream_graph_events(compiled_graph, input_state, config, debug=False):
+    """
+    Run the graph with astream_events and translate its events into SSE:
+    node start/end, routing decisions, generation tokens and a final GraphResponse payload.
+    """
+    graph_nodes = set(compiled_graph.nodes) - {"__start__"}
+    result = dict(input_state or {})
+
+    try:
+        async for event in compiled_graph.astream_events(input_state, config, version="v2"):
+            kind = event["event"]
+            name = event.get("name", "")
+            metadata = event.get("metadata", {})
+            node = metadata.get("langgraph_node")
+
+            if kind == "on_chain_start" and name in graph_nodes and node == name:
+                yield sse_event("node", {"node": name, "status": "start"})
+
+            elif kind == "on_chain_end" and name in graph_nodes and node == name:
+                output = event["data"].get("output")
+                if isinstance(output, dict):
+                    result.update(output)
+                yield sse_event("node", {"node": name, "status": "end"})
+
+            elif kind == "on_chain_end" and edge_function_name(name):
+                yield sse_event("route", {"edge": edge_function_name(name), "decision": event["data"].get("output")})
+
+            elif kind == "on_chat_model_stream" and node in STREAMED_NODES:
+                token = event["data"]["chunk"].content
+                if token:
+                    yield sse_event("token", {"node": node, "token": token})
+
+        state = await compiled_graph.aget_state(config)
+        response = await build_graph_response(compiled_graph, state.values or result, config, debug)
+        yield sse_event("final", response.model_dump())
+
+    except provider_rate_limited as e:
+        yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+
+
+async def admitted_events(events, admission):
+    """
+    Take a run slot when the stream starts and hand it back once the stream ends, finished,
+    failed or dropped by the client. A stream the client drops before it starts never takes
+    one. The request was checked before the response started, a run rejected since is an
+    error event with its retry_after.
+    """
+    try:
+        admission.admit()
+    except admission_rejected as e:
+        yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+        return
+    try:
+        async for event in events:
+            yield event
+    finally:
+        admission.release()
+
+
+@router.post("/graph/stream")
+async def stream_graph(request: initRequest):
+    compiled_graph = get_compiled_graph()
+
+    if compiled_graph is None:
+        raise HTTPException(status_code=503, detail="RAG system not initialized.")
+
+    thread_id = str(uuid4())
+    # Cached answers were produced with the default retrieval parameters
+    cache_question = request.question if request.retrieval is None else None
+    cached = await cached_response(cache_question, thread_id, request.tenant) if cache_question else None
+    if cached is not None:
+        async def cached_events():
+            yield sse_event("final", cached.model_dump())
+        events = cached_events()
+    else:
+        config = graph_config(thread_id, request.retrieval)
+        initial_state = {
+            "question": request.question,
+            "number_of_documents_tries": request.number_of_documents_tries,
+            "tenant": request.tenant,
+            # Kept in the thread so a resumed run retrieves with the same parameters
+            "retrieval": request.retrieval.model_dump() if request.retrieval is not None else None,
+            **await cache_state(cache_question, request.tenant)
+        }
+        # Rejected with a plain 503 before the response starts, the slot is taken by the stream
+        admission = get_admission_controller()
+        try:
+            admission.check()
+        except admission_rejected as e:
+            raise unavailable(e)
+        events = admitted_events(
+            stream_graph_events(compiled_graph, initial_state, config, debug=request.debug),
+            admission
+        )
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
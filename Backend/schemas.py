@@ -1,15 +1,28 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional , Literal 
+from src.retrievers.retrieval_config import RetrievalConfig
+from src.vectorstores.astra_vectorstore import collection_for
 
 
 class initRequest(BaseModel):
     question: str 
     number_of_documents_tries: int = 0
+    retrieval: Optional[RetrievalConfig] = None
+    tenant: Optional[str] = None
+    debug: bool = False
+
+    @field_validator("tenant")
+    @classmethod
+    def check_tenant(cls, tenant):
+        # Unknown or malformed tenants are refused before any collection is opened
+        collection_for(tenant)
+        return tenant
     
     
 class resumeRequest(BaseModel):
     thread_id: str
     upload_status: Literal["yes", "no"]
+    debug: bool = False
 
 class GraphResponse(BaseModel):
     thread_id: str
@@ -17,4 +30,6 @@ class GraphResponse(BaseModel):
     answer : Optional[str] = None
     number_of_documents_tries : int
     answer_source : Optional[str] = None
+    cached : bool = False
+    timings : Optional[dict] = None
     
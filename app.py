@@ -1,17 +1,30 @@
-from fastapi import FastAPI, HTTPException , UploadFile, File
+from fastapi import FastAPI, HTTPException , UploadFile, File, Form
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
 import traceback
 import logging
 from contextlib import asynccontextmanager
 from db_test import test_astra_connection
-from utils.documents_uplaoder import PDFChunksUploader
+from utils.ingestion_jobs import ingestion_job_manager
+from src.cache.semantic_cache import get_semantic_cache, semantic_cache
+from src.cache.llm_cache import llm_cache_stats
 
 
 # Import your RAG components
 from src.graphs.graph_builder import Graph_builder
+from src.registry.resource_registry import get_registry
+from src.checkpointers.checkpointer import checkpointer
+import asyncio
 from src.states.RAGState import RAG
+from src.retrievers.retrieval_config import RetrievalConfig
+from src.routing.retry_controller import get_request_budget_tracker
+from src.metrics.graph_metrics import graph_run_tracer
+from src.states.chunk_store import get_chunk_store, chunk_missing
+from src.vectorstores.astra_vectorstore import collection_for
+from src.llms.llm_scheduler import llm_scheduler_stats, provider_rate_limited
+from src.llms.admission_controller import admission_rejected, get_admission_controller
+import math
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,12 +33,16 @@ logger = logging.getLogger(__name__)
 # Global variable to store the compiled graph
 compiled_graph = None
 datastax_status = None
+ingestion_jobs = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     global compiled_graph
     global datastax_status
+    global ingestion_jobs
+    graph_checkpointer = None
+    pruner = None
     
     try:
         logger.info("Checking Datastax Astra DB connection...")
@@ -37,8 +54,13 @@ async def lifespan(app: FastAPI):
             raise ValueError("Cannot connect to Datastax Astra DB")
         logger.info("Initializing RAG system...")
         # Initialize and compile the graph on startup
-        graph_builder = Graph_builder()
-        compiled_graph = graph_builder.build_graph()
+        graph_checkpointer = checkpointer()
+        logger.info(f"Using the {graph_checkpointer.backend} checkpointer backend")
+        graph_builder = Graph_builder(checkpointer=await graph_checkpointer.aget_checkpointer())
+        compiled_graph = graph_builder.build_async_graph()
+        pruner = asyncio.create_task(graph_checkpointer.arun_pruner(compiled_graph))
+        ingestion_jobs = ingestion_job_manager()
+        ingestion_jobs.start()
         logger.info("RAG system initialized successfully!")
         
         yield
@@ -49,6 +71,13 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         logger.info("Shutting down RAG system...")
+        if pruner is not None:
+            pruner.cancel()
+        if ingestion_jobs is not None:
+            ingestion_jobs.shutdown()
+        if graph_checkpointer is not None:
+            await graph_checkpointer.aclose()
+        await get_registry().aclose()
 
 # Create FastAPI app with lifespan events
 app = FastAPI(
@@ -62,12 +91,21 @@ app = FastAPI(
 class QuestionRequest(BaseModel):
     question: str = Field(..., description="The question to ask the RAG system", min_length=1)
     number_of_documents_attempted: int = Field(..., description="Number of document retrieval attempts")
+    retrieval: Optional[RetrievalConfig] = Field(default=None, description="Retrieval parameters overriding the RETRIEVAL_* defaults")
+    tenant: Optional[str] = Field(default=None, description="Tenant whose collection is searched, the shared collection when omitted")
+
+    @field_validator("tenant")
+    @classmethod
+    def check_tenant(cls, tenant):
+        collection_for(tenant)
+        return tenant
     
 class RAGResponse(BaseModel):
     answer: str = Field(..., description="The generated answer")
     source_documents: List[str] = Field(default=[], description="Source documents used for the answer")
     question: str = Field(..., description="The original question")
     success: bool = Field(default=True, description="Whether the request was successful")
+    cached: bool = Field(default=False, description="Whether the answer was served from the semantic cache")
     
 class ErrorResponse(BaseModel):
     error: str = Field(..., description="Error message")
@@ -81,6 +119,8 @@ async def root():
         "description": "Send POST requests to /ask_rag with your questions",
         "endpoints": {
             "/ask_rag": "POST - Ask a question to the RAG system",
+            "/upload-pdf/": "POST - Queue PDFs for ingestion, returns a job id",
+            "/ingest/{job_id}": "GET - Progress of an ingestion job",
             "/health": "GET - Check system health",
             "/docs": "GET - API documentation"
         }
@@ -98,7 +138,11 @@ async def health_check():
         "status": "healthy",
         "rag_system": "initialized",
         "datastax_astra_db": "connected" if datastax_status else "not connected",
-        "message": "RAG system is ready to process questions"
+        "message": "RAG system is ready to process questions",
+        "llm_cache": await asyncio.to_thread(llm_cache_stats),
+        "chunk_store": await asyncio.to_thread(lambda: get_chunk_store().stats()),
+        "llm_scheduler": llm_scheduler_stats(),
+        "admission": get_admission_controller().stats()
     }
 
 @app.post("/ask_rag", response_model=RAGResponse)
@@ -123,19 +167,45 @@ async def ask_rag(request: QuestionRequest):
     try:
         logger.info(f"Processing question: {request.question}")
         
+        # Serve near-identical questions from previously accepted answers
+        # Cached answers were produced with the default retrieval parameters
+        cache = get_semantic_cache(request.tenant) if request.retrieval is None else None
+        if cache is not None:
+            hit = await cache.alookup(request.question.strip())
+            if hit is not None:
+                logger.info(f"Semantic cache hit (similarity {hit['similarity']:.3f})")
+                return RAGResponse(
+                    answer=hit["generation"],
+                    source_documents=[s[:200] + "..." if len(s) > 200 else s for s in hit["sources"]],
+                    question=request.question,
+                    success=True,
+                    cached=True
+                )
+
         # Prepare the input state for the graph (only question needed, counter will be initialized)
+        # The thread is reused by the same question, the answer_status of an earlier run must not carry over
         input_state = {
-            "question": request.question.strip()
+            "question": request.question.strip(),
+            "tenant": request.tenant,
+            "retrieval": request.retrieval.model_dump() if request.retrieval is not None else None,
+            "answer_status": None,
+            "cache_generation": await cache.acurrent_generation() if cache is not None else None
         }
         
         # Execute the graph with memory support
         logger.info("Executing RAG graph...")
-        config = {"configurable": {"thread_id": f"conversation_{hash(request.question) % 10000}"}}
-        result = compiled_graph.invoke(input_state, config=config)
+        thread_id = f"conversation_{hash((request.tenant, request.question)) % 10000}"
+        config = {"configurable": {"thread_id": thread_id}, "callbacks": [graph_run_tracer(thread_id), get_request_budget_tracker()]}
+        if request.retrieval is not None:
+            config["configurable"]["retrieval"] = request.retrieval.model_dump()
+        # Turned away upfront when the LLM queue is saturated, cache hits above are still served
+        with get_admission_controller().admitted_run():
+            result = await compiled_graph.ainvoke(input_state, config=config)
         
         # Extract the results
         answer = result.get("generation", "No answer generated")
-        documents = result.get("documents", [])
+        # The state holds chunk references, the bodies are in the chunk store
+        documents = await asyncio.to_thread(get_chunk_store().resolve, result.get("documents"))
         
         # Process documents to extract source information
         source_docs = []
@@ -158,6 +228,15 @@ async def ask_rag(request: QuestionRequest):
                 source_docs.append(content)
         
         logger.info(f"Generated answer with {len(source_docs)} source documents")
+
+        if cache is not None and result.get("answer_status") == "accepted":
+            await cache.astore(
+                request.question.strip(),
+                answer,
+                semantic_cache.sources_from_documents(documents),
+                result.get("source_type"),
+                cache_generation=result.get("cache_generation")
+            )
         
         return RAGResponse(
             answer=answer,
@@ -166,6 +245,16 @@ async def ask_rag(request: QuestionRequest):
             success=True
         )
         
+    except (admission_rejected, provider_rate_limited) as e:
+        logger.warning(f"Question not processed: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+    except chunk_missing as e:
+        logger.warning(f"Question not processed: {str(e)}")
+        raise HTTPException(status_code=410, detail=f"{str(e)}, ask the question again")
     except Exception as e:
         logger.error(f"Error processing question: {str(e)}")
         logger.error(traceback.format_exc())
@@ -176,19 +265,55 @@ async def ask_rag(request: QuestionRequest):
         )
 
 
-@app.post("/upload-pdf/")
-async def upload_pdf(files: list[UploadFile] = File(...)):
+@app.post("/upload-pdf/", status_code=202)
+async def upload_pdf(files: list[UploadFile] = File(...), tenant: Optional[str] = Form(None), replace: bool = Form(True)):
+    """
+    Spool the uploaded PDFs to disk and queue them for ingestion into the tenant's collection,
+    the shared collection without tenant. Poll /ingest/{job_id} for progress.
+
+    Each file replaces the documents ingested before under its name, so a changed version
+    does not leave the old chunks behind. replace=false keeps files sharing a name side by side.
+    """
+    if ingestion_jobs is None:
+        raise HTTPException(status_code=503, detail="Ingestion workers not initialized")
+    try:
+        collection_for(tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        pdf_files = [(file.filename, await file.read()) for file in files]
-        uploader = PDFChunksUploader(
-            files=[(filename, memoryview(content)) for filename, content in pdf_files]
+        job_id = await asyncio.to_thread(
+            ingestion_jobs.spool, [(file.filename, file.file) for file in files], tenant, replace
+        )
+        return JSONResponse(
+            content={"job_id": job_id, "status": "queued", "status_url": f"/ingest/{job_id}"},
+            status_code=202
         )
-        result = uploader.start_pdf_upload()
-        return JSONResponse(content=result, status_code=200)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/ingest/{job_id}")
+async def ingestion_status(job_id: str):
+    """
+    Status and progress (files, chunks embedded, chunks written, errors) of an ingestion job
+    """
+    job = ingestion_jobs.get(job_id) if ingestion_jobs is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job {job_id}")
+    return job
+
+
+@app.post("/ingest/{job_id}/cancel")
+async def cancel_ingestion(job_id: str):
+    """
+    Cancel a queued or running ingestion job
+    """
+    job = ingestion_jobs.cancel(job_id) if ingestion_jobs is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job {job_id}")
+    return job
+
+
 
 
 
@@ -0,0 +1,271 @@
+"""
+Offline benchmark of the compiled graph.
+
+The graph built by Graph_builder runs against local stand-ins (benchmarks/stand_ins.py): a
+scripted LLM with configurable latency, a canned web search and an in-memory vector store
+over a recorded corpus. Nothing reaches the network. Every question of the set is run at each
+concurrency level and the report gives p50/p95/mean latency, throughput, LLM calls and tokens
+per question and memory use per level. The bytes checkpointed per question are reported as
+stored, with chunk references in the state, and as they would be with the document bodies
+inlined in the state.
+
+Features are toggled with the usual environment variables (SPECULATIVE_ROUTING, GRADING_MODE,
+GENERATION_GRADING_MODE, RERANKER_ENABLED, RETRY_MAX_LLM_CALLS, ...). The LLM, embedding, semantic and web search
+caches are disabled unless set, so repeated runs measure the same work.
+
+Usage:
+    python benchmarks/run_benchmark.py [--questions benchmarks/data/questions.jsonl] [--corpus benchmarks/data/corpus.jsonl]
+        [--concurrency 1,4,16] [--repeat 1] [--llm-latency 0.05] [--llm-jitter 0.0] [--search-latency 0.2]
+        [--sync] [--trace-memory] [--output results.json] [--compare baseline.json]
+
+The questions file holds one JSON object per line with a "question" key and optional script
+keys: "route" (vectorstore or web_search), "relevant", "grounded", "useful" (booleans) and
+"answer". The corpus file holds one {"id", "text"} object per line.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from uuid import uuid4
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Set before the first load_dotenv so the stand-ins are measured without cache hits or network
+OFFLINE_ENVIRONMENT = {
+    "LLM_CACHE_ENABLED": "false",
+    "EMBEDDING_CACHE_ENABLED": "false",
+    "SEMANTIC_CACHE_ENABLED": "false",
+    "WEB_SEARCH_CACHE_ENABLED": "false",
+    "CHUNK_STORE_BACKEND": "memory",
+    "RETRIEVER_BACKEND": "astra",
+    "RETRIEVER_HYBRID": "false",
+    "GROQ_API_KEY": "offline",
+    "TAVILY_API_KEY": "offline",
+    "LANGCHAIN_TRACING_V2": "false",
+    "HF_HUB_OFFLINE": "1",
+}
+
+from benchmarks.stand_ins import install_stand_ins, load_jsonl
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of values, q in [0, 100].
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if platform.system() == "Darwin" else rss / 1024, 1)
+
+
+def run_config(thread_id, metrics):
+    from src.metrics.graph_metrics import graph_run_tracer
+    from src.routing.retry_controller import get_request_budget_tracker
+    return {"configurable": {"thread_id": thread_id}, "callbacks": [graph_run_tracer(thread_id, metrics), get_request_budget_tracker()]}
+
+
+def checkpoint_bytes(compiled_graph, config):
+    """
+    Serialized size of the checkpoints and pending writes of the thread of config, as stored and
+    with the chunk references of "documents" replaced by their Documents.
+    """
+    from src.states.chunk_store import get_chunk_store
+
+    saver = compiled_graph.checkpointer
+    store = get_chunk_store()
+
+    def size(value):
+        return len(saver.serde.dumps_typed(value)[1])
+
+    def inlined(channel, value):
+        return store.resolve(value) if channel == "documents" and isinstance(value, list) else value
+
+    stored = inline = 0
+    for saved in saver.list({"configurable": {"thread_id": config["configurable"]["thread_id"]}}):
+        checkpoint = saved.checkpoint
+        stored += size(checkpoint)
+        values = {k: inlined(k, v) for k, v in checkpoint["channel_values"].items()}
+        inline += size({**checkpoint, "channel_values": values})
+        for _, channel, value in saved.pending_writes or []:
+            stored += size(value)
+            inline += size(inlined(channel, value))
+    return stored, inline
+
+
+async def run_level(compiled_graph, questions, concurrency, metrics, use_async):
+    """
+    Run every question once with at most `concurrency` graph runs in flight.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def run_one(question):
+        async with semaphore:
+            thread_id = str(uuid4())
+            config = run_config(thread_id, metrics)
+            state = {"question": question, "number_of_document_tries": 0}
+            start = time.perf_counter()
+            error = None
+            try:
+                if use_async:
+                    await compiled_graph.ainvoke(state, config)
+                else:
+                    await asyncio.to_thread(compiled_graph.invoke, state, config)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            latency = time.perf_counter() - start
+            breakdown = metrics.thread_breakdown(thread_id) or {}
+            stored_bytes, inlined_bytes = checkpoint_bytes(compiled_graph, config)
+            results.append({
+                "question": question, "latency_s": latency, "error": error,
+                "llm_calls": breakdown.get("llm_calls", 0),
+                "prompt_tokens": breakdown.get("prompt_tokens", 0),
+                "completion_tokens": breakdown.get("completion_tokens", 0),
+                "retries": breakdown.get("retries", 0),
+                "checkpoint_bytes": stored_bytes,
+                "checkpoint_bytes_inlined": inlined_bytes,
+            })
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_one(q) for q in questions))
+    return results, time.perf_counter() - start
+
+
+def summarize(concurrency, results, wall_seconds, llm_calls_by_chain, heap_peak_mb):
+    latencies = [r["latency_s"] for r in results if r["error"] is None]
+    runs = len(results)
+
+    def per_question(key):
+        return round(sum(r[key] for r in results) / runs, 2) if runs else None
+
+    return {
+        "concurrency": concurrency,
+        "runs": runs,
+        "errors": sum(1 for r in results if r["error"] is not None),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_qps": round(runs / wall_seconds, 3) if wall_seconds else None,
+        "latency_p50_s": round(percentile(latencies, 50), 4) if latencies else None,
+        "latency_p95_s": round(percentile(latencies, 95), 4) if latencies else None,
+        "latency_mean_s": round(sum(latencies) / len(latencies), 4) if latencies else None,
+        "llm_calls_per_question": per_question("llm_calls"),
+        "prompt_tokens_per_question": per_question("prompt_tokens"),
+        "completion_tokens_per_question": per_question("completion_tokens"),
+        "retries_per_question": per_question("retries"),
+        "checkpoint_kb_per_question": round(per_question("checkpoint_bytes") / 1024, 2) if runs else None,
+        "checkpoint_kb_inlined_per_question": round(per_question("checkpoint_bytes_inlined") / 1024, 2) if runs else None,
+        "llm_calls_by_chain": llm_calls_by_chain,
+        "max_rss_mb": max_rss_mb(),
+        "python_heap_peak_mb": heap_peak_mb,
+        "error_samples": sorted({r["error"] for r in results if r["error"]})[:5],
+    }
+
+
+def compare(report, baseline):
+    """
+    Print the change of the main figures of each concurrency level against a baseline report.
+    """
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in report["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        changes = []
+        for key in ("latency_p50_s", "latency_p95_s", "throughput_qps", "llm_calls_per_question",
+                    "checkpoint_kb_per_question", "max_rss_mb"):
+            old, new = before.get(key), level.get(key)
+            if old and new is not None:
+                changes.append(f"{key} {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+        print(f"concurrency {level['concurrency']}: " + ", ".join(changes))
+
+
+async def main(args):
+    for key, value in OFFLINE_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+
+    questions = load_jsonl(args.questions)
+    corpus = load_jsonl(args.corpus)
+    llm = install_stand_ins(questions, corpus, llm_latency=args.llm_latency, llm_jitter=args.llm_jitter,
+                            search_latency=args.search_latency, seed=args.seed)
+
+    # Imported after the stand-ins are registered, the module builds a graph on import
+    from src.graphs.graph_builder import Graph_builder
+    from src.metrics.graph_metrics import graph_metrics
+    from langgraph.checkpoint.memory import MemorySaver
+
+    builder = Graph_builder(checkpointer=MemorySaver())
+    compiled_graph = builder.build_graph() if args.sync else builder.build_async_graph()
+    levels = [int(c) for c in args.concurrency.split(",")]
+    run_questions = [q["question"] for q in questions] * args.repeat
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "questions": os.path.relpath(args.questions), "corpus": os.path.relpath(args.corpus),
+            "question_count": len(questions), "repeat": args.repeat, "mode": "sync" if args.sync else "async",
+            "llm_latency_s": args.llm_latency, "llm_jitter_s": args.llm_jitter,
+            "search_latency_s": args.search_latency, "seed": args.seed,
+            "environment": {k: v for k, v in sorted(os.environ.items())
+                            if k.startswith(("SPECULATIVE_", "GRADING_", "GENERATION_GRADING_", "RERANKER_", "RETRIEV", "HYBRID_",
+                                             "LOCAL_ROUTER", "CONTEXT_", "LLM_CACHE", "WEB_SEARCH_", "CHECKPOINTER", "RETRY_",
+                                             "CHUNK_STORE", "LLM_SCHEDULER", "LLM_GROQ_", "ADMISSION_"))},
+        },
+        "levels": [],
+    }
+
+    for concurrency in levels:
+        metrics = graph_metrics()
+        llm.reset_calls()
+        if args.trace_memory:
+            tracemalloc.start()
+        results, wall_seconds = await run_level(compiled_graph, run_questions, concurrency, metrics, not args.sync)
+        heap_peak_mb = None
+        if args.trace_memory:
+            heap_peak_mb = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+            tracemalloc.stop()
+        level = summarize(concurrency, results, wall_seconds, llm.calls(), heap_peak_mb)
+        report["levels"].append(level)
+        print(f"concurrency {concurrency:>3}: p50 {level['latency_p50_s']}s, p95 {level['latency_p95_s']}s, "
+              f"{level['throughput_qps']} q/s, {level['llm_calls_per_question']} LLM calls/question, "
+              f"{level['checkpoint_kb_per_question']} KB checkpointed/question "
+              f"({level['checkpoint_kb_inlined_per_question']} KB with documents inlined), "
+              f"{level['errors']} errors, {level['max_rss_mb']} MB RSS")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline latency and throughput benchmark of the RAG graph")
+    parser.add_argument("--questions", default=os.path.join(BENCHMARK_DIR, "data", "questions.jsonl"))
+    parser.add_argument("--corpus", default=os.path.join(BENCHMARK_DIR, "data", "corpus.jsonl"))
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated concurrency levels")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of the question set per level")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="Uniform +/- jitter of the LLM latency")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="Seconds per web search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sync", action="store_true", help="Run the sync graph in worker threads")
+    parser.add_argument("--trace-memory", action="store_true", help="Report the Python heap peak (slower)")
+    parser.add_argument("--output", help="Save the report as JSON")
+    parser.add_argument("--compare", help="Report JSON to compare against")
+    asyncio.run(main(parser.parse_args()))
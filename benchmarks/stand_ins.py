@@ -0,0 +1,251 @@
+"""
+Local stand-ins for the Groq LLM, the Tavily search tool and the Astra DB vector store.
+
+They are registered in the resource registry under the keys the real clients use, so the
+graph built afterwards by Graph_builder runs unchanged and without network.
+"""
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_core.documents import Document
+from pydantic import PrivateAttr
+from typing import Dict, Any
+import threading
+import asyncio
+import hashlib
+import random
+import json
+import math
+import time
+import re
+
+WORD_PATTERN = re.compile(r"\w+")
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "in", "on", "for", "and", "or",
+    "what", "how", "why", "which", "who", "does", "do", "can", "with", "about", "it", "its", "this",
+    "that", "as", "by", "from", "at", "i", "you", "me", "my", "your", "explain", "describe",
+}
+
+
+def content_words(text):
+    return {w for w in WORD_PATTERN.findall(text.lower()) if w not in STOPWORDS and len(w) > 2}
+
+
+def load_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+
+class hashing_embeddings(Embeddings):
+    """
+    a class to represent a bag-of-words embedding hashed into `size` dimensions
+
+    Texts sharing words get similar vectors, enough for the in-memory store to rank the
+    corpus sensibly without downloading a model.
+    """
+
+    def __init__(self, size=384):
+        self.size = size
+
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for word in content_words(text):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector] if norm else vector
+
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+
+class scripted_chat_model(BaseChatModel):
+    """
+    a class to represent a chat model answering the graph's chains from a question script
+
+    The chain is recognised from its system prompt. Router, grader and generation answers come
+    from the question record found in the prompt ("route", "relevant", "grounded", "useful", "answer"),
+    document relevance defaults to a shared content word between document and question.
+    Every call sleeps `latency_seconds` (+/- `latency_jitter`) and reports approximate token usage.
+    """
+
+    script: Dict[str, Any] = {}
+    latency_seconds: float = 0.05
+    latency_jitter: float = 0.0
+    seed: int = 0
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _random: Any = PrivateAttr(default=None)
+    _calls: Dict[str, int] = PrivateAttr(default_factory=dict)
+
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+
+    def _latency(self):
+        with self._lock:
+            if self._random is None:
+                self._random = random.Random(self.seed)
+            jitter = self._random.uniform(-self.latency_jitter, self.latency_jitter)
+        return max(0.0, self.latency_seconds + jitter)
+
+
+    def _record(self, prompt):
+        best = ("", {})
+        for text, record in self.script.items():
+            if text in prompt and len(text) > len(best[0]):
+                best = (text, record)
+        return best
+
+
+    @staticmethod
+    def _relevant(document, question, record):
+        if "relevant" in record:
+            return bool(record["relevant"])
+        return bool(content_words(document) & content_words(question))
+
+
+    @staticmethod
+    def _yes(value):
+        return "yes" if value else "no"
+
+
+    def respond(self, system, human):
+        """
+        Return the chain name and the scripted answer to one prompt.
+        """
+        question_text, record = self._record(human)
+        if "routing user questions" in system:
+            return "question_router", json.dumps({"datasource": record.get("route", "vectorstore")})
+        if "relevance of several retrieved documents" in system:
+            documents, _, question = human.partition("User question:")
+            chunks = re.split(r"Document \d+:\n", documents)[1:]
+            return "multi_document_grader", json.dumps(
+                {"scores": [self._yes(self._relevant(c, question, record)) for c in chunks]})
+        if "relevance of a retrieved document" in system:
+            document, _, question = human.partition("User question:")
+            return "retrieval_grader", json.dumps({"binary_score": self._yes(self._relevant(document, question, record))})
+        if "answers_question" in system:
+            return "generation_grader", json.dumps({"grounded": self._yes(record.get("grounded", True)),
+                                                    "answers_question": self._yes(record.get("useful", True))})
+        if "grounded in" in system:
+            return "hallucination_grader", json.dumps({"binary_score": self._yes(record.get("grounded", True))})
+        if "answers a user question" in system:
+            return "answer_grader", json.dumps({"binary_score": self._yes(record.get("useful", True))})
+        if "alternative web search queries" in system:
+            count = int(re.search(r"Number of queries: (\d+)", human).group(1))
+            return "web_query_expander", json.dumps({"queries": [f"{question_text} ({i})" for i in range(1, count + 1)]})
+        if "re-writer" in system:
+            # The rewrite keeps the question text so later prompts still match its record
+            question = human.split("Here is the initial question:", 1)[-1].split("Formulate", 1)[0].strip()
+            return "question_rewriter", question
+        # The answer repeats the question so the hallucination grader prompt still matches its record
+        return "rag_chain", record.get("answer", f"A scripted answer to: {question_text}")
+
+
+    def _result(self, messages):
+        system = "\n".join(m.content for m in messages if m.type == "system")
+        human = "\n".join(m.content for m in messages if m.type != "system")
+        chain, content = self.respond(system, human)
+        with self._lock:
+            self._calls[chain] = self._calls.get(chain, 0) + 1
+        prompt_tokens = (len(system) + len(human)) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._latency())
+        return self._result(messages)
+
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._latency())
+        return self._result(messages)
+
+
+    def calls(self):
+        """
+        LLM calls made so far, per chain.
+        """
+        with self._lock:
+            return dict(self._calls)
+
+
+    def reset_calls(self):
+        with self._lock:
+            self._calls.clear()
+
+
+
+def fake_web_search(latency_seconds=0.2, results=3):
+    """
+    Return a runnable shaped like TavilySearchResults, answering every query with canned results.
+    """
+    def search(query):
+        return [{"url": f"https://example.com/{i}", "content": f"Web result {i} about {query}"}
+                for i in range(1, results + 1)]
+
+    def invoke(payload):
+        time.sleep(latency_seconds)
+        return search(payload["query"])
+
+    async def ainvoke(payload):
+        await asyncio.sleep(latency_seconds)
+        return search(payload["query"])
+
+    return RunnableLambda(invoke, afunc=ainvoke, name="fake_web_search")
+
+
+def in_memory_vectorstore(corpus, embedder):
+    """
+    Return an InMemoryVectorStore holding the corpus records ({"id", "text", optional "metadata"}).
+    """
+    store = InMemoryVectorStore(embedding=embedder)
+    store.add_documents(
+        [Document(page_content=r["text"], metadata=r.get("metadata", {}), id=str(r.get("id", i)))
+         for i, r in enumerate(corpus)]
+    )
+    return store
+
+
+def install_stand_ins(questions, corpus, llm_latency=0.05, llm_jitter=0.0, search_latency=0.2, seed=0):
+    """
+    Register the stand-ins in the resource registry, before any graph or chain is built.
+
+    Returns:
+        scripted_chat_model: the LLM stand-in, whose calls() counts the calls per chain
+    """
+    from src.registry.resource_registry import get_registry
+    from src.embedding.embedding import EMBEDDING_MODEL
+    from src.vectorstores.astra_vectorstore import DEFAULT_COLLECTION
+
+    registry = get_registry()
+    embedder = hashing_embeddings()
+    llm = scripted_chat_model(
+        script={q["question"]: q for q in questions},
+        latency_seconds=llm_latency, latency_jitter=llm_jitter, seed=seed,
+    )
+    registry.set("llm:groq", llm)
+    registry.set(f"embedding:{EMBEDDING_MODEL}", embedder)
+    registry.set(f"vectorstore:{DEFAULT_COLLECTION}", in_memory_vectorstore(corpus, embedder))
+    registry.set("web_search:tavily", fake_web_search(search_latency))
+    return llm
@@ -0,0 +1,137 @@
+"""
+Benchmark of hybrid BM25 + vector retrieval against vector retrieval alone.
+
+For every labelled question, both retrievers run the retrieve -> grade -> transform_query loop
+of the graph: when no retrieved chunk is relevant the question is rewritten and retrieved
+again, up to `--max-attempts` rewrites before the graph would fall back to web search. The
+report gives first-pass hit rate, recall@k and MRR, the rewrite loops run, the LLM calls they
+cost and the web search fallbacks, per retriever.
+
+Relevance is judged from the labels by default. With --grader llm it is judged by the
+retrieval_grader, as in the graph, and every grade is counted as an LLM call. Rewrites need
+the question_rewriter, without --rewrite a first-pass miss is counted as a single loop.
+
+Usage:
+    python research/benchmark_hybrid_retrieval.py --questions labelled.jsonl [--k 4] [--grader labels|llm] [--rewrite] [--output report.json]
+
+The questions file holds one JSON object per line with a "question" key and a "relevant" list
+of chunk ids or text snippets found in the relevant chunks.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.retrievers.retriever import retriever
+
+
+def load_questions(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_relevant(document, labels):
+    content = document.page_content.lower()
+    return any(label == document.id or label.lower() in content for label in labels)
+
+
+def rank_metrics(documents, labels):
+    relevant_ranks = [rank for rank, d in enumerate(documents, start=1) if is_relevant(d, labels)]
+    found = {label for label in labels for d in documents if label == d.id or label.lower() in d.page_content.lower()}
+    return {
+        "recall": len(found) / len(labels) if labels else 0.0,
+        "reciprocal_rank": 1.0 / relevant_ranks[0] if relevant_ranks else 0.0,
+    }
+
+
+def run_loop(question, labels, search, grader, rewriter, max_attempts):
+    """
+    Replay the retrieval loop of the graph for one question.
+    """
+    query, llm_calls, loops, latencies = question, 0, 0, []
+    first_pass = None
+    for attempt in range(max_attempts + 1):
+        start = time.perf_counter()
+        documents = search.invoke(query)
+        latencies.append(time.perf_counter() - start)
+        if first_pass is None:
+            first_pass = rank_metrics(documents, labels)
+
+        if grader is not None:
+            grades = grader.batch([{"question": query, "document": d.page_content} for d in documents])
+            llm_calls += len(documents)
+            relevant = any((g.binary_score if hasattr(g, "binary_score") else g.get("binary_score")) == "yes" for g in grades)
+        else:
+            relevant = any(is_relevant(d, labels) for d in documents)
+
+        if relevant:
+            return {**first_pass, "hit": attempt == 0, "loops": loops, "llm_calls": llm_calls,
+                    "web_fallback": False, "retrieval_latency_s": latencies[0]}
+        if rewriter is None or attempt == max_attempts:
+            break
+        query = rewriter.invoke({"question": query})
+        llm_calls += 1
+        loops += 1
+
+    return {**first_pass, "hit": False, "loops": max(loops, 1), "llm_calls": llm_calls,
+            "web_fallback": rewriter is not None, "retrieval_latency_s": latencies[0]}
+
+
+def summarize(rows):
+    return {
+        "questions": len(rows),
+        "first_pass_hit_rate": sum(r["hit"] for r in rows) / len(rows) if rows else 0.0,
+        "recall_at_k": statistics.mean(r["recall"] for r in rows) if rows else 0.0,
+        "mrr": statistics.mean(r["reciprocal_rank"] for r in rows) if rows else 0.0,
+        "rewrite_loops": sum(r["loops"] for r in rows),
+        "llm_calls": sum(r["llm_calls"] for r in rows),
+        "web_search_fallbacks": sum(r["web_fallback"] for r in rows),
+        "retrieval_latency_p50_s": statistics.median(r["retrieval_latency_s"] for r in rows) if rows else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", required=True, help="JSONL file with {\"question\": ..., \"relevant\": [...]} per line")
+    parser.add_argument("--grader", choices=["labels", "llm"], default="labels")
+    parser.add_argument("--rewrite", action="store_true", help="rewrite missed questions with the question_rewriter")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--output", help="write the report and per-question rows to this JSON file")
+    args = parser.parse_args()
+
+    grader, rewriter = None, None
+    if args.grader == "llm":
+        from src.chains.retrieval_grader import retrieval_grader
+        grader = retrieval_grader().get_retrieval_grader()
+    if args.rewrite:
+        from src.chains.question_rewriter import question_rewriter
+        rewriter = question_rewriter().question_rewriter()
+
+    questions = load_questions(args.questions)
+    retrievers = {
+        "vector": retriever(hybrid=False).get_retriever(),
+        "hybrid": retriever(hybrid=True).get_retriever(),
+    }
+
+    report, rows = {}, {}
+    for name, search in retrievers.items():
+        rows[name] = [
+            {"question": q["question"], **run_loop(q["question"], q["relevant"], search, grader, rewriter, args.max_attempts)}
+            for q in questions
+        ]
+        report[name] = summarize(rows[name])
+    report["rewrite_loops_avoided"] = report["vector"]["rewrite_loops"] - report["hybrid"]["rewrite_loops"]
+    report["llm_calls_avoided"] = report["vector"]["llm_calls"] - report["hybrid"]["llm_calls"]
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": report, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Offline comparison of the local ANN index against Astra DB.
+
+For every question, the top k chunks are retrieved from both. The report gives the recall@k
+of the local index, taking the Astra DB results as ground truth, and the latency of each.
+
+Usage:
+    python research/evaluate_local_index.py [--questions questions.jsonl] [--k 4] [--output report.json]
+
+The questions file holds one JSON object per line with a "question" key. Without it, the
+labelled examples of the local router are used.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.retrievers.local_index import local_index
+from src.routing.embedding_router import LABELLED_EXAMPLES
+from src.vectorstores.astra_vectorstore import astra_vectorstore, DEFAULT_COLLECTION
+
+
+def load_questions(path):
+    if not path:
+        return [q for examples in LABELLED_EXAMPLES.values() for q in examples]
+    with open(path) as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
+
+
+def evaluate(questions, index, source, k):
+    rows = []
+    for question in questions:
+        # Both sides search with the same query vector, only the index differs
+        vector = index.embedder.embed_query(question)
+
+        start = time.perf_counter()
+        astra_ids = [d.id for d in source.similarity_search_by_vector(vector, k=k)]
+        astra_latency = time.perf_counter() - start
+
+        start = time.perf_counter()
+        local_ids = [d.id for d in index.similarity_search_by_vector(vector, k=k)]
+        local_latency = time.perf_counter() - start
+
+        rows.append({
+            "question": question,
+            "recall": len(set(astra_ids) & set(local_ids)) / len(astra_ids) if astra_ids else 1.0,
+            "astra_ids": astra_ids,
+            "local_ids": local_ids,
+            "astra_latency_s": astra_latency,
+            "local_latency_s": local_latency,
+        })
+    return rows
+
+
+def summarize(rows, k, staleness):
+    return {
+        "questions": len(rows),
+        "k": k,
+        f"recall_at_{k}": statistics.mean(r["recall"] for r in rows) if rows else 0.0,
+        "perfect_recall": sum(1 for r in rows if r["recall"] == 1.0),
+        "astra_latency_p50_s": statistics.median(r["astra_latency_s"] for r in rows) if rows else 0.0,
+        "local_latency_p50_s": statistics.median(r["local_latency_s"] for r in rows) if rows else 0.0,
+        "staleness": staleness,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="JSONL file with one {\"question\": ...} per line")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--output", help="write the report and per-question rows to this JSON file")
+    args = parser.parse_args()
+
+    source = astra_vectorstore(args.collection).get_vectorstore()
+    index = local_index(args.collection)
+    if not index.is_ready():
+        raise SystemExit("The local index is not built, run: python -m src.retrievers.local_index rebuild")
+
+    rows = evaluate(load_questions(args.questions), index, source, args.k)
+    report = summarize(rows, args.k, index.staleness(source))
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": report, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
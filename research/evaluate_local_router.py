@@ -0,0 +1,100 @@
+"""
+Offline evaluation of the local embedding router against the LLM question_router.
+
+For every question, both routers are timed. The report gives the share of questions the local
+router decides on its own, its agreement with the LLM router on those, and the latency saved
+by skipping the LLM call for them.
+
+Usage:
+    python research/evaluate_local_router.py [--questions questions.jsonl] [--output report.json]
+
+The questions file holds one JSON object per line with a "question" key. Without it, the
+labelled examples of the local router are used.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chains.question_router import question_router
+from src.routing.embedding_router import embedding_router, LABELLED_EXAMPLES
+
+
+def load_questions(path):
+    if not path:
+        return [q for examples in LABELLED_EXAMPLES.values() for q in examples]
+    with open(path) as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
+
+
+def evaluate(questions, local_router, llm_router):
+    # Build the centroids up front so their one-off cost is not counted per question
+    local_router._get_centroids()
+
+    rows = []
+    for question in questions:
+        start = time.perf_counter()
+        local_decision, margin = local_router.route(question)
+        local_latency = time.perf_counter() - start
+
+        start = time.perf_counter()
+        source = llm_router.invoke({"question": question})
+        llm_latency = time.perf_counter() - start
+        llm_decision = source.get("datasource", "vectorstore") if isinstance(source, dict) else source.datasource
+
+        rows.append({
+            "question": question,
+            "margin": margin,
+            "local": local_decision,
+            "llm": llm_decision,
+            "local_latency_s": local_latency,
+            "llm_latency_s": llm_latency,
+        })
+    return rows
+
+
+def summarize(rows):
+    decided = [r for r in rows if r["local"] is not None]
+    agreed = [r for r in decided if r["local"] == r["llm"]]
+    # Confident local decisions skip the LLM call, uncertain ones pay for both
+    saved = sum(r["llm_latency_s"] - r["local_latency_s"] for r in decided)
+    overhead = sum(r["local_latency_s"] for r in rows if r["local"] is None)
+    return {
+        "questions": len(rows),
+        "decided_locally": len(decided),
+        "fallback_to_llm": len(rows) - len(decided),
+        "coverage": len(decided) / len(rows) if rows else 0.0,
+        "agreement_on_decided": len(agreed) / len(decided) if decided else 0.0,
+        "disagreements": [r["question"] for r in decided if r["local"] != r["llm"]],
+        "local_latency_p50_s": statistics.median(r["local_latency_s"] for r in rows) if rows else 0.0,
+        "llm_latency_p50_s": statistics.median(r["llm_latency_s"] for r in rows) if rows else 0.0,
+        "total_latency_saved_s": saved - overhead,
+        "mean_latency_saved_per_question_s": (saved - overhead) / len(rows) if rows else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="JSONL file with one {\"question\": ...} per line")
+    parser.add_argument("--upper-margin", type=float, default=None)
+    parser.add_argument("--lower-margin", type=float, default=None)
+    parser.add_argument("--output", help="write the report and per-question rows to this JSON file")
+    args = parser.parse_args()
+
+    local_router = embedding_router(upper_margin=args.upper_margin, lower_margin=args.lower_margin)
+    llm_router = question_router().get_question_router()
+    rows = evaluate(load_questions(args.questions), local_router, llm_router)
+    report = summarize(rows)
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": report, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
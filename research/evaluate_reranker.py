@@ -0,0 +1,130 @@
+"""
+Offline evaluation of the local reranker against the LLM retrieval grader.
+
+record   - retrieve the documents of every question and grade them with the retrieval grader,
+           writing one {"question", "document", "llm_grade"} row per graded document
+evaluate - score the recorded rows with the reranker once, then for every (keep, drop)
+           threshold pair report the share of LLM grading calls avoided and how the documents
+           the reranker decides on its own agree with the LLM grades
+
+Usage:
+    python research/evaluate_reranker.py record [--questions questions.jsonl] --recorded grades.jsonl
+    python research/evaluate_reranker.py evaluate --recorded grades.jsonl [--method embedding|cross_encoder] [--output report.json]
+
+The questions file holds one JSON object per line with a "question" key. Without it, the
+labelled vectorstore examples of the local router are used.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.rerankers.reranker import reranker
+
+
+def load_questions(path):
+    if not path:
+        from src.routing.embedding_router import LABELLED_EXAMPLES
+        return list(LABELLED_EXAMPLES["vectorstore"])
+    with open(path) as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
+
+
+def load_recorded(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record(questions, path):
+    from src.retrievers.retriever import retriever
+    from src.chains.retrieval_grader import retrieval_grader
+
+    search = retriever().get_retriever()
+    grader = retrieval_grader().get_retrieval_grader()
+    rows = 0
+    with open(path, "w") as f:
+        for question in questions:
+            documents = search.invoke(question)
+            grades = grader.batch([{"question": question, "document": d.page_content} for d in documents])
+            for document, grade in zip(documents, grades):
+                llm_grade = grade.binary_score if hasattr(grade, "binary_score") else grade.get("binary_score", "no")
+                f.write(json.dumps({"question": question, "document": document.page_content, "llm_grade": llm_grade}) + "\n")
+                rows += 1
+    return rows
+
+
+def score_rows(rows, model):
+    # One vectorized pass per question, as in grade_documents
+    scores = np.zeros(len(rows), dtype=np.float32)
+    by_question = {}
+    for i, row in enumerate(rows):
+        by_question.setdefault(row["question"], []).append(i)
+    for question, indexes in by_question.items():
+        scores[indexes] = model.score(question, [rows[i]["document"] for i in indexes])
+    return scores
+
+
+def sweep(scores, llm_yes, keep_thresholds, drop_thresholds):
+    results = []
+    for keep in keep_thresholds:
+        for drop in drop_thresholds:
+            if drop > keep:
+                continue
+            kept, dropped = scores >= keep, scores < drop
+            decided = kept | dropped
+            agreed = (kept & llm_yes) | (dropped & ~llm_yes)
+            results.append({
+                "keep_threshold": round(float(keep), 4),
+                "drop_threshold": round(float(drop), 4),
+                "llm_calls_avoided": float(decided.mean()) if len(scores) else 0.0,
+                "agreement_on_decided": float(agreed.sum() / decided.sum()) if decided.any() else None,
+                # Relevant documents lost without the LLM ever seeing them
+                "false_drops": int((dropped & llm_yes).sum()),
+                "false_keeps": int((kept & ~llm_yes).sum()),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["record", "evaluate"])
+    parser.add_argument("--questions", help="JSONL file with one {\"question\": ...} per line")
+    parser.add_argument("--recorded", required=True, help="JSONL file of recorded LLM grades")
+    parser.add_argument("--method", choices=["embedding", "cross_encoder"], default=None)
+    parser.add_argument("--min-agreement", type=float, default=0.95,
+                        help="agreement required to recommend a threshold pair")
+    parser.add_argument("--output", help="write the full sweep to this JSON file")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        print(json.dumps({"recorded": record(load_questions(args.questions), args.recorded)}, indent=2))
+        return
+
+    rows = load_recorded(args.recorded)
+    model = reranker(method=args.method)
+    scores = score_rows(rows, model)
+    llm_yes = np.array([row["llm_grade"] == "yes" for row in rows])
+
+    grid = np.unique(np.quantile(scores, np.linspace(0, 1, 21))) if len(scores) else np.array([])
+    results = sweep(scores, llm_yes, grid, grid)
+    acceptable = [r for r in results if r["agreement_on_decided"] is not None and r["agreement_on_decided"] >= args.min_agreement]
+    report = {
+        "method": model.method,
+        "documents": len(rows),
+        "llm_yes_rate": float(llm_yes.mean()) if len(rows) else 0.0,
+        "configured": sweep(scores, llm_yes, [model.keep_threshold], [model.drop_threshold])[0] if len(rows) else None,
+        "recommended": max(acceptable, key=lambda r: r["llm_calls_avoided"]) if acceptable else None,
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": report, "sweep": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
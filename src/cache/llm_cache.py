@@ -0,0 +1,243 @@
+from collections import OrderedDict
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+import threading
+import hashlib
+import sqlite3
+import time
+import re
+import os
+
+LLM_CACHE_BACKENDS = ("memory", "sqlite")
+
+# Whitespace, raw or JSON escaped inside the serialized prompt
+WHITESPACE_PATTERN = re.compile(r"(?:\s|\\[nrt])+")
+# generation_info flag of the generations a lookup returns
+FROM_CACHE = "from_cache"
+
+
+def served_from_cache(result):
+    """
+    True when every generation of an LLMResult came from an llm_response_cache.
+    """
+    generations = [g for batch in result.generations for g in batch]
+    return bool(generations) and all((g.generation_info or {}).get(FROM_CACHE) for g in generations)
+
+
+class memory_llm_store:
+    """
+    a class to represent an in-memory LRU store of LLM responses, lost on restart
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = int(max_entries or os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+
+    def get(self, key, ttl_seconds):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if time.time() - created_at > ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+
+    def set(self, key, namespace, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def count(self):
+        with self._lock:
+            return len(self._entries)
+
+
+    def close(self):
+        pass
+
+
+
+class sqlite_llm_store:
+    """
+    a class to represent a SQLite store of LLM responses shared by every process on the host
+
+    Expired rows are skipped on read and deleted, the least recently created rows go once
+    `max_entries` is exceeded.
+    """
+
+    def __init__(self, path=None, max_entries=None):
+        self.path = path or os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+        self.max_entries = int(max_entries or os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_by_created_at ON responses (created_at);
+        """)
+        self.evictions = 0
+
+
+    def get(self, key, ttl_seconds):
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if time.time() - created_at > ttl_seconds:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            return value
+
+
+    def set(self, key, namespace, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, namespace, value, created_at) VALUES (?, ?, ?, ?)",
+                (key, namespace, value, time.time())
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created_at LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+
+class llm_response_cache(BaseCache):
+    """
+    a class to represent the LLM response cache of one chain
+
+    Plugged into a chat model as its `cache`. The key is the sha256 of the model parameters
+    (model name, temperature, ...) and the prompt with its whitespace collapsed, so only
+    deterministic models should use it. Entries older than `ttl_seconds` are misses.
+    """
+
+    def __init__(self, namespace, store, ttl_seconds=None):
+        self.namespace = namespace
+        self.store = store
+        self.ttl_seconds = float(ttl_seconds or os.getenv("LLM_CACHE_TTL_SECONDS", 86400))
+        self.hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        normalized = WHITESPACE_PATTERN.sub(" ", prompt).strip()
+        return hashlib.sha256(f"{llm_string}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+    def lookup(self, prompt, llm_string):
+        value = self.store.get(self._key(prompt, llm_string), self.ttl_seconds)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        generations = loads(value)
+        # Flagged for the callbacks, which see a cache hit as an LLM call otherwise
+        for generation in generations:
+            generation.generation_info = {**(generation.generation_info or {}), FROM_CACHE: True}
+        return generations
+
+
+    def update(self, prompt, llm_string, return_val):
+        self.store.set(self._key(prompt, llm_string), self.namespace, dumps(list(return_val)))
+
+
+    def clear(self, **kwargs):
+        self.store.clear()
+
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+
+# The response cache of each chain is registered under this prefix and its namespace
+LLM_CACHE_KEY_PREFIX = "llm_cache:chain:"
+
+
+def _enabled(name, default):
+    return os.getenv(name, default).lower() in ["true", "yes", "1"]
+
+
+def _create_store():
+    backend = os.getenv("LLM_CACHE_BACKEND", "sqlite")
+    if backend not in LLM_CACHE_BACKENDS:
+        raise ValueError(f"Unknown LLM_CACHE_BACKEND {backend}, expected one of {LLM_CACHE_BACKENDS}")
+    return sqlite_llm_store() if backend == "sqlite" else memory_llm_store()
+
+
+def get_llm_cache(namespace):
+    """
+    Return the response cache of a chain, or None when LLM_CACHE_ENABLED or
+    LLM_CACHE_<CHAIN>_ENABLED is false. Every chain shares the process wide store, its TTL
+    comes from LLM_CACHE_<CHAIN>_TTL_SECONDS, then LLM_CACHE_TTL_SECONDS.
+    """
+    load_dotenv()
+    prefix = f"LLM_CACHE_{namespace.upper()}"
+    if not _enabled("LLM_CACHE_ENABLED", "true") or not _enabled(f"{prefix}_ENABLED", "true"):
+        return None
+    return get_registry().get_or_create(f"{LLM_CACHE_KEY_PREFIX}{namespace}", lambda: llm_response_cache(
+        namespace, get_registry().get_or_create("llm_cache:store", _create_store), os.getenv(f"{prefix}_TTL_SECONDS")
+    ))
+
+
+def llm_cache_stats():
+    """
+    Hit and miss counts per chain and the size of the shared store.
+    """
+    caches = {key[len(LLM_CACHE_KEY_PREFIX):]: cache for key, cache in get_registry().items(LLM_CACHE_KEY_PREFIX)}
+    if not caches:
+        return {"entries": 0, "chains": {}}
+    store = next(iter(caches.values())).store
+    return {
+        "entries": store.count(),
+        "evictions": store.evictions,
+        "chains": {namespace: cache.stats() for namespace, cache in caches.items()},
+    }
@@ -0,0 +1,305 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from src.embedding.embedding import embedding
+from src.registry.resource_registry import get_registry
+import numpy as np
+import threading
+import asyncio
+import logging
+import sqlite3
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class cache_generations:
+    """
+    a class to represent the generation counters of the semantic caches, shared by the workers
+
+    Every write to the collection of a tenant bumps its generation. A cache drops its answers
+    when it sees a newer generation, and an answer is only stored under the generation its run
+    started with, so no worker serves or stores answers older than the content they read.
+
+    Args:
+        url: a redis:// URL shares the counters between hosts, anything else is the path of a
+            SQLite file shared by the workers of one host. Defaults to the
+            SEMANTIC_CACHE_GENERATIONS_URL environment variable, then the checkpointer Redis with
+            CHECKPOINTER_BACKEND=redis, then .semantic_cache.sqlite.
+    """
+
+    def __init__(self, url=None):
+        load_dotenv()
+        default = os.getenv("CHECKPOINTER_URL") if os.getenv("CHECKPOINTER_BACKEND", "memory").lower() == "redis" else None
+        self.url = url or os.getenv("SEMANTIC_CACHE_GENERATIONS_URL") or default or ".semantic_cache.sqlite"
+        self._lock = threading.Lock()
+        if self.url.startswith(("redis://", "rediss://")):
+            import redis
+            self._redis = redis.Redis.from_url(self.url)
+            self._conn = None
+        else:
+            self._redis = None
+            self._conn = sqlite3.connect(self.url, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS generations (tenant TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+
+
+    @staticmethod
+    def _key(tenant):
+        return f"semantic_cache:generation:{tenant or ''}"
+
+
+    def get(self, tenant=None):
+        if self._redis is not None:
+            return int(self._redis.get(self._key(tenant)) or 0)
+        with self._lock:
+            row = self._conn.execute("SELECT generation FROM generations WHERE tenant = ?", (tenant or "",)).fetchone()
+        return row[0] if row else 0
+
+
+    def bump(self, tenant=None):
+        """
+        Advance the generation of a tenant and return the new one.
+        """
+        if self._redis is not None:
+            return int(self._redis.incr(self._key(tenant)))
+        with self._lock:
+            return self._conn.execute(
+                "INSERT INTO generations (tenant, generation) VALUES (?, 1) "
+                "ON CONFLICT(tenant) DO UPDATE SET generation = generation + 1 RETURNING generation",
+                (tenant or "",)
+            ).fetchone()[0]
+
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+        if self._redis is not None:
+            self._redis.close()
+
+
+def get_cache_generations():
+    """
+    Return the process wide handle on the semantic cache generations.
+    """
+    return get_registry().get_or_create("semantic_cache:generations", cache_generations)
+
+
+
+class semantic_cache:
+    """
+    a class to represent a semantic cache of accepted answers
+
+    Questions are embedded with the shared embedding model and compared by cosine similarity
+    against the questions of previously accepted answers. A lookup hits when the nearest
+    neighbour is at least `similarity_threshold` similar and younger than `ttl_seconds`.
+    The least recently used entry is evicted once `max_entries` is reached. Entries belong to
+    the cache_generations generation of the tenant and are dropped once it moves on.
+    """
+
+    def __init__(self, embedder=None, similarity_threshold=None, ttl_seconds=None, max_entries=None, tenant=None, generations=None):
+        load_dotenv()
+        self.embedder = embedder or embedding().get_embedding()
+        self.tenant = tenant
+        self.generations = generations or get_cache_generations()
+        self._generation = None
+        self.similarity_threshold = float(similarity_threshold or os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+        self.ttl_seconds = float(ttl_seconds or os.getenv("SEMANTIC_CACHE_TTL_SECONDS", 3600))
+        self.max_entries = int(max_entries or os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 1000))
+
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Last time get_semantic_cache handed the cache out, the least recent tenants are dropped
+        self.used_at = time.monotonic()
+
+
+    def _embed(self, question):
+        vector = np.asarray(self.embedder.embed_query(question.strip()), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+    def _evict_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+
+    def _sync(self, generation):
+        # Called with the lock held, answers of an older generation were read from older content
+        if generation != self._generation:
+            self._entries.clear()
+            self._matrix = None
+            self._generation = generation
+
+
+    def _index(self):
+        # Stack the entry vectors once per change so a lookup is a single matrix-vector product
+        if self._matrix is None:
+            self._keys = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[k]["vector"] for k in self._keys]) if self._keys else None
+        return self._keys, self._matrix
+
+
+    def lookup(self, question):
+        """
+        Return the cached answer for the nearest accepted question, or None on a miss.
+
+        Returns:
+            dict: generation, sources, source_type and similarity of the cached answer
+        """
+        vector = self._embed(question)
+        generation = self.generations.get(self.tenant)
+        with self._lock:
+            self._sync(generation)
+            self._evict_expired(time.time())
+            keys, matrix = self._index()
+            if matrix is None:
+                self.misses += 1
+                return None
+
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            key = keys[best]
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+            self.hits += 1
+            return {
+                "generation": entry["generation"],
+                "sources": list(entry["sources"]),
+                "source_type": entry["source_type"],
+                "similarity": similarity,
+            }
+
+
+    def current_generation(self):
+        """
+        Return the current generation of the tenant, to be passed to store by the run it starts.
+        """
+        return self.generations.get(self.tenant)
+
+
+    def store(self, question, generation, sources=None, source_type=None, cache_generation=None):
+        """
+        Add an accepted answer to the cache. With cache_generation, the generation read when its
+        run started, the answer is dropped when the collection was written to since.
+
+        Returns:
+            bool: whether the answer was stored
+        """
+        if not generation:
+            return False
+        current = self.generations.get(self.tenant)
+        if cache_generation is not None and cache_generation != current:
+            logger.info("---ANSWER NOT CACHED, THE COLLECTION CHANGED DURING ITS RUN---")
+            return False
+        vector = self._embed(question)
+        with self._lock:
+            self._sync(current)
+            self._entries[self._next_key] = {
+                "vector": vector,
+                "generation": generation,
+                "sources": list(sources or []),
+                "source_type": source_type,
+                "created_at": time.time(),
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+        return True
+
+
+    async def alookup(self, question):
+        # Embedding is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self.lookup, question)
+
+
+    async def astore(self, question, generation, sources=None, source_type=None, cache_generation=None):
+        return await asyncio.to_thread(self.store, question, generation, sources, source_type, cache_generation)
+
+
+    async def acurrent_generation(self):
+        return await asyncio.to_thread(self.current_generation)
+
+
+    def invalidate(self):
+        """
+        Drop every cached answer of this process, see invalidate_semantic_cache for every worker.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+    @staticmethod
+    def sources_from_documents(documents):
+        """
+        Extract the text of the source documents of a graph result, which may be a list of
+        documents or a single web search document.
+        """
+        if not documents:
+            return []
+        if not isinstance(documents, list):
+            documents = [documents]
+        return [d.page_content if hasattr(d, "page_content") else str(d) for d in documents]
+
+
+
+# One cache per tenant, registered under this prefix and the tenant, empty for the shared
+# collection, answers never cross tenants
+SEMANTIC_CACHE_KEY_PREFIX = "semantic_cache:tenant:"
+
+
+def get_semantic_cache(tenant=None):
+    """
+    Return the semantic cache of a tenant, or None when SEMANTIC_CACHE_ENABLED is false. The
+    caches of the SEMANTIC_CACHE_MAX_TENANTS (default 64) most recent tenants are kept.
+    """
+    load_dotenv()
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() not in ["true", "yes", "1"]:
+        return None
+    registry = get_registry()
+    cache = registry.get_or_create(f"{SEMANTIC_CACHE_KEY_PREFIX}{tenant or ''}", lambda: semantic_cache(tenant=tenant))
+    cache.used_at = time.monotonic()
+    caches = registry.items(SEMANTIC_CACHE_KEY_PREFIX)
+    # The least recently used tenants beyond the bound are dropped
+    for key, _ in sorted(caches, key=lambda item: getattr(item[1], "used_at", 0.0))[:max(0, len(caches) - int(os.getenv("SEMANTIC_CACHE_MAX_TENANTS", 64)))]:
+        registry.remove(key)
+    return cache
+
+
+def invalidate_semantic_cache(tenant=None):
+    """
+    Invalidate the semantic cache of a tenant in every worker, called whenever new content is
+    written to its collection. The embedding model is not loaded for it.
+
+    Returns:
+        int: the new generation of the tenant, None when the semantic cache is disabled
+    """
+    load_dotenv()
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() not in ["true", "yes", "1"]:
+        return None
+    generation = get_cache_generations().bump(tenant)
+    cache = dict(get_registry().items(SEMANTIC_CACHE_KEY_PREFIX)).get(f"{SEMANTIC_CACHE_KEY_PREFIX}{tenant or ''}")
+    if cache is not None:
+        cache.invalidate()
+    return generation
@@ -5,7 +5,7 @@ from langchain_core.output_parsers import StrOutputParser
 
 class answer_grader: 
     def __init__(self): 
-        self.llm = groqllm().get_llm()
+        self.llm = groqllm().get_llm(cache_namespace="answer_grader")
 
     def get_answer_grader(self):
         try: 
@@ -0,0 +1,39 @@
+from langchain.prompts import ChatPromptTemplate
+from src.llms.groqllm import groqllm
+
+
+
+class generation_grader:
+    """
+    a class to represent a grader that checks grounding and usefulness of a generation in a single call
+    """
+
+    def __init__(self):
+        self.llm = groqllm().get_llm(cache_namespace="generation_grader")
+
+
+    def get_generation_grader(self):
+        try :
+            system = """You are a grader assessing an LLM generation against a set of retrieved facts and a user question.
+
+            You must respond with ONLY a JSON object in this exact format:
+            {{"grounded": "yes", "answers_question": "yes"}}
+
+            Rules:
+            - "grounded" is "yes" when the generation is grounded in and supported by the provided facts, "no" when it contains information not supported by the facts
+            - "answers_question" is "yes" when the generation addresses and answers the user question, "no" otherwise
+            - Each score is either "yes" or "no"
+            - Respond with ONLY the JSON object, nothing else"""
+
+            grade_prompt = ChatPromptTemplate.from_messages([
+                ("system", system),
+                ("human", "Set of facts: \n\n {documents} \n\n User question: {question} \n\n LLM generation: {generation}\n\nResponse (JSON only):"),
+            ])
+
+            from langchain_core.output_parsers import JsonOutputParser
+            json_parser = JsonOutputParser()
+
+            generation_grader = grade_prompt | self.llm | json_parser
+            return generation_grader
+        except Exception as e:
+            raise ValueError(f"Error occurred with exception : {e}")
@@ -4,7 +4,7 @@ from langchain_core.output_parsers import StrOutputParser
 
 class GradeHallucinations(): 
     def __init__(self): 
-        self.llm = groqllm().get_llm()
+        self.llm = groqllm().get_llm(cache_namespace="hallucination_grader")
 
     def get_hallucination_grader(self):
         try: 
@@ -0,0 +1,52 @@
+from langchain.prompts import ChatPromptTemplate
+from src.llms.groqllm import groqllm
+
+
+
+class multi_document_grader:
+    """
+    a class to represent a grader that scores every retrieved document in a single call
+    """
+
+    def __init__(self):
+        self.llm = groqllm().get_llm(cache_namespace="multi_document_grader")
+
+
+    @staticmethod
+    def format_documents(documents):
+        """
+        Number the documents so the grader can answer with one score per document, in order.
+        """
+        return "\n\n".join(
+            f"Document {i}:\n{d.page_content if hasattr(d, 'page_content') else str(d)}"
+            for i, d in enumerate(documents, start=1)
+        )
+
+
+    def get_multi_document_grader(self):
+        try :
+            system = """You are a grader assessing relevance of several retrieved documents to a user question.
+
+            You must respond with ONLY a JSON object in this exact format:
+            {{"scores": ["yes", "no", ...]}}
+
+            Rules:
+            - Return exactly one score per document, in the same order as the documents are numbered
+            - If a document contains keywords or semantic meaning related to the user question, grade it as "yes"
+            - It does not need to be a stringent test. The goal is to filter out completely irrelevant retrievals
+            - "yes" means the document is relevant to the question
+            - "no" means the document is not relevant to the question
+            - Respond with ONLY the JSON object, nothing else"""
+
+            grade_prompt = ChatPromptTemplate.from_messages([
+                ("system", system),
+                ("human", "Number of documents: {count}\n\nRetrieved documents: \n\n {documents} \n\n User question: {question}\n\nResponse (JSON only):"),
+            ])
+
+            from langchain_core.output_parsers import JsonOutputParser
+            json_parser = JsonOutputParser()
+
+            multi_document_grader = grade_prompt | self.llm | json_parser
+            return multi_document_grader
+        except Exception as e:
+            raise ValueError(f"Error occurred with exception : {e}")
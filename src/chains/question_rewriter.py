@@ -7,7 +7,7 @@ class question_rewriter:
 
 
     def __init__(self): 
-        self.llm = groqllm().get_llm()
+        self.llm = groqllm().get_llm(cache_namespace="question_rewriter")
 
     def question_rewriter(self): 
         try: 
@@ -8,7 +8,7 @@ from src.llms.groqllm import groqllm
 
 class question_router: 
     def __init__(self):
-        self.llm = groqllm().get_llm()
+        self.llm = groqllm().get_llm(cache_namespace="question_router")
 
     def get_question_router(self): 
         try :
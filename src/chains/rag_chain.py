@@ -4,7 +4,7 @@ from src.llms.groqllm import groqllm
 
 class rag_chain: 
     def __init__(self):
-        self.llm = groqllm().get_llm()
+        self.llm = groqllm().get_llm(chain="rag")
         
 
     def get_rag_chain(self ):
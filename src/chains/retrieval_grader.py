@@ -11,7 +11,7 @@ class retrieval_grader:
     """
 
     def __init__(self):
-        self.llm = groqllm().get_llm()
+        self.llm = groqllm().get_llm(cache_namespace="retrieval_grader")
         
         
 
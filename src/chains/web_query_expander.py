@@ -0,0 +1,39 @@
+from langchain.prompts import ChatPromptTemplate
+from src.llms.groqllm import groqllm
+
+
+
+class web_query_expander:
+    """
+    a class to represent the chain writing alternative web search queries for a question
+    """
+
+    def __init__(self):
+        self.llm = groqllm().get_llm(cache_namespace="web_query_expander")
+
+
+    def get_web_query_expander(self):
+        try :
+            system = """You write alternative web search queries for a user question.
+
+            You must respond with ONLY a JSON object in this exact format:
+            {{"queries": ["first query", "second query", ...]}}
+
+            Rules:
+            - Write exactly the requested number of queries
+            - Each query rephrases the question or targets a different aspect of it, as a short search engine query
+            - Do not repeat the original question
+            - Respond with ONLY the JSON object, nothing else"""
+
+            expand_prompt = ChatPromptTemplate.from_messages([
+                ("system", system),
+                ("human", "Number of queries: {count}\n\nUser question: {question}\n\nResponse (JSON only):"),
+            ])
+
+            from langchain_core.output_parsers import JsonOutputParser
+            json_parser = JsonOutputParser()
+
+            web_query_expander = expand_prompt | self.llm | json_parser
+            return web_query_expander
+        except Exception as e:
+            raise ValueError(f"Error occurred with exception : {e}")
@@ -0,0 +1,353 @@
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.base.id import UUID as checkpoint_uuid
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+import logging
+import asyncio
+import sqlite3
+import zlib
+import os
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTER_BACKENDS = ("memory", "sqlite", "postgres", "redis")
+
+
+class compact_serializer(SerializerProtocol):
+    """
+    a class to represent a checkpoint serializer that compresses large payloads
+
+    Documents are chunk references since the chunk store, what is left large is the generation
+    and the per chunk grades, keyed by hex digests that compress well. Blobs above `threshold`
+    bytes are zlib compressed and tagged with a "+zlib" type suffix, small ones are kept as is.
+    """
+
+    def __init__(self, base=None, threshold=1024, level=6):
+        self.base = base or JsonPlusSerializer()
+        self.threshold = threshold
+        self.level = level
+
+    def dumps_typed(self, obj):
+        type_, data = self.base.dumps_typed(obj)
+        if isinstance(data, bytes) and len(data) >= self.threshold:
+            compressed = zlib.compress(data, self.level)
+            if len(compressed) < len(data):
+                return f"{type_}+zlib", compressed
+        return type_, data
+
+    def loads_typed(self, data):
+        type_, payload = data
+        if type_.endswith("+zlib"):
+            return self.base.loads_typed((type_[:-len("+zlib")], zlib.decompress(payload)))
+        return self.base.loads_typed((type_, payload))
+
+    # Untyped helpers kept for savers that still call them
+    def dumps(self, obj):
+        return self.base.dumps(obj)
+
+    def loads(self, data):
+        return self.base.loads(data)
+
+
+
+class checkpointer:
+    """
+    a class to represent the checkpointer backend of the compiled graph
+
+    The backend is selected with CHECKPOINTER_BACKEND:
+        memory   - in-process MemorySaver, lost on restart (default)
+        sqlite   - SQLite file in WAL mode at CHECKPOINTER_URL, shared by the workers of one host
+        postgres - Postgres database at CHECKPOINTER_URL, shared by workers on any host
+        redis    - Redis at CHECKPOINTER_URL, shared by workers on any host
+
+    Finished threads older than CHECKPOINT_TTL_SECONDS and interrupted threads older than
+    CHECKPOINT_INTERRUPTED_TTL_SECONDS are deleted by the pruner.
+    """
+
+    def __init__(self, backend=None, url=None):
+        load_dotenv()
+        self.backend = (backend or os.getenv("CHECKPOINTER_BACKEND", "memory")).lower()
+        if self.backend not in CHECKPOINTER_BACKENDS:
+            raise ValueError(f"Unknown checkpointer backend : {self.backend}, expected one of {CHECKPOINTER_BACKENDS}")
+        self.url = url or os.getenv("CHECKPOINTER_URL", ".checkpoints.sqlite" if self.backend == "sqlite" else None)
+        if self.backend in ("postgres", "redis") and not self.url:
+            raise ValueError(f"CHECKPOINTER_URL must be set for the {self.backend} checkpointer backend")
+
+        self.ttl_seconds = float(os.getenv("CHECKPOINT_TTL_SECONDS", 24 * 3600))
+        self.interrupted_ttl_seconds = float(os.getenv("CHECKPOINT_INTERRUPTED_TTL_SECONDS", 7 * 24 * 3600))
+        self.prune_interval_seconds = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL_SECONDS", 600))
+        self.serde = compact_serializer()
+        self._resources = []
+
+
+    @staticmethod
+    def _missing(package, backend):
+        return ValueError(f"The {backend} checkpointer backend requires the {package} package, install it with: pip install {package}")
+
+
+    def get_checkpointer(self):
+        """
+        Return a checkpointer for a graph run with invoke / stream.
+        """
+        if self.backend == "memory":
+            return MemorySaver(serde=self.serde)
+
+        if self.backend == "sqlite":
+            try:
+                from langgraph.checkpoint.sqlite import SqliteSaver
+            except ImportError:
+                raise self._missing("langgraph-checkpoint-sqlite", self.backend)
+            conn = sqlite3.connect(self.url, check_same_thread=False)
+            # WAL lets the workers of the host read while one of them writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._resources.append(conn)
+            return SqliteSaver(conn, serde=self.serde)
+
+        if self.backend == "postgres":
+            try:
+                from langgraph.checkpoint.postgres import PostgresSaver
+                from psycopg_pool import ConnectionPool
+                from psycopg.rows import dict_row
+            except ImportError:
+                raise self._missing("langgraph-checkpoint-postgres", self.backend)
+            pool = ConnectionPool(self.url, kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row})
+            self._resources.append(pool)
+            saver = PostgresSaver(pool, serde=self.serde)
+            saver.setup()
+            return saver
+
+        try:
+            from langgraph.checkpoint.redis import RedisSaver
+        except ImportError:
+            raise self._missing("langgraph-checkpoint-redis", self.backend)
+        saver = RedisSaver(redis_url=self.url, ttl=self._redis_ttl())
+        saver.setup()
+        return saver
+
+
+    async def aget_checkpointer(self):
+        """
+        Return a checkpointer for a graph run with ainvoke / astream.
+        """
+        if self.backend == "memory":
+            return MemorySaver(serde=self.serde)
+
+        if self.backend == "sqlite":
+            try:
+                from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+                import aiosqlite
+            except ImportError:
+                raise self._missing("langgraph-checkpoint-sqlite", self.backend)
+            conn = await aiosqlite.connect(self.url)
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+            self._resources.append(conn)
+            return AsyncSqliteSaver(conn, serde=self.serde)
+
+        if self.backend == "postgres":
+            try:
+                from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+                from psycopg_pool import AsyncConnectionPool
+                from psycopg.rows import dict_row
+            except ImportError:
+                raise self._missing("langgraph-checkpoint-postgres", self.backend)
+            pool = AsyncConnectionPool(self.url, open=False, kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row})
+            await pool.open()
+            self._resources.append(pool)
+            saver = AsyncPostgresSaver(pool, serde=self.serde)
+            await saver.setup()
+            return saver
+
+        try:
+            from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+        except ImportError:
+            raise self._missing("langgraph-checkpoint-redis", self.backend)
+        saver = AsyncRedisSaver(redis_url=self.url, ttl=self._redis_ttl())
+        await saver.asetup()
+        return saver
+
+
+    def _redis_ttl(self):
+        # Redis expires keys on its own, the TTL is given in minutes and refreshed on reads
+        return {"default_ttl": max(self.ttl_seconds, self.interrupted_ttl_seconds) / 60, "refresh_on_read": True}
+
+
+    # Latest root checkpoint of every thread, checkpoint ids are uuid6 and sort by time
+    LATEST_CHECKPOINTS = "SELECT thread_id, MAX(checkpoint_id) AS checkpoint_id FROM checkpoints WHERE checkpoint_ns = '' GROUP BY thread_id"
+    PRUNER_TABLE = "CREATE TABLE IF NOT EXISTS checkpoint_pruner (name TEXT PRIMARY KEY, last_run DOUBLE PRECISION NOT NULL)"
+    PRUNER_ROW = "INSERT INTO checkpoint_pruner (name, last_run) VALUES ('prune', 0) ON CONFLICT (name) DO NOTHING"
+    PRUNER_CLAIM = "UPDATE checkpoint_pruner SET last_run = {p} WHERE name = 'prune' AND last_run <= {p}"
+
+
+    @staticmethod
+    def _checkpoint_time(checkpoint_id):
+        # The uuid6 timestamp counts 100ns intervals since 1582-10-15
+        return datetime.fromtimestamp((checkpoint_uuid(checkpoint_id).time - 0x01B21DD213814000) / 1e7, timezone.utc)
+
+
+    def _expired(self, age, finished):
+        return age > (self.ttl_seconds if finished else self.interrupted_ttl_seconds)
+
+
+    def _candidates(self, latest, now):
+        """
+        Yield the threads old enough to be pruned with their age, and whether their state must
+        be read to know if they finished, which only matters between the two TTLs.
+        """
+        for thread_id, checkpoint_id in latest.items():
+            age = (now - self._checkpoint_time(checkpoint_id)).total_seconds()
+            if age <= min(self.ttl_seconds, self.interrupted_ttl_seconds):
+                continue
+            yield thread_id, age, age <= max(self.ttl_seconds, self.interrupted_ttl_seconds)
+
+
+    def _claim_params(self):
+        # A little slack so a worker whose timer fires early still takes its turn
+        now = datetime.now(timezone.utc).timestamp()
+        return now, now - 0.9 * self.prune_interval_seconds
+
+
+    async def _aclaim(self, saver):
+        """
+        Return whether this worker prunes this interval. Workers sharing a SQLite or Postgres
+        checkpointer take turns through a row of the checkpoint_pruner table.
+        """
+        now, before = self._claim_params()
+        if self.backend == "sqlite":
+            await saver.setup()
+            async with saver.lock:
+                await saver.conn.execute(self.PRUNER_TABLE)
+                await saver.conn.execute(self.PRUNER_ROW)
+                cursor = await saver.conn.execute(self.PRUNER_CLAIM.format(p="?"), (now, before))
+                await saver.conn.commit()
+                return cursor.rowcount == 1
+        if self.backend == "postgres":
+            async with saver.conn.connection() as conn:
+                await conn.execute(self.PRUNER_TABLE)
+                await conn.execute(self.PRUNER_ROW)
+                cursor = await conn.execute(self.PRUNER_CLAIM.format(p="%s"), (now, before))
+                return cursor.rowcount == 1
+        # The memory checkpointer belongs to this worker alone
+        return True
+
+
+    def _claim(self, saver):
+        """
+        Sync counterpart of _aclaim.
+        """
+        now, before = self._claim_params()
+        if self.backend == "sqlite":
+            saver.setup()
+            with saver.lock, saver.conn:
+                saver.conn.execute(self.PRUNER_TABLE)
+                saver.conn.execute(self.PRUNER_ROW)
+                return saver.conn.execute(self.PRUNER_CLAIM.format(p="?"), (now, before)).rowcount == 1
+        if self.backend == "postgres":
+            with saver.conn.connection() as conn:
+                conn.execute(self.PRUNER_TABLE)
+                conn.execute(self.PRUNER_ROW)
+                return conn.execute(self.PRUNER_CLAIM.format(p="%s"), (now, before)).rowcount == 1
+        return True
+
+
+    async def _alatest_checkpoints(self, saver):
+        """
+        Return the id of the latest root checkpoint of every thread, one query per prune.
+        """
+        if self.backend == "sqlite":
+            async with saver.lock:
+                cursor = await saver.conn.execute(self.LATEST_CHECKPOINTS)
+                return {thread_id: checkpoint_id for thread_id, checkpoint_id in await cursor.fetchall()}
+        if self.backend == "postgres":
+            async with saver.conn.connection() as conn:
+                cursor = await conn.execute(self.LATEST_CHECKPOINTS)
+                return {row["thread_id"]: row["checkpoint_id"] for row in await cursor.fetchall()}
+        return self._memory_latest_checkpoints(saver)
+
+
+    def _latest_checkpoints(self, saver):
+        """
+        Sync counterpart of _alatest_checkpoints.
+        """
+        if self.backend == "sqlite":
+            with saver.lock:
+                return dict(saver.conn.execute(self.LATEST_CHECKPOINTS).fetchall())
+        if self.backend == "postgres":
+            with saver.conn.connection() as conn:
+                return {row["thread_id"]: row["checkpoint_id"] for row in conn.execute(self.LATEST_CHECKPOINTS).fetchall()}
+        return self._memory_latest_checkpoints(saver)
+
+
+    @staticmethod
+    def _memory_latest_checkpoints(saver):
+        return {thread_id: max(namespaces[""]) for thread_id, namespaces in list(saver.storage.items()) if namespaces.get("")}
+
+
+    async def aprune(self, compiled_graph):
+        """
+        Delete the threads whose last checkpoint is older than their TTL. Only the worker that
+        claims the interval prunes.
+
+        Returns:
+            int: number of deleted threads
+        """
+        saver = compiled_graph.checkpointer
+        if not await self._aclaim(saver):
+            return 0
+
+        now = datetime.now(timezone.utc)
+        deleted = 0
+        for thread_id, age, needs_state in self._candidates(await self._alatest_checkpoints(saver), now):
+            if needs_state:
+                # Threads waiting at human_in_the_loop still have a next node
+                state = await compiled_graph.aget_state({"configurable": {"thread_id": thread_id}})
+                if not self._expired(age, not state.next):
+                    continue
+            await saver.adelete_thread(thread_id)
+            deleted += 1
+        return deleted
+
+
+    def prune(self, compiled_graph):
+        """
+        Sync counterpart of aprune.
+        """
+        saver = compiled_graph.checkpointer
+        if not self._claim(saver):
+            return 0
+
+        now = datetime.now(timezone.utc)
+        deleted = 0
+        for thread_id, age, needs_state in self._candidates(self._latest_checkpoints(saver), now):
+            if needs_state and not self._expired(age, not compiled_graph.get_state({"configurable": {"thread_id": thread_id}}).next):
+                continue
+            saver.delete_thread(thread_id)
+            deleted += 1
+        return deleted
+
+
+    async def arun_pruner(self, compiled_graph):
+        """
+        Prune expired threads every CHECKPOINT_PRUNE_INTERVAL_SECONDS until cancelled.
+        """
+        if self.backend == "redis":
+            return
+        while True:
+            await asyncio.sleep(self.prune_interval_seconds)
+            try:
+                deleted = await self.aprune(compiled_graph)
+                if deleted:
+                    logger.info(f"Pruned {deleted} expired graph threads")
+            except Exception as e:
+                logger.error(f"Checkpoint pruning failed: {e}")
+
+
+    async def aclose(self):
+        for resource in self._resources:
+            result = resource.close()
+            if asyncio.iscoroutine(result):
+                await result
+        self._resources.clear()
@@ -1,5 +1,287 @@
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from src.registry.resource_registry import get_registry
+from contextlib import contextmanager
 from dotenv import load_dotenv
+import numpy as np
+import threading
+import hashlib
+import sqlite3
+import time
+import uuid
+import os
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Bumped whenever the layout of the cache directory changes, older directories are reset
+CACHE_FORMAT = "2"
+# A row allocated but not marked ready after this long belongs to a process that died writing it
+PENDING_TIMEOUT_SECONDS = 60
+
+
+class cached_embeddings(Embeddings):
+    """
+    a class to represent a disk backed cache in front of an embedding model
+
+    Vectors are kept in a memory mapped float32 array of `max_entries` rows, a SQLite index maps
+    the sha256 of (model, query or document, text) to its row. Once full, the least recently
+    used row is reused. A vector is only cached when float32 holds it exactly, so a hit returns
+    the same floats as the model.
+
+    The directory is shared by the workers of a host. Rows are allocated under the SQLite write
+    lock and only marked ready once their vector is written, a reader keeps a vector only when
+    its row still points at the same slot after reading it. Recency updates of hits are written
+    in batches of `touch_batch`.
+    """
+
+    def __init__(self, base, model_name, cache_dir=None, max_entries=None, touch_batch=None):
+        self.base = base
+        self.model_name = model_name
+        self.cache_dir = cache_dir or os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+        self.max_entries = int(max_entries or os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 100000))
+        self.touch_batch = int(touch_batch or os.getenv("EMBEDDING_CACHE_TOUCH_BATCH", 256))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._vectors_token = None
+        self._touched = {}
+        self._vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        # Transactions are explicit, BEGIN IMMEDIATE serialises the writers of every process
+        self._conn = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._write():
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            meta = self._meta()
+            if meta.get("format") != CACHE_FORMAT or meta.get("model") != model_name \
+                    or meta.get("max_entries") != str(self.max_entries) or not os.path.exists(self._vectors_path):
+                # Rows of another model, array size or layout are meaningless, start over
+                self._reset()
+            self._attach_vectors()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncacheable = 0
+
+
+    @contextmanager
+    def _write(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+
+    def _meta(self):
+        return dict(self._conn.execute("SELECT name, value FROM meta").fetchall())
+
+
+    def _reset(self):
+        # Called inside a write transaction
+        self._conn.execute("DROP TABLE IF EXISTS entries")
+        self._conn.execute("""
+            CREATE TABLE entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL,
+                ready INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX entries_by_last_used ON entries (last_used)")
+        self._conn.execute("DELETE FROM meta")
+        self._conn.executemany(
+            "INSERT INTO meta (name, value) VALUES (?, ?)",
+            [("format", CACHE_FORMAT), ("model", self.model_name), ("max_entries", str(self.max_entries))]
+        )
+        if os.path.exists(self._vectors_path):
+            os.remove(self._vectors_path)
+        self._vectors = None
+        self._vectors_token = None
+        self.dimension = None
+
+
+    def _attach_vectors(self):
+        """
+        Map the vector array another process may have created or recreated since, returns
+        whether there is one.
+        """
+        meta = self._meta()
+        token = meta.get("vectors")
+        if token is None:
+            self._vectors = None
+            self._vectors_token = None
+            self.dimension = None
+        elif token != self._vectors_token:
+            self.dimension = int(meta["dimension"])
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                      shape=(self.max_entries, self.dimension))
+            self._vectors_token = token
+        return self._vectors is not None
+
+
+    def _open_vectors(self, dimension):
+        # Called inside a write transaction once no process has created the array
+        self.dimension = dimension
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="w+",
+                                  shape=(self.max_entries, dimension))
+        self._vectors_token = uuid.uuid4().hex
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+            [("dimension", str(dimension)), ("vectors", self._vectors_token)]
+        )
+
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+
+    def _slots(self, keys):
+        slots = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            slots.update(self._conn.execute(
+                f"SELECT key, slot FROM entries WHERE ready = 1 AND key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return slots
+
+
+    def _write_touched(self):
+        # Called inside a write transaction
+        if self._touched:
+            self._conn.executemany("UPDATE entries SET last_used = max(last_used, ?) WHERE key = ?",
+                                   [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+
+    def _lookup(self, keys):
+        if not keys:
+            return {}
+        with self._lock:
+            if not self._attach_vectors():
+                return {}
+            unique = list(dict.fromkeys(keys))
+            slots = self._slots(unique)
+            found = {key: self._vectors[slot].tolist() for key, slot in slots.items()}
+            if found:
+                # Another process may have handed a slot over while it was read
+                current = self._slots(list(found))
+                found = {key: vector for key, vector in found.items() if current.get(key) == slots[key]}
+                now = time.time()
+                self._touched.update((key, now) for key in found)
+                if len(self._touched) >= self.touch_batch:
+                    with self._write():
+                        self._write_touched()
+        return found
+
+
+    def _store(self, items):
+        cacheable = []
+        for key, vector in items:
+            stored = np.asarray(vector, dtype=np.float32)
+            if stored.ndim != 1 or stored.tolist() != list(vector):
+                self.uncacheable += 1
+                continue
+            cacheable.append((key, stored))
+        if not cacheable:
+            return
+
+        with self._lock:
+            claimed = []
+            with self._write():
+                if not self._attach_vectors():
+                    self._open_vectors(len(cacheable[0][1]))
+                self._write_touched()
+                now = time.time()
+                for key, stored in cacheable:
+                    if len(stored) != self.dimension:
+                        self.uncacheable += 1
+                        continue
+                    if self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                        continue
+
+                    count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                    if count < self.max_entries:
+                        slot = count
+                    else:
+                        # The least recently used row is handed over to the new vector, rows still
+                        # being written by another process are left alone unless it died on them
+                        oldest = self._conn.execute(
+                            "SELECT key, slot FROM entries WHERE ready = 1 OR last_used < ? ORDER BY last_used LIMIT 1",
+                            (now - PENDING_TIMEOUT_SECONDS,)
+                        ).fetchone()
+                        if oldest is None:
+                            continue
+                        self._conn.execute("DELETE FROM entries WHERE key = ?", (oldest[0],))
+                        slot = oldest[1]
+                        self.evictions += 1
+                    self._conn.execute("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", (key, slot, now))
+                    claimed.append((key, slot, stored))
+
+            if not claimed:
+                return
+            # The evicted rows are gone for every reader before their slots are overwritten
+            for _, slot, stored in claimed:
+                self._vectors[slot] = stored
+            self._vectors.flush()
+            with self._write():
+                self._conn.executemany("UPDATE entries SET ready = 1 WHERE key = ? AND slot = ?",
+                                       [(key, slot) for key, slot, _ in claimed])
+
+
+    def embed_documents(self, texts):
+        keys = [self._key("document", t) for t in texts]
+        found = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - sum(1 for key in keys if key not in found)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.base.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed.items())
+            found.update(computed)
+        return [found[key] for key in keys]
+
+
+    def embed_query(self, text):
+        key = self._key("query", text)
+        found = self._lookup([key])
+        if key in found:
+            self.hits += 1
+            return found[key]
+        self.misses += 1
+        vector = self.base.embed_query(text)
+        self._store([(key, vector)])
+        return vector
+
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries WHERE ready = 1").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries, "max_entries": self.max_entries,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "uncacheable": self.uncacheable,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+    def close(self):
+        with self._lock:
+            with self._write():
+                self._write_touched()
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._conn.close()
 
 
 
@@ -7,9 +289,16 @@ class embedding:
     def __init__(self): 
         load_dotenv()
 
+    def _create_embedding(self):
+        model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        if os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() in ["true", "yes", "1"]:
+            return cached_embeddings(model, EMBEDDING_MODEL)
+        return model
+
     def get_embedding(self):
         try: 
-            embedding=HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+            # Loaded once per process and shared by the retriever, uploaders and caches
+            embedding = get_registry().get_or_create(f"embedding:{EMBEDDING_MODEL}", self._create_embedding)
             return embedding
         except Exception as e: 
-            raise ValueError(f"Error occurred with exception : {e}")
\ No newline at end of file
+            raise ValueError(f"Error occurred with exception : {e}")
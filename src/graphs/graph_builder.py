@@ -4,15 +4,27 @@ from langgraph.graph import StateGraph, START, END
 from src.llms.groqllm import groqllm
 from src.embedding.embedding import embedding
 from langgraph.checkpoint.memory import MemorySaver
+import os
 
 
 
 class Graph_builder:    
-    def __init__(self): 
+    def __init__(self , grading_mode=None , grading_max_concurrency=None , speculative_routing=None , speculative_web_search=None , local_router=None , reranking=None , generation_grading_mode=None , checkpointer=None): 
+        self.grading_mode = grading_mode
+        self.grading_max_concurrency = grading_max_concurrency
+        # Speculative routing starts retrieval while the router LLM decides
+        if speculative_routing is None:
+            speculative_routing = os.getenv("SPECULATIVE_ROUTING", "False").lower() in ["true", "yes", "1"]
+        self.speculative_routing = speculative_routing
+        self.speculative_web_search = speculative_web_search
+        self.local_router = local_router
+        self.reranking = reranking
+        self.generation_grading_mode = generation_grading_mode
         self.llm = groqllm().get_llm()
         self.graph = StateGraph(GraphState)
         self.embedding = embedding().get_embedding()
-        self.memory_saver = MemorySaver()
+        # Durable backends come from src.checkpointers.checkpointer, MemorySaver keeps threads in this process only
+        self.memory_saver = checkpointer or MemorySaver()
 
 
     def build_graph(self):
@@ -21,20 +33,46 @@ class Graph_builder:
         State is automatically initialized on graph invocation, allowing
         short-term memory to persist within a single execution.
         """
-        rag_nodes = RAG_nodes()
-        
+        return self._build(use_async=False)
+
+    def build_async_graph(self):
+        """
+        Build the same graph with the async node and edge functions, to be run with
+        ainvoke / astream so that LLM, retriever and web search calls do not block the event loop.
+        """
+        return self._build(use_async=True)
+
+    def _build(self, use_async):
+        rag_nodes = RAG_nodes(
+            grading_mode=self.grading_mode,
+            grading_max_concurrency=self.grading_max_concurrency,
+            speculative_web_search=self.speculative_web_search,
+            local_router=self.local_router,
+            reranking=self.reranking,
+            generation_grading_mode=self.generation_grading_mode
+        )
+        self.graph = StateGraph(GraphState)
+
+        # Async counterparts share the sync names with an "a" prefix
+        def node(name):
+            return getattr(rag_nodes, f"a{name}" if use_async else name)
+
         # Define nodes
-        web_search = rag_nodes.web_search
-        retrieve = rag_nodes.retrieve
-        grade_documents = rag_nodes.grade_documents
-        generate = rag_nodes.generate 
-        transform_query = rag_nodes.transform_query
-        route_question = rag_nodes.route_question 
-        grade_generation_v_documents_and_question = rag_nodes.grade_generation_v_documents_and_question
-        route_question_after_attempt = rag_nodes.route_question_after_attempts
-        human_in_the_loop = rag_nodes.human_in_the_loop
-        send_answer_vectorstore = rag_nodes.send_answer_vectorstore
-        decide_to_upload = rag_nodes.decide_to_upload
+        web_search = node("web_search")
+        retrieve = node("retrieve")
+        grade_documents = node("grade_documents")
+        generate = node("generate")
+        transform_query = node("transform_query")
+        route_question = node("route_question")
+        grade_generation_v_documents_and_question = node("grade_generation_v_documents_and_question")
+        route_question_after_attempt = node("route_question_after_attempts")
+        route_after_transform = node("route_after_transform")
+        human_in_the_loop = node("human_in_the_loop")
+        send_answer_vectorstore = node("send_answer_vectorstore")
+        decide_to_upload = node("decide_to_upload")
+        accept_answer = node("accept_answer")
+        speculative_route = node("speculative_route")
+        route_after_speculation = node("route_after_speculation")
 
         # Add nodes to graph
         self.graph.add_node("web_search", web_search) 
@@ -44,16 +82,31 @@ class Graph_builder:
         self.graph.add_node("transform_query", transform_query)
         self.graph.add_node("human_in_the_loop", human_in_the_loop)
         self.graph.add_node("send_answer_vectorstore", send_answer_vectorstore)
+        self.graph.add_node("accept_answer", accept_answer)
 
-        # Start directly with routing the question (no initialization node needed)
-        self.graph.add_conditional_edges(
-            START, 
-            route_question, 
-            {
-                "web_search": "web_search",
-                "vectorstore": "retrieve"
-            },
-        )
+        if self.speculative_routing:
+            # Route and retrieve at the same time, the retrieval is kept when the router picks the vectorstore
+            self.graph.add_node("speculative_route", speculative_route)
+            self.graph.add_edge(START, "speculative_route")
+            self.graph.add_conditional_edges(
+                "speculative_route",
+                route_after_speculation,
+                {
+                    "vectorstore": "grade_documents",
+                    "web_search": "web_search",
+                    "web_search_done": "generate"
+                },
+            )
+        else:
+            # Start directly with routing the question (no initialization node needed)
+            self.graph.add_conditional_edges(
+                START, 
+                route_question, 
+                {
+                    "web_search": "web_search",
+                    "vectorstore": "retrieve"
+                },
+            )
         
         self.graph.add_edge("web_search", "generate")
         self.graph.add_edge("retrieve", "grade_documents")
@@ -68,7 +121,15 @@ class Graph_builder:
             },
         )
         
-        self.graph.add_edge("transform_query", "retrieve")
+        # Back to retrieval with the rewritten question, unless it repeats a question already tried
+        self.graph.add_conditional_edges(
+            "transform_query",
+            route_after_transform,
+            {
+                "retrieve": "retrieve",
+                "web_search": "web_search"
+            },
+        )
 
         self.graph.add_conditional_edges(
             "generate",
@@ -76,8 +137,9 @@ class Graph_builder:
             {
                 "not supported": END,  # End if hallucinated - avoid infinite loops
                 "useful_websearch": "human_in_the_loop",  # Go to human decision for web search uploads
-                "useful_vectorstore": END,  # End directly for vector store results
-                "not useful": "transform_query"  # Only retry if answer doesn't address question
+                "useful_vectorstore": "accept_answer",  # Vector store results end after being marked accepted
+                "not useful": "transform_query",  # Only retry if answer doesn't address question
+                "retry budget exhausted": END  # Not useful, but the request spent its LLM call or time budget
             },
         )   
 
@@ -92,6 +154,7 @@ class Graph_builder:
         )
         
         self.graph.add_edge("send_answer_vectorstore", END)
+        self.graph.add_edge("accept_answer", END)
 
         return self.graph.compile(
             interrupt_before=["human_in_the_loop"],
@@ -0,0 +1,120 @@
+from src.llms.llm_scheduler import LLM_PROVIDERS, get_llm_scheduler
+from src.registry.resource_registry import get_registry
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import threading
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class admission_rejected(Exception):
+    """
+    Raised when a request is turned away, the API answers 503 with its Retry-After.
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Request rejected, {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+
+class admission_controller:
+    """
+    a class to represent the admission control of the graph runs of the API
+
+    A request is rejected upfront, rather than failing halfway through its LLM calls, when
+    `max_in_flight` runs are already going or when a provider queue of the LLM scheduler is
+    saturated: `max_waiting` calls queued, or a call queued now would wait `max_queue_seconds`.
+
+    Args:
+        max_in_flight: graph runs at once, ADMISSION_MAX_IN_FLIGHT, then 64.
+        max_waiting: LLM calls queued per provider, ADMISSION_MAX_QUEUED_CALLS, then 128.
+        max_queue_seconds: estimated queue wait per provider, ADMISSION_MAX_QUEUE_SECONDS, then 20.
+    """
+
+    def __init__(self, max_in_flight=None, max_waiting=None, max_queue_seconds=None):
+        load_dotenv()
+        self.max_in_flight = int(max_in_flight or os.getenv("ADMISSION_MAX_IN_FLIGHT", 64))
+        self.max_waiting = int(max_waiting or os.getenv("ADMISSION_MAX_QUEUED_CALLS", 128))
+        self.max_queue_seconds = float(max_queue_seconds or os.getenv("ADMISSION_MAX_QUEUE_SECONDS", 20))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+
+    def _saturation(self):
+        """
+        Return why the LLM queues cannot take more work and the seconds to wait, None otherwise.
+        """
+        for provider in LLM_PROVIDERS:
+            scheduler = get_llm_scheduler(provider)
+            if scheduler is None:
+                continue
+            waiting, wait = scheduler.waiting(), scheduler.estimated_wait()
+            if waiting >= self.max_waiting or wait >= self.max_queue_seconds:
+                return f"{provider} queue saturated ({waiting} calls, {wait:.1f}s wait)", wait
+        return None
+
+
+    def _reject_if_saturated(self, saturation):
+        # Called with the lock held
+        if saturation is None and self._in_flight >= self.max_in_flight:
+            saturation = f"{self._in_flight} requests in flight", 1.0
+        if saturation is not None:
+            self.rejected += 1
+            logger.warning(f"---REQUEST REJECTED: {saturation[0].upper()}---")
+            raise admission_rejected(*saturation)
+
+
+    def check(self):
+        """
+        Raise admission_rejected when the API is saturated, without taking a run slot. Streams
+        check before their response starts, so a rejection is still a 503, and take the slot
+        once they start.
+        """
+        saturation = self._saturation()
+        with self._lock:
+            self._reject_if_saturated(saturation)
+
+
+    def admit(self):
+        """
+        Take a run slot, raising admission_rejected when the API is saturated.
+        """
+        saturation = self._saturation()
+        with self._lock:
+            self._reject_if_saturated(saturation)
+            self._in_flight += 1
+            self.admitted += 1
+
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+    @contextmanager
+    def admitted_run(self):
+        self.admit()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self._in_flight, "max_in_flight": self.max_in_flight,
+                    "admitted": self.admitted, "rejected": self.rejected}
+
+
+
+def get_admission_controller():
+    """
+    Return the process wide admission controller.
+    """
+    return get_registry().get_or_create("admission_controller", admission_controller)
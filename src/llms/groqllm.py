@@ -1,5 +1,8 @@
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
+from src.registry.resource_registry import get_registry
+from src.cache.llm_cache import get_llm_cache
+from src.llms.llm_scheduler import schedule, scheduler_enabled
 import os 
 
 
@@ -8,15 +11,40 @@ class groqllm:
     def __init__(self):
         load_dotenv()
 
-    def get_llm(self ):
+    def _create_llm(self):
+        registry = get_registry()
+        # Use Llama 3.3 70B - supports tool use, parallel tool use, and JSON mode
+        return ChatGroq(
+            model="moonshotai/kimi-k2-instruct-0905",  # Latest model with full tool support
+            temperature=0,
+            max_tokens=1024,
+            http_client=registry.get_http_client("groq"),
+            http_async_client=registry.get_async_http_client("groq"),
+            # The LLM scheduler retries rate limited calls itself, with the whole provider backing off
+            max_retries=0 if scheduler_enabled() else 2
+        )
+
+    def get_llm(self , cache_namespace=None, chain=None):
+        """
+        Return the shared LLM client. With a cache_namespace, a copy answering repeated prompts
+        from the LLM response cache of that chain (when enabled) is returned instead.
+
+        With the LLM scheduler enabled, the calls of the chain (cache_namespace by default) wait
+        their turn in the Groq queue with the priority of the chain. Cache hits do not queue.
+        """
         try: 
             os.environ["GROQ_API_KEY"]=self.groq_api_key=os.getenv("GROQ_API_KEY")
-            # Use Llama 3.3 70B - supports tool use, parallel tool use, and JSON mode
-            llm=ChatGroq(
-                model="moonshotai/kimi-k2-instruct-0905",  # Latest model with full tool support
-                temperature=0,
-                max_tokens=1024
-            )
+            # One client per process, every chain shares its connection pool
+            llm = get_registry().get_or_create("llm:groq", self._create_llm)
+            chain = chain or cache_namespace
+            if chain:
+                llm = get_registry().get_or_create(f"llm:groq:scheduled:{chain}",
+                                                   lambda: schedule(llm, "groq", chain))
+            cache = get_llm_cache(cache_namespace) if cache_namespace else None
+            if cache is not None:
+                # The copy keeps the connection pool of the shared client
+                llm = get_registry().get_or_create(f"llm:groq:{cache_namespace}",
+                                                   lambda: llm.model_copy(update={"cache": cache}))
             return llm
         except Exception as e: 
             raise ValueError(f"Error occurred with exception : {e}")
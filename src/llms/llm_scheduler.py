@@ -0,0 +1,472 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+from typing import Any
+import threading
+import asyncio
+import logging
+import random
+import heapq
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDERS = ("groq",)
+
+# Lower runs first: finishing a request beats starting one, so generation and its grading
+# go before document grading and rewriting, and routing a new question comes last
+CHAIN_PRIORITIES = {
+    "rag": 0,
+    "hallucination_grader": 1,
+    "answer_grader": 1,
+    "generation_grader": 1,
+    "retrieval_grader": 2,
+    "multi_document_grader": 2,
+    "question_rewriter": 2,
+    "web_query_expander": 3,
+    "question_router": 3,
+}
+DEFAULT_PRIORITY = 2
+
+
+class provider_rate_limited(Exception):
+    """
+    Raised when a provider still answers 429 once the scheduler retries are spent.
+    """
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f"{provider} rate limit reached, retry after {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+
+class _ticket:
+    __slots__ = ("priority", "tokens", "granted", "abandoned", "event", "loop", "future")
+
+    def __init__(self, priority, tokens, event=None, loop=None, future=None):
+        self.priority = priority
+        self.tokens = tokens
+        self.granted = False
+        self.abandoned = False
+        self.event = event
+        self.loop = loop
+        self.future = future
+
+
+
+class llm_scheduler:
+    """
+    a class to represent the scheduler of the LLM calls of one provider, shared by every graph run
+
+    Calls wait in a priority queue (CHAIN_PRIORITIES) and start while the provider budgets
+    allow: `max_concurrency` calls in flight, and token buckets of `rpm` requests and `tpm`
+    tokens per minute when they are set. The tokens of a call are estimated from its prompt
+    before it starts and corrected with the reported usage once it ends. A 429 pauses every call
+    of the provider for its Retry-After, then the call is retried with jittered exponential
+    backoff.
+
+    Args:
+        provider: provider name, read as the LLM_<PROVIDER>_* environment variables below.
+        rpm: requests per minute, LLM_<PROVIDER>_RPM. No request budget when unset.
+        tpm: tokens per minute, LLM_<PROVIDER>_TPM. No token budget when unset.
+        max_concurrency: calls in flight, LLM_<PROVIDER>_MAX_CONCURRENCY, then 16.
+        max_retries: retries of a rate limited or failing call, LLM_<PROVIDER>_MAX_RETRIES, then 4.
+    """
+
+    def __init__(self, provider, rpm=None, tpm=None, max_concurrency=None, max_retries=None):
+        load_dotenv()
+        prefix = f"LLM_{provider.upper()}_"
+        self.provider = provider
+        self.rpm = float(rpm or os.getenv(f"{prefix}RPM", 0)) or None
+        self.tpm = float(tpm or os.getenv(f"{prefix}TPM", 0)) or None
+        self.max_concurrency = int(max_concurrency or os.getenv(f"{prefix}MAX_CONCURRENCY", 16))
+        self.max_retries = int(max_retries or os.getenv(f"{prefix}MAX_RETRIES", 4))
+        self.completion_tokens = int(os.getenv(f"{prefix}COMPLETION_TOKENS_ESTIMATE", 256))
+        self.backoff_base = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 0.5))
+        self.backoff_max = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 20))
+
+        self._lock = threading.Lock()
+        self._queue = []
+        self._seq = 0
+        self._in_flight = 0
+        self._requests = self.rpm or 0.0
+        self._tokens = self.tpm or 0.0
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._call_seconds = 1.0
+        self.rate_limited = 0
+        self.retries = 0
+
+
+    def _refill(self, now):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+
+    def _fits(self, ticket):
+        if self.rpm and self._requests < 1:
+            return False
+        # A call larger than the whole bucket starts once the bucket is full
+        if self.tpm and self._tokens < min(ticket.tokens, self.tpm):
+            return False
+        return True
+
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        self._in_flight += 1
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= ticket.tokens
+        if ticket.event is not None:
+            ticket.event.set()
+        else:
+            ticket.loop.call_soon_threadsafe(lambda f=ticket.future: f.done() or f.set_result(None))
+
+
+    def _dispatch(self):
+        # Called with the lock held, strict priority: a waiting head holds back the calls behind it
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue and now >= self._paused_until and self._in_flight < self.max_concurrency:
+            ticket = self._queue[0][2]
+            if ticket.abandoned:
+                heapq.heappop(self._queue)
+                continue
+            if not self._fits(ticket):
+                break
+            heapq.heappop(self._queue)
+            self._grant(ticket)
+
+
+    def _delay(self):
+        """
+        Seconds until the head of the queue may fit the rate budgets, None when it only waits
+        for a call to end.
+        """
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if not self._queue or self._in_flight >= self.max_concurrency:
+            return None
+        ticket = self._queue[0][2]
+        delay = 0.0
+        if self.rpm and self._requests < 1:
+            delay = max(delay, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            delay = max(delay, (min(ticket.tokens, self.tpm) - self._tokens) * 60 / self.tpm)
+        return max(delay, 0.01)
+
+
+    def _enqueue(self, ticket):
+        with self._lock:
+            self._seq += 1
+            heapq.heappush(self._queue, (ticket.priority, self._seq, ticket))
+
+
+    def acquire(self, priority, tokens):
+        """
+        Block until a call of `tokens` estimated tokens may start.
+        """
+        ticket = _ticket(priority, tokens, event=threading.Event())
+        self._enqueue(ticket)
+        try:
+            while True:
+                with self._lock:
+                    self._dispatch()
+                    if ticket.granted:
+                        return ticket
+                    delay = self._delay()
+                ticket.event.wait(delay)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+
+    async def aacquire(self, priority, tokens):
+        """
+        Async counterpart of acquire, the event loop is not blocked while waiting.
+        """
+        loop = asyncio.get_running_loop()
+        ticket = _ticket(priority, tokens, loop=loop, future=loop.create_future())
+        self._enqueue(ticket)
+        try:
+            while True:
+                with self._lock:
+                    self._dispatch()
+                    if ticket.granted:
+                        return ticket
+                    delay = self._delay()
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket.future), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+
+    def _abandon(self, ticket):
+        with self._lock:
+            if ticket.granted:
+                self._finish(ticket, ticket.tokens, None)
+            else:
+                ticket.abandoned = True
+
+
+    def release(self, ticket, used_tokens=None, seconds=None):
+        """
+        End a call, returning the estimated tokens it did not use to the token bucket.
+        """
+        with self._lock:
+            self._finish(ticket, ticket.tokens if used_tokens is None else used_tokens, seconds)
+
+
+    def _finish(self, ticket, used_tokens, seconds):
+        self._in_flight -= 1
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + ticket.tokens - used_tokens)
+        if seconds is not None:
+            self._call_seconds = 0.8 * self._call_seconds + 0.2 * seconds
+        self._dispatch()
+
+
+    def backoff(self, attempt, error):
+        """
+        Return the seconds to wait before retrying a failed call. A 429 pauses the provider for
+        its Retry-After, when it sends one.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if status_code(error) == 429:
+            retry_after = retry_after_seconds(error)
+            with self._lock:
+                self.rate_limited += 1
+                if retry_after is not None:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            delay = max(delay, retry_after or 0.0)
+        with self._lock:
+            self.retries += 1
+        return delay
+
+
+    def estimate_tokens(self, messages):
+        return sum(len(str(m.content)) for m in messages) // 4 + 1 + self.completion_tokens
+
+
+    def estimated_wait(self):
+        """
+        Seconds a call queued now would wait, from the queued work and the budgets.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            waiting = [t for _, _, t in self._queue if not t.abandoned]
+            wait = max(0.0, self._paused_until - now)
+            if self.rpm:
+                wait = max(wait, (len(waiting) + 1 - self._requests) * 60 / self.rpm)
+            if self.tpm:
+                wait = max(wait, (sum(t.tokens for t in waiting) - self._tokens) * 60 / self.tpm)
+            # Calls over the concurrency limit wait for earlier ones to end
+            wait = max(wait, (len(waiting) + self._in_flight + 1 - self.max_concurrency) / self.max_concurrency * self._call_seconds)
+            return max(wait, 0.0)
+
+
+    def waiting(self):
+        with self._lock:
+            return sum(1 for _, _, t in self._queue if not t.abandoned)
+
+
+    def stats(self):
+        with self._lock:
+            in_flight, paused = self._in_flight, max(0.0, self._paused_until - time.monotonic())
+        return {
+            "waiting": self.waiting(), "in_flight": in_flight, "estimated_wait_s": round(self.estimated_wait(), 3),
+            "paused_s": round(paused, 3), "rate_limited": self.rate_limited, "retries": self.retries,
+            "rpm": self.rpm, "tpm": self.tpm, "max_concurrency": self.max_concurrency,
+        }
+
+
+
+def status_code(error):
+    code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after_seconds(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def retryable(error):
+    code = status_code(error)
+    if code is not None:
+        return code == 429 or code >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+
+class scheduled_chat_model(BaseChatModel):
+    """
+    a class to represent a chat model whose calls go through the llm_scheduler of its provider
+
+    Only calls that reach the provider are scheduled, a copy carrying an LLM cache answers its
+    hits without queueing. Rate limited and failing calls are retried by the scheduler, the
+    wrapped client is expected not to retry on its own.
+    """
+
+    model: Any
+    scheduler: Any
+    chain: str = ""
+    priority: int = DEFAULT_PRIORITY
+
+
+    @property
+    def _llm_type(self):
+        return self.model._llm_type
+
+
+    @property
+    def _identifying_params(self):
+        return self.model._identifying_params
+
+
+    def _combine_llm_outputs(self, llm_outputs):
+        return self.model._combine_llm_outputs(llm_outputs)
+
+
+    @staticmethod
+    def _used_tokens(message):
+        usage = getattr(message, "usage_metadata", None) or {}
+        return usage.get("total_tokens")
+
+
+    def _give_up(self, attempt, error):
+        if attempt >= self.scheduler.max_retries or not retryable(error):
+            if status_code(error) == 429:
+                raise provider_rate_limited(self.scheduler.provider, retry_after_seconds(error) or self.scheduler.estimated_wait()) from error
+            raise error
+        logger.warning(f"---{self.scheduler.provider.upper()} CALL FAILED ({error}), RETRY {attempt + 1}---")
+        return self.scheduler.backoff(attempt, error)
+
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.scheduler.estimate_tokens(messages)
+        for attempt in range(self.scheduler.max_retries + 1):
+            ticket = self.scheduler.acquire(self.priority, tokens)
+            start = time.monotonic()
+            try:
+                result = self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                self.scheduler.release(ticket, seconds=time.monotonic() - start)
+                time.sleep(self._give_up(attempt, e))
+                continue
+            self.scheduler.release(ticket, self._used_tokens(result.generations[0].message), time.monotonic() - start)
+            return result
+
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.scheduler.estimate_tokens(messages)
+        for attempt in range(self.scheduler.max_retries + 1):
+            ticket = await self.scheduler.aacquire(self.priority, tokens)
+            start = time.monotonic()
+            try:
+                result = await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                self.scheduler.release(ticket, seconds=time.monotonic() - start)
+                await asyncio.sleep(self._give_up(attempt, e))
+                continue
+            self.scheduler.release(ticket, self._used_tokens(result.generations[0].message), time.monotonic() - start)
+            return result
+
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.scheduler.estimate_tokens(messages)
+        for attempt in range(self.scheduler.max_retries + 1):
+            ticket = self.scheduler.acquire(self.priority, tokens)
+            start, used, streamed = time.monotonic(), None, False
+            try:
+                for chunk in self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    streamed = True
+                    used = self._used_tokens(chunk.message) or used
+                    yield chunk
+            except Exception as e:
+                self.scheduler.release(ticket, seconds=time.monotonic() - start)
+                # Tokens already streamed cannot be taken back, only a call failing upfront is retried
+                if streamed:
+                    raise
+                time.sleep(self._give_up(attempt, e))
+                continue
+            except BaseException:
+                self.scheduler.release(ticket, seconds=time.monotonic() - start)
+                raise
+            self.scheduler.release(ticket, used, time.monotonic() - start)
+            return
+
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.scheduler.estimate_tokens(messages)
+        for attempt in range(self.scheduler.max_retries + 1):
+            ticket = await self.scheduler.aacquire(self.priority, tokens)
+            start, used, streamed = time.monotonic(), None, False
+            try:
+                async for chunk in self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    streamed = True
+                    used = self._used_tokens(chunk.message) or used
+                    yield chunk
+            except Exception as e:
+                self.scheduler.release(ticket, seconds=time.monotonic() - start)
+                if streamed:
+                    raise
+                await asyncio.sleep(self._give_up(attempt, e))
+                continue
+            except BaseException:
+                self.scheduler.release(ticket, seconds=time.monotonic() - start)
+                raise
+            self.scheduler.release(ticket, used, time.monotonic() - start)
+            return
+
+
+
+def scheduler_enabled():
+    load_dotenv()
+    return os.getenv("LLM_SCHEDULER_ENABLED", "True").lower() in ["true", "yes", "1"]
+
+
+def get_llm_scheduler(provider):
+    """
+    Return the process wide scheduler of a provider, or None when LLM_SCHEDULER_ENABLED is false.
+    """
+    if not scheduler_enabled():
+        return None
+    return get_registry().get_or_create(f"llm_scheduler:{provider}", lambda: llm_scheduler(provider))
+
+
+def schedule(llm, provider, chain):
+    """
+    Return llm wrapped so its calls go through the scheduler of the provider with the priority
+    of the chain, llm itself when scheduling is disabled.
+    """
+    scheduler = get_llm_scheduler(provider)
+    if scheduler is None:
+        return llm
+    return scheduled_chat_model(model=llm, scheduler=scheduler, chain=chain,
+                                priority=CHAIN_PRIORITIES.get(chain, DEFAULT_PRIORITY))
+
+
+def llm_scheduler_stats():
+    """
+    Queue and budget figures of the schedulers of every provider, for the health endpoints.
+    """
+    if not scheduler_enabled():
+        return {"enabled": False}
+    return {"enabled": True, **{provider: get_llm_scheduler(provider).stats() for provider in LLM_PROVIDERS}}
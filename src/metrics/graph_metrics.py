@@ -0,0 +1,243 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from src.cache.llm_cache import served_from_cache
+from collections import OrderedDict
+from dotenv import load_dotenv
+import threading
+import time
+import os
+
+METRIC_PREFIX = "adaptive_rag"
+
+# Each pass through transform_query is one more retrieval loop
+RETRY_NODE = "transform_query"
+
+
+class graph_metrics:
+    """
+    a class to represent the process wide metrics of graph runs
+
+    Totals are labelled by node, never by thread_id, to keep the Prometheus series bounded.
+    The breakdown of the last `max_threads` threads is kept separately for debugging.
+    """
+
+    def __init__(self, max_threads=None):
+        load_dotenv()
+        self.max_threads = int(max_threads or os.getenv("GRAPH_METRICS_MAX_THREADS", 1000))
+        self._lock = threading.Lock()
+        self._node_seconds = {}
+        self._node_errors = {}
+        self._llm_calls = {}
+        self._llm_seconds = {}
+        self._prompt_tokens = {}
+        self._completion_tokens = {}
+        self._retrieval_seconds = {}
+        self._retries = 0
+        self._threads = OrderedDict()
+
+
+    @staticmethod
+    def _observe(summary, label, seconds):
+        count, total = summary.get(label, (0, 0.0))
+        summary[label] = (count + 1, total + seconds)
+
+
+    def _thread(self, thread_id):
+        breakdown = self._threads.get(thread_id)
+        if breakdown is None:
+            breakdown = {"nodes": [], "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                         "llm_seconds": 0.0, "retrieval_seconds": 0.0, "retries": 0}
+            self._threads[thread_id] = breakdown
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+        self._threads.move_to_end(thread_id)
+        return breakdown
+
+
+    def record_node(self, thread_id, node, seconds, error=False):
+        with self._lock:
+            self._observe(self._node_seconds, node, seconds)
+            if error:
+                self._node_errors[node] = self._node_errors.get(node, 0) + 1
+            breakdown = self._thread(thread_id)
+            breakdown["nodes"].append({"node": node, "seconds": round(seconds, 4), "error": error})
+            if node == RETRY_NODE:
+                self._retries += 1
+                breakdown["retries"] += 1
+
+
+    def record_llm(self, thread_id, node, seconds, prompt_tokens, completion_tokens):
+        with self._lock:
+            self._llm_calls[node] = self._llm_calls.get(node, 0) + 1
+            self._observe(self._llm_seconds, node, seconds)
+            self._prompt_tokens[node] = self._prompt_tokens.get(node, 0) + prompt_tokens
+            self._completion_tokens[node] = self._completion_tokens.get(node, 0) + completion_tokens
+            breakdown = self._thread(thread_id)
+            breakdown["llm_calls"] += 1
+            breakdown["llm_seconds"] = round(breakdown["llm_seconds"] + seconds, 4)
+            breakdown["prompt_tokens"] += prompt_tokens
+            breakdown["completion_tokens"] += completion_tokens
+
+
+    def record_retrieval(self, thread_id, node, seconds):
+        with self._lock:
+            self._observe(self._retrieval_seconds, node, seconds)
+            breakdown = self._thread(thread_id)
+            breakdown["retrieval_seconds"] = round(breakdown["retrieval_seconds"] + seconds, 4)
+
+
+    def thread_breakdown(self, thread_id):
+        """
+        Return the timing, token and call breakdown of a thread, None once it has been evicted.
+        """
+        with self._lock:
+            breakdown = self._threads.get(thread_id)
+            if breakdown is None:
+                return None
+            return dict(breakdown, nodes=[dict(n) for n in breakdown["nodes"]])
+
+
+    def render_prometheus(self):
+        """
+        Render the totals in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def header(name, kind, description):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        def summary(name, description, values):
+            header(name, "summary", description)
+            for node, (count, total) in sorted(values.items()):
+                lines.append(f'{METRIC_PREFIX}_{name}_sum{{node="{node}"}} {total:.6f}')
+                lines.append(f'{METRIC_PREFIX}_{name}_count{{node="{node}"}} {count}')
+
+        def counter(name, description, values):
+            header(name, "counter", description)
+            for node, value in sorted(values.items()):
+                lines.append(f'{METRIC_PREFIX}_{name}{{node="{node}"}} {value}')
+
+        with self._lock:
+            summary("node_seconds", "Wall time of graph nodes", self._node_seconds)
+            counter("node_errors_total", "Graph node runs that raised", self._node_errors)
+            counter("llm_calls_total", "LLM calls per graph node", self._llm_calls)
+            summary("llm_seconds", "Latency of LLM calls per graph node", self._llm_seconds)
+            header("llm_tokens_total", "counter", "LLM tokens per graph node")
+            for kind, values in (("prompt", self._prompt_tokens), ("completion", self._completion_tokens)):
+                for node, value in sorted(values.items()):
+                    lines.append(f'{METRIC_PREFIX}_llm_tokens_total{{node="{node}",type="{kind}"}} {value}')
+            summary("retrieval_seconds", "Latency of retriever calls per graph node", self._retrieval_seconds)
+            header("retry_loops_total", "counter", "Query rewrite and retrieval retry loops")
+            lines.append(f"{METRIC_PREFIX}_retry_loops_total {self._retries}")
+        return "\n".join(lines) + "\n"
+
+
+
+class graph_run_tracer(BaseCallbackHandler):
+    """
+    a class to represent the callback handler recording one thread's graph runs into graph_metrics
+
+    A node is the chain run named after its langgraph_node, LLM and retriever runs are credited
+    to the node (or edge function, under the node it leaves) they run in.
+    """
+
+    # Called from the event loop or the worker threads directly, recording is cheap and locked
+    run_inline = True
+
+    def __init__(self, thread_id, metrics=None):
+        self.thread_id = thread_id
+        self.metrics = metrics or get_graph_metrics()
+        self._started = {}
+        self._retrievals = set()
+
+
+    @staticmethod
+    def _node(metadata):
+        return (metadata or {}).get("langgraph_node", "unknown")
+
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = self._node(metadata)
+        if kwargs.get("name") == node:
+            self._started[run_id] = (node, time.perf_counter())
+
+
+    def _end_node(self, run_id, error):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            self.metrics.record_node(self.thread_id, node, time.perf_counter() - start, error=error)
+
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_node(run_id, error=False)
+
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_node(run_id, error=True)
+
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._started[run_id] = (self._node(metadata), time.perf_counter())
+
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._started[run_id] = (self._node(metadata), time.perf_counter())
+
+
+    @staticmethod
+    def _tokens(response):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        # A cache hit carries the usage of the call it was stored from, it is not a call
+        if started is not None and not served_from_cache(response):
+            node, start = started
+            prompt_tokens, completion_tokens = self._tokens(response)
+            self.metrics.record_llm(self.thread_id, node, time.perf_counter() - start, prompt_tokens, completion_tokens)
+
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            self.metrics.record_llm(self.thread_id, node, time.perf_counter() - start, 0, 0)
+
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        # Retrievers wrapped by the hybrid or tiered retriever are part of the outer call
+        if parent_run_id in self._retrievals:
+            return
+        self._retrievals.add(run_id)
+        self._started[run_id] = (self._node(metadata), time.perf_counter())
+
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._retrievals.discard(run_id)
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            self.metrics.record_retrieval(self.thread_id, node, time.perf_counter() - start)
+
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self.on_retriever_end(None, run_id=run_id)
+
+
+
+_graph_metrics = graph_metrics()
+
+
+def get_graph_metrics():
+    """
+    Return the process wide graph metrics.
+    """
+    return _graph_metrics
@@ -2,85 +2,178 @@ from src.states.RAGState import GraphState , RAG
 from langchain_core.documents import Document
 from langchain_core.messages import SystemMessage, HumanMessage 
 from src.retrievers.retriever import retriever 
+from src.vectorstores.astra_vectorstore import collection_for, DEFAULT_COLLECTION
+from src.retrievers.retrieval_config import RetrievalConfig
+from src.retrievers.context_packer import context_packer
+from src.states.chunk_store import get_chunk_store
 from src.chains.rag_chain import rag_chain
 from src.chains.retrieval_grader import retrieval_grader
+from src.chains.multi_document_grader import multi_document_grader
 from src.chains.question_rewriter import question_rewriter
-from src.web_search.web_search_tool import web_search_tool
+from src.web_search.web_searcher import web_searcher
 from src.chains.question_router import question_router
+from src.routing.embedding_router import embedding_router
+from src.routing.retry_controller import retry_controller
+from src.rerankers.reranker import reranker
 from src.chains.answer_grader import answer_grader
 from src.chains.hallucination_grader import GradeHallucinations
+from src.chains.generation_grader import generation_grader
 from utils.generated_document_uploader import upload_generated_answers
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import threading
+import logging
+import asyncio
+import os
+
+logger = logging.getLogger(__name__)
+
+GRADING_MODES = ("sequential", "concurrent", "multi_document")
+GENERATION_GRADING_MODES = ("sequential", "parallel", "combined")
 
 class RAG_nodes: 
     """
     a class to represent RAG nodes
+
+    Args:
+        grading_mode: how grade_documents calls the retrieval grader. "sequential" grades one
+            document per call, "concurrent" fans the per-document calls out in parallel and
+            "multi_document" scores every document in a single call. Defaults to the
+            GRADING_MODE environment variable, then "concurrent".
+        grading_max_concurrency: maximum number of grading calls in flight in "concurrent" mode.
+            Defaults to the GRADING_MAX_CONCURRENCY environment variable, then 4.
+        speculative_web_search: when routing speculatively, also start the web search while the
+            router decides. Defaults to the SPECULATIVE_WEB_SEARCH environment variable, then False.
+        local_router: route with the local embedding router first and only call the LLM
+            question_router when it is uncertain. Defaults to the LOCAL_ROUTER_ENABLED environment
+            variable, then False.
+        reranking: score documents with the local reranker first and only send the borderline
+            ones to the retrieval grader. Defaults to the RERANKER_ENABLED environment variable,
+            then False.
+        generation_grading_mode: how a generation is graded. "sequential" runs the hallucination
+            grader then the answer grader, "parallel" runs both at once and stops as soon as the
+            generation is found ungrounded, "combined" asks for both scores in a single call.
+            Defaults to the GENERATION_GRADING_MODE environment variable, then "sequential".
+
+    The retrieve -> grade_documents -> transform_query loop is bounded by a retry_controller
+    configured from the RETRY_* environment variables. The "tenant" of the state selects the
+    collection searched and written, retrievers of other tenants or retrieval parameters than
+    the defaults are kept in an LRU pool of RETRIEVER_POOL_SIZE (default 32).
     """
 
-    def __init__(self ):
-        self.retriever = retriever().get_retriever()
+    def __init__(self , grading_mode=None , grading_max_concurrency=None , speculative_web_search=None , local_router=None , reranking=None , generation_grading_mode=None):
+        self.grading_mode = grading_mode or os.getenv("GRADING_MODE", "concurrent")
+        if self.grading_mode not in GRADING_MODES:
+            raise ValueError(f"Unknown grading mode : {self.grading_mode}, expected one of {GRADING_MODES}")
+        self.grading_max_concurrency = int(grading_max_concurrency or os.getenv("GRADING_MAX_CONCURRENCY", 4))
+        self.generation_grading_mode = generation_grading_mode or os.getenv("GENERATION_GRADING_MODE", "sequential")
+        if self.generation_grading_mode not in GENERATION_GRADING_MODES:
+            raise ValueError(f"Unknown generation grading mode : {self.generation_grading_mode}, expected one of {GENERATION_GRADING_MODES}")
+        self._generation_grading_pool = None
+        if speculative_web_search is None:
+            speculative_web_search = os.getenv("SPECULATIVE_WEB_SEARCH", "False").lower() in ["true", "yes", "1"]
+        self.speculative_web_search = speculative_web_search
+        self._speculation_pool = None
+        if local_router is None:
+            local_router = os.getenv("LOCAL_ROUTER_ENABLED", "False").lower() in ["true", "yes", "1"]
+        self.local_router = embedding_router() if local_router else None
+        if reranking is None:
+            reranking = os.getenv("RERANKER_ENABLED", "False").lower() in ["true", "yes", "1"]
+        self.reranker = reranker() if reranking else None
+        self.retry_controller = retry_controller()
+
+        self.retriever_factory = retriever()
+        self.retriever = self.retriever_factory.get_retriever()
+        self._default_retrieval_key = RetrievalConfig().retriever_key()
+        self._retrievers = OrderedDict()
+        self._retrievers_lock = threading.Lock()
+        self.retriever_pool_size = int(os.getenv("RETRIEVER_POOL_SIZE", 32))
+        self.context_packer = context_packer()
+        self.chunk_store = get_chunk_store()
         self.rag_chain = rag_chain().get_rag_chain()
         self.retrieval_grader = retrieval_grader().get_retrieval_grader()
+        self.multi_document_grader = multi_document_grader().get_multi_document_grader()
         self.question_rewriter = question_rewriter().question_rewriter()
-        self.web_search_tool = web_search_tool().get_web_search_tool()
+        self.web_searcher = web_searcher()
         self.question_router = question_router().get_question_router()
         self.hallucination_grader = GradeHallucinations().get_hallucination_grader()
         self.answer_grader = answer_grader().get_answer_grader()
+        self.generation_grader = generation_grader().get_generation_grader() if self.generation_grading_mode == "combined" else None
         
 
-    def retrieve(self , state: GraphState):
+    def _retriever_for(self, state, config):
+        """
+        Return the retriever of the tenant of the state for the retrieval parameters of the run
+        config, the default one for the shared collection and default parameters.
+        """
+        collection = collection_for(state.get("tenant"))
+        retrieval = RetrievalConfig.from_config(config)
+        key = (collection, retrieval.retriever_key())
+        if key == (DEFAULT_COLLECTION, self._default_retrieval_key):
+            return self.retriever
+        # Async nodes build retrievers on worker threads
+        with self._retrievers_lock:
+            if key not in self._retrievers:
+                # The tenants and configurations in use keep their retrievers warm, the others are dropped
+                while len(self._retrievers) >= self.retriever_pool_size:
+                    self._retrievers.popitem(last=False)
+                factory = self.retriever_factory if collection == DEFAULT_COLLECTION else retriever(collection_name=collection)
+                self._retrievers[key] = factory.get_retriever(retrieval)
+            self._retrievers.move_to_end(key)
+            return self._retrievers[key]
+
+
+    async def _aretrieve_documents(self, state, config, question):
+        # Building a retriever connects to Astra DB and blocks, it runs off the event loop
+        retriever_ = await asyncio.to_thread(self._retriever_for, state, config)
+        return await retriever_.ainvoke(question)
+
+
+    def _pack_context(self, documents, config):
+        return self.context_packer.pack(documents, RetrievalConfig.from_config(config).context_token_budget)
+
+
+    def retrieve(self , state: GraphState, config=None):
         """
         Retrieve documents
 
         Args:
             state (dict): The current graph state
+            config (dict): The run config, config["configurable"]["retrieval"] overrides the retrieval parameters
 
         Returns:
-            state (dict): New key added to state, documents, that contains retrieved documents
+            state (dict): New key added to state, documents, that contains the chunk references of the retrieved documents
         """
-        print("---RETRIEVE---")
+        logger.debug("---RETRIEVE---")
         question = state["question"]
-        attempts = state.get("number_of_document_tries", 0)
-        upload_status = state.get("upload_status", "False")
-        
-        # Retrieval
-        documents = self.retriever.invoke(question)
-        return {
-            "documents": documents, 
-            "question": question, 
-            "number_of_document_tries": attempts, 
-            "upload_status": upload_status,
-            "source_type": "vectorstore"
-        }
-    
 
-    def generate(self , state: GraphState): 
+        # Retrieval, the bodies go to the chunk store and the state keeps their references
+        documents = self._retriever_for(state, config).invoke(question)
+        return {"documents": self.chunk_store.put(documents), "source_type": "vectorstore"}
+
+
+    def generate(self , state: GraphState, config=None): 
         """
         Generate answer
 
         Args:
             state (dict): The current graph state
+            config (dict): The run config, its retrieval context_token_budget bounds the packed context
 
         Returns:
             state (dict): New key added to state, generation, that contains LLM generation
         """
-        print("---GENERATE---")
+        logger.debug("---GENERATE---")
         question = state["question"]
-        documents = state["documents"]
-        attempts = state.get("number_of_document_tries", 0)
-        upload_status = state.get("upload_status", "False")
-        source_type = state.get("source_type", "unknown")
+        documents = self.chunk_store.resolve(state["documents"])
+
+        # Near duplicates removed and the best documents fitted in the token budget
+        documents = self._pack_context(documents, config)
 
         # RAG generation
-        generation = self.rag_chain.invoke({"context": documents, "question": question})
-        return {
-            "documents": documents, 
-            "question": question, 
-            "generation": generation, 
-            "number_of_document_tries": attempts, 
-            "upload_status": upload_status,
-            "source_type": source_type
-        }
-    
+        generation = self.rag_chain.invoke({"context": context_packer.format(documents), "question": question})
+        return {"documents": self.chunk_store.put(documents), "generation": generation}
+
 
     def grade_documents(self, state: GraphState):
         """
@@ -93,35 +186,152 @@ class RAG_nodes:
             state (dict): Updates documents key with only filtered relevant documents
         """
 
-        print("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
+        logger.debug("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
         question = state["question"]
-        documents = state["documents"]
-        attempts = state.get("number_of_document_tries", 0)
-        upload_status = state.get("upload_status", "False")
-        source_type = state.get("source_type", "unknown")
-
-        # Score each doc
-        filtered_docs = []
-        for d in documents:
-            score = self.retrieval_grader.invoke(
-                {"question": question, "document": d.page_content}
-            )
-            # Handle both dict and Pydantic model responses
-            grade = score.binary_score if hasattr(score, 'binary_score') else score.get('binary_score', 'no')
+        refs = state["documents"]
+
+        # Only the chunks not graded yet for this question are read back and sent to the graders
+        retry = self.retry_controller.state(state)
+        pending = self.chunk_store.get(self.retry_controller.pending(retry, refs))
+        grades = self._grade(question, [d for _, d in pending])
+        retry, grades = self.retry_controller.record_grades(retry, refs, [r for r, _ in pending], grades)
+        filtered_refs = []
+        for ref, grade in zip(refs, grades):
             if grade == "yes":
-                print("---GRADE: DOCUMENT RELEVANT---")
-                filtered_docs.append(d)
+                logger.debug("---GRADE: DOCUMENT RELEVANT---")
+                filtered_refs.append(ref)
             else:
-                print("---GRADE: DOCUMENT NOT RELEVANT---")
+                logger.debug("---GRADE: DOCUMENT NOT RELEVANT---")
                 continue
+        return {"documents": filtered_refs, "retry": retry}
+
+
+    @staticmethod
+    def _binary_score(score):
+        # Handle both dict and Pydantic model responses
+        return score.binary_score if hasattr(score, 'binary_score') else score.get('binary_score', 'no')
+
+
+    def _grade(self, question, documents):
+        """
+        Grade documents against the question, with the reranker first when enabled and the
+        retrieval grader for the documents it leaves undecided.
+
+        Returns:
+            list: one "yes"/"no" grade per document, in the same order as documents
+        """
+        if self.reranker is None or not documents:
+            return self._grade_with_llm(question, documents)
+        _, decisions = self.reranker.decide(question, documents)
+        borderline = [d for d, decision in zip(documents, decisions) if decision is None]
+        return self._merge_grades(decisions, self._grade_with_llm(question, borderline))
+
+
+    async def _agrade(self, question, documents):
+        """
+        Async counterpart of _grade.
+        """
+        if self.reranker is None or not documents:
+            return await self._agrade_with_llm(question, documents)
+        _, decisions = await asyncio.to_thread(self.reranker.decide, question, documents)
+        borderline = [d for d, decision in zip(documents, decisions) if decision is None]
+        return self._merge_grades(decisions, await self._agrade_with_llm(question, borderline))
+
+
+    @staticmethod
+    def _merge_grades(decisions, borderline_grades):
+        logger.info(f"---RERANKER: {decisions.count('yes')} KEPT, {decisions.count('no')} DROPPED, {len(borderline_grades)} SENT TO GRADER---")
+        borderline_grades = iter(borderline_grades)
+        return [decision if decision is not None else next(borderline_grades) for decision in decisions]
+
+
+    def _grade_with_llm(self, question, documents):
+        """
+        Grade documents against the question with the retrieval grader, in the configured grading mode.
+
+        Returns:
+            list: one "yes"/"no" grade per document, in the same order as documents
+        """
+        if not documents:
+            return []
+
+        if self.grading_mode == "multi_document":
+            grades = self._grade_multi_document(question, documents)
+            if grades is not None:
+                return grades
+            logger.warning("---MULTI DOCUMENT GRADE UNUSABLE, FALLING BACK TO PER-DOCUMENT GRADING---")
+
+        inputs = [{"question": question, "document": d.page_content} for d in documents]
+        if self.grading_mode == "sequential":
+            scores = [self.retrieval_grader.invoke(i) for i in inputs]
+        else:
+            scores = self.retrieval_grader.batch(
+                inputs, config={"max_concurrency": self.grading_max_concurrency}
+            )
+        return [self._binary_score(score) for score in scores]
+
+
+    async def _agrade_with_llm(self, question, documents):
+        """
+        Async counterpart of _grade_with_llm.
+        """
+        if not documents:
+            return []
+
+        if self.grading_mode == "multi_document":
+            grades = await self._agrade_multi_document(question, documents)
+            if grades is not None:
+                return grades
+            logger.warning("---MULTI DOCUMENT GRADE UNUSABLE, FALLING BACK TO PER-DOCUMENT GRADING---")
+
+        inputs = [{"question": question, "document": d.page_content} for d in documents]
+        if self.grading_mode == "sequential":
+            scores = [await self.retrieval_grader.ainvoke(i) for i in inputs]
+        else:
+            scores = await self.retrieval_grader.abatch(
+                inputs, config={"max_concurrency": self.grading_max_concurrency}
+            )
+        return [self._binary_score(score) for score in scores]
+
+
+    def _grade_multi_document(self, question, documents):
+        """
+        Score every document in one call. Returns None when the response does not hold
+        exactly one score per document, so the caller can fall back to per-document grading.
+        """
+        try:
+            result = self.multi_document_grader.invoke(self._multi_document_input(question, documents))
+        except Exception as e:
+            logger.warning(f"---MULTI DOCUMENT GRADER FAILED: {e}---")
+            return None
+        return self._parse_multi_document_scores(result, documents)
+
+
+    async def _agrade_multi_document(self, question, documents):
+        try:
+            result = await self.multi_document_grader.ainvoke(self._multi_document_input(question, documents))
+        except Exception as e:
+            logger.warning(f"---MULTI DOCUMENT GRADER FAILED: {e}---")
+            return None
+        return self._parse_multi_document_scores(result, documents)
+
+
+    @staticmethod
+    def _multi_document_input(question, documents):
         return {
-            "documents": filtered_docs, 
-            "question": question, 
-            "number_of_document_tries": attempts, 
-            "upload_status": upload_status,
-            "source_type": source_type
+            "question": question,
+            "documents": multi_document_grader.format_documents(documents),
+            "count": len(documents),
         }
-    
+
+
+    @staticmethod
+    def _parse_multi_document_scores(result, documents):
+        scores = result.get("scores") if isinstance(result, dict) else None
+        if not isinstance(scores, list) or len(scores) != len(documents):
+            return None
+        return ["yes" if str(score).strip().lower() == "yes" else "no" for score in scores]
+
 
 
     def transform_query(self , state: GraphState):
@@ -135,28 +345,21 @@ class RAG_nodes:
             state (dict): Updates question key with a re-phrased question
         """
 
-        print("---TRANSFORM QUERY---")
+        logger.debug("---TRANSFORM QUERY---")
         question = state["question"]
-        documents = state["documents"]
         current_attempts = state.get("number_of_document_tries", 0)
-        upload_status = state.get("upload_status", "False")
-        source_type = state.get("source_type", "unknown")
 
         # Re-write question
         better_question = self.question_rewriter.invoke({"question": question})
+
+        # A rewrite nearly the same as a question already tried ends the retries
+        retry = self.retry_controller.record_question(self.retry_controller.state(state), better_question)
         
         # Increment the number of attempts
         new_attempts = current_attempts + 1
-        print(f"---INCREMENTING ATTEMPTS: {new_attempts}---")
+        logger.info(f"---INCREMENTING ATTEMPTS: {new_attempts}---")
         
-        return {
-            "documents": documents, 
-            "question": better_question, 
-            "number_of_document_tries": new_attempts, 
-            "upload_status": upload_status,
-            "source_type": source_type
-        }
-    
+        return {"question": better_question, "number_of_document_tries": new_attempts, "retry": retry}
 
 
     def web_search(self , state: GraphState):
@@ -167,27 +370,66 @@ class RAG_nodes:
             state (dict): The current graph state
 
         Returns:
-            state (dict): Updates documents key with appended web results
+            state (dict): Updates documents key with the chunk references of the web results
         """
 
-        print("---WEB SEARCH---")
+        logger.debug("---WEB SEARCH---")
         question = state["question"]
-        attempts = state.get("number_of_document_tries", 0)
-        upload_status = state.get("upload_status", "False")
 
-        # Web search
-        docs = self.web_search_tool.invoke({"query": question})
-        web_results = "\n".join([d["content"] for d in docs])
-        web_results = Document(page_content=web_results)
+        # Web search, one document per result, cached per query and fanned out over query variants when enabled
+        web_results = self.web_searcher.search_documents(question)
 
+        return {"documents": self.chunk_store.put(web_results), "source_type": "websearch"}
+
+
+    def speculative_route(self , state: GraphState, config=None):
+        """
+        Route the question while the vectorstore retrieval (and optionally the web search)
+        already runs, then keep the result of the route the router picked.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            state (dict): The routing decision in datasource and, when available, the documents
+                of the chosen route
+        """
+        logger.debug("---SPECULATIVE ROUTE QUESTION---")
+        question = state["question"]
+
+        if self._speculation_pool is None:
+            self._speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative_route")
+        retrieval = self._speculation_pool.submit(self._retriever_for(state, config).invoke, question)
+        web = self._speculation_pool.submit(self.web_searcher.search_documents, question) if self.speculative_web_search else None
+
+        try:
+            datasource = self.route_question(state) or "vectorstore"
+        except Exception:
+            retrieval.cancel()
+            if web is not None:
+                web.cancel()
+            raise
+
+        if datasource == "vectorstore":
+            if web is not None:
+                web.cancel()
+            logger.info("---SPECULATION: KEEP VECTORSTORE RETRIEVAL---")
+            return {
+                "documents": self.chunk_store.put(retrieval.result()),
+                "source_type": "vectorstore",
+                "datasource": "vectorstore"
+            }
+
+        # Web search route, the retrieval result is discarded
+        retrieval.cancel()
+        if web is None:
+            return {"datasource": "web_search"}
+        logger.info("---SPECULATION: KEEP WEB SEARCH RESULTS---")
         return {
-            "documents": web_results, 
-            "question": question, 
-            "number_of_document_tries": attempts, 
-            "upload_status": upload_status,
-            "source_type": "websearch"
+            "documents": self.chunk_store.put(web.result()),
+            "source_type": "websearch",
+            "datasource": "web_search_done"
         }
-    
 
 
     ### edges 
@@ -203,99 +445,212 @@ class RAG_nodes:
             str: Next node to call
         """
 
-        print("---ROUTE QUESTION---")
+        logger.debug("---ROUTE QUESTION---")
         question = state["question"]
-        source = self.question_router.invoke({"question": question})
-        # Handle both dict and Pydantic model responses
-        datasource = source.datasource if hasattr(source, 'datasource') else source.get('datasource', 'vectorstore')
+        datasource = self._local_route(question)
+        if datasource is None:
+            source = self.question_router.invoke({"question": question})
+            # Handle both dict and Pydantic model responses
+            datasource = source.datasource if hasattr(source, 'datasource') else source.get('datasource', 'vectorstore')
         
         if datasource == "web_search":
-            print("---ROUTE QUESTION TO WEB SEARCH---")
+            logger.info("---ROUTE QUESTION TO WEB SEARCH---")
             return "web_search"
         elif datasource == "vectorstore":
-            print("---ROUTE QUESTION TO RAG---")
+            logger.info("---ROUTE QUESTION TO RAG---")
             return "vectorstore"
         
         
-    def grade_generation_v_documents_and_question(self , state:GraphState ):
+    def _local_route(self, question):
+        """
+        Route with the local embedding router, None when it is disabled, uncertain or failing.
+        """
+        if self.local_router is None:
+            return None
+        try:
+            datasource, margin = self.local_router.route(question)
+        except Exception as e:
+            logger.warning(f"---LOCAL ROUTER FAILED: {e}---")
+            return None
+        if datasource is None:
+            logger.info(f"---LOCAL ROUTER UNCERTAIN (MARGIN {margin:.3f}), ASKING LLM ROUTER---")
+        else:
+            logger.info(f"---LOCAL ROUTER: {datasource.upper()} (MARGIN {margin:.3f})---")
+        return datasource
+
+
+    def route_after_speculation(self , state: GraphState):
+        """
+        Route after speculative_route based on the decision it recorded.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            str: "vectorstore" to grade the retrieved documents, "web_search" to search the web,
+                "web_search_done" to generate from the web results already fetched
+        """
+        return state.get("datasource", "vectorstore")
+
+
+    def grade_generation_v_documents_and_question(self , state:GraphState , config=None):
         """
         Determines whether the generation is grounded in the document and answers question.
         Only routes to human-in-the-loop for web search results.
 
         Args:
             state (dict): The current graph state
+            config (dict): The run config, its thread_id identifies the request
 
         Returns:
             str: Decision for next node to call
         """
 
-        print("---CHECK HALLUCINATIONS---")
+        logger.debug("---CHECK HALLUCINATIONS---")
         question = state["question"]
-        documents = state["documents"]  
+        documents = self.chunk_store.resolve(state["documents"])
         generation = state["generation"]
         source_type = state.get("source_type", "unknown")
 
-        score = self.hallucination_grader.invoke(
-            {"documents": documents, "generation": generation}
-        )
-        # Handle both dict and Pydantic model responses
-        grade = score.binary_score if hasattr(score, 'binary_score') else score.get('binary_score', 'no')
-
-        # Check hallucination
-        if grade == "yes":
-            print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
-            # Check question-answering
-            print("---GRADE GENERATION vs QUESTION---")
-            score = self.answer_grader.invoke({"question": question, "generation": generation})
-            # Handle both dict and Pydantic model responses
-            grade = score.binary_score if hasattr(score, 'binary_score') else score.get('binary_score', 'no')
-            if grade == "yes":
-                print("---DECISION: GENERATION ADDRESSES QUESTION---")
-                # Only allow human-in-the-loop for web search results
-                if source_type == "websearch":
-                    print("---WEB SEARCH RESULT: ROUTE TO HUMAN DECISION---")
-                    return "useful_websearch"
-                else:
-                    print("---VECTOR STORE RESULT: END PROCESS---")
-                    return "useful_vectorstore"
-            else:
-                print("---DECISION: GENERATION DOES NOT ADDRESS QUESTION---")
-                return "not useful"
-        else:
-            print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-TRY---")
+        grounded, useful = self._grade_generation(question, documents, generation)
+        return self._generation_decision(grounded, useful, source_type, self.retry_controller.exhausted(config))
+
+
+    def _grade_generation(self, question, documents, generation):
+        """
+        Grade the generation in the configured generation grading mode.
+
+        Returns:
+            tuple: the grounded and answers-question grades, the second one is None when the
+                generation is not grounded and it was not needed
+        """
+        if self.generation_grading_mode == "combined":
+            grades = self._grade_generation_combined(question, documents, generation)
+            if grades is not None:
+                return grades
+            logger.warning("---COMBINED GENERATION GRADE UNUSABLE, FALLING BACK TO SEQUENTIAL GRADING---")
+
+        hallucination_input = {"documents": documents, "generation": generation}
+        answer_input = {"question": question, "generation": generation}
+        if self.generation_grading_mode == "parallel":
+            if self._generation_grading_pool is None:
+                self._generation_grading_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="generation_grading")
+            hallucination = self._generation_grading_pool.submit(self.hallucination_grader.invoke, hallucination_input)
+            answer = self._generation_grading_pool.submit(self.answer_grader.invoke, answer_input)
+            # An ungrounded generation ends the run whatever the answer grade, do not wait for it
+            grounded = self._binary_score(hallucination.result())
+            if grounded != "yes":
+                answer.cancel()
+                return grounded, None
+            return grounded, self._binary_score(answer.result())
+
+        grounded = self._binary_score(self.hallucination_grader.invoke(hallucination_input))
+        if grounded != "yes":
+            return grounded, None
+        logger.debug("---GRADE GENERATION vs QUESTION---")
+        return grounded, self._binary_score(self.answer_grader.invoke(answer_input))
+
+
+    def _grade_generation_combined(self, question, documents, generation):
+        """
+        Grade grounding and usefulness in one call. Returns None when the response does not hold
+        both scores, so the caller can fall back to the separate graders.
+        """
+        try:
+            result = self.generation_grader.invoke({"documents": documents, "question": question, "generation": generation})
+        except Exception as e:
+            logger.warning(f"---COMBINED GENERATION GRADER FAILED: {e}---")
+            return None
+        return self._parse_generation_grades(result)
+
+
+    @staticmethod
+    def _parse_generation_grades(result):
+        if not isinstance(result, dict):
+            return None
+        grounded, useful = result.get("grounded"), result.get("answers_question")
+        if grounded not in ("yes", "no") or useful not in ("yes", "no"):
+            return None
+        return grounded, useful
+
+
+    @staticmethod
+    def _generation_decision(grounded, useful, source_type, exhausted=None):
+        """
+        Map the generation grades to the edge labels of the graph, `exhausted` is why the retry
+        budget of the request is spent, if it is.
+        """
+        if grounded != "yes":
+            logger.info("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-TRY---")
             return "not supported"
+        logger.info("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
+        if useful != "yes":
+            logger.info("---DECISION: GENERATION DOES NOT ADDRESS QUESTION---")
+            if exhausted:
+                logger.info(f"---RETRY BUDGET SPENT ({exhausted}), END PROCESS---")
+                return "retry budget exhausted"
+            return "not useful"
+        logger.info("---DECISION: GENERATION ADDRESSES QUESTION---")
+        # Only allow human-in-the-loop for web search results
+        if source_type == "websearch":
+            logger.info("---WEB SEARCH RESULT: ROUTE TO HUMAN DECISION---")
+            return "useful_websearch"
+        logger.info("---VECTOR STORE RESULT: END PROCESS---")
+        return "useful_vectorstore"
         
 
-    def route_question_after_attempts(self , state: GraphState):
+    def route_question_after_attempts(self , state: GraphState, config=None):
         """
-        Route based on document relevance and attempt count.
+        Route based on document relevance, attempt count and the retry budget of the request.
         
         Args:
             state (dict): The current graph state
+            config (dict): The run config, its thread_id identifies the request
 
         Returns:
             str: Next node to call
         """
 
-        print("---ASSESS GRADED DOCUMENTS---")
+        logger.debug("---ASSESS GRADED DOCUMENTS---")
         filtered_documents = state["documents"]
         attempts = state.get("number_of_document_tries", 0)
 
         if not filtered_documents:
             # No relevant documents found
-            print("---NO RELEVANT DOCUMENTS FOUND---")
-            print(f"---ATTEMPT NUMBER: {attempts}---")
+            logger.info("---NO RELEVANT DOCUMENTS FOUND---")
+            logger.info(f"---ATTEMPT NUMBER: {attempts}---")
             
-            if attempts >= 3:
-                print("---ROUTE TO WEB SEARCH AFTER 3 ATTEMPTS---")
+            if attempts >= self.retry_controller.max_attempts:
+                logger.info(f"---ROUTE TO WEB SEARCH AFTER {attempts} ATTEMPTS---")
+                return "web_search"
+            exhausted = self.retry_controller.exhausted(config)
+            if exhausted:
+                logger.info(f"---RETRY BUDGET SPENT ({exhausted}), ROUTE TO WEB SEARCH---")
                 return "web_search"
             else:
-                print("---ROUTE TO TRANSFORM QUERY (CONTINUE TRYING)---")
+                logger.info("---ROUTE TO TRANSFORM QUERY (CONTINUE TRYING)---")
                 return "transform_query"
         else:
             # We have relevant documents, so generate answer
-            print("---DECISION: GENERATE---")
+            logger.info("---DECISION: GENERATE---")
             return "generate"
+
+
+    def route_after_transform(self , state: GraphState):
+        """
+        Route the rewritten question back to retrieval, or to web search when the rewrite
+        repeats a question already tried.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            str: Next node to call
+        """
+        if (state.get("retry") or {}).get("stalled"):
+            logger.info("---REWRITE STALLED, ROUTE TO WEB SEARCH---")
+            return "web_search"
+        return "retrieve"
         
 
     def human_in_the_loop(self, state: GraphState):
@@ -311,33 +666,20 @@ class RAG_nodes:
         Returns:
             state (dict): State with human decision for upload
         """
-        print("---HUMAN IN THE LOOP INTERVENTION REQUIRED---")
-        print("---WAITING FOR HUMAN DECISION ON UPLOADING WEB SEARCH RESULT---")
-        
-        question = state["question"]
-        generation = state["generation"]
-        documents = state["documents"]
-        attempts = state.get("number_of_document_tries", 0)
-        source_type = state.get("source_type", "unknown")
+        logger.info("---HUMAN IN THE LOOP INTERVENTION REQUIRED---")
+        logger.info("---WAITING FOR HUMAN DECISION ON UPLOADING WEB SEARCH RESULT---")
         
         # The upload_status will be set by human intervention
         # Default to "False" if not set by human
         upload_status = state.get("upload_status", "False")
         
-        print(f"Question: {question}")
-        print(f"Generated Answer: {generation}")
-        print(f"Source Type: {source_type}")
-        print(f"Upload Status: {upload_status}")
-        
-        return {
-            "question": question,
-            "generation": generation,
-            "documents": documents,
-            "number_of_document_tries": attempts,
-            "upload_status": upload_status,
-            "source_type": source_type
-        }
+        logger.debug(f"Question: {state['question']}")
+        logger.debug(f"Generated Answer: {state['generation']}")
+        logger.debug(f"Source Type: {state.get('source_type', 'unknown')}")
+        logger.debug(f"Upload Status: {upload_status}")
         
+        return {"upload_status": upload_status}
+
 
     def decide_to_upload(self, state: GraphState):
         """
@@ -349,17 +691,31 @@ class RAG_nodes:
         Returns:
             str: "yes" to upload, "no" to skip
         """
-        print("---DECIDE TO UPLOAD---")
+        logger.debug("---DECIDE TO UPLOAD---")
         upload_status = state.get("upload_status", "False")
         
         if upload_status.lower() in ["true", "yes", "1"]:
-            print("---DECISION: UPLOAD TO VECTOR STORE---")
+            logger.info("---DECISION: UPLOAD TO VECTOR STORE---")
             return "yes"
         else:
-            print("---DECISION: DO NOT UPLOAD---")
+            logger.info("---DECISION: DO NOT UPLOAD---")
             return "no"
         
 
+    def accept_answer(self, state: GraphState):
+        """
+        Mark the generation as accepted once it is grounded and addresses the question.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            state (dict): State with answer_status set to "accepted"
+        """
+        logger.info("---ANSWER ACCEPTED---")
+        return {"answer_status": "accepted"}
+
+
     def send_answer_vectorstore(self, state: GraphState):
         """
         Send answer from websearch to vectorstore
@@ -371,36 +727,279 @@ class RAG_nodes:
             state (dict): Updated state after upload
         """
 
-        print("---SENDING ANSWER FROM WEBSEARCH TO VECTORSTORE---")
-        question = state["question"]
+        logger.info("---SENDING ANSWER FROM WEBSEARCH TO VECTORSTORE---")
         answer = state["generation"]
-        documents = state["documents"]
-        attempts = state.get("number_of_document_tries", 0)
+        documents = self.chunk_store.resolve(state["documents"])
         source_type = state.get("source_type", "unknown")
 
-        print("---PREPARING TO UPLOAD GENERATED ANSWER AND SOURCE DOCUMENTS TO ASTRA DB---")
-        print(f"---SOURCE TYPE: {source_type}---")
+        logger.debug("---PREPARING TO UPLOAD GENERATED ANSWER AND SOURCE DOCUMENTS TO ASTRA DB---")
+        logger.debug(f"---SOURCE TYPE: {source_type}---")
 
         try:
-            uploader = upload_generated_answers(documents, answer)
+            uploader = upload_generated_answers(documents, answer, tenant=state.get("tenant"))
             upload_result = uploader.upload_answer()
-            print("---UPLOAD SUCCESSFUL---")
-            
-            return {
-                "question": question,
-                "generation": answer,
-                "documents": documents,
-                "number_of_document_tries": attempts,
-                "upload_status": "completed",
-                "source_type": source_type
-            }
+            logger.info("---UPLOAD SUCCESSFUL---")
+
+            update = {"upload_status": "completed", "answer_status": "accepted"}
+            # The upload moved the semantic cache to a new generation, the answer belongs to it
+            # unless another write to the collection came in since the run started
+            if uploader.cache_generation is not None:
+                started = state.get("cache_generation")
+                if started is not None and uploader.cache_generation == started + 1:
+                    update["cache_generation"] = uploader.cache_generation
+                else:
+                    update["cache_question"] = None
+            return update
         except Exception as e:
-            print(f"---UPLOAD FAILED: {e}---")
+            logger.warning(f"---UPLOAD FAILED: {e}---")
+            return {"upload_status": "failed"}
+
+
+    ### async counterparts, used by the graph compiled with Graph_builder.build_async_graph
+
+    async def aretrieve(self , state: GraphState, config=None):
+        """
+        Async counterpart of retrieve.
+        """
+        logger.debug("---RETRIEVE---")
+        question = state["question"]
+
+        # Retrieval
+        documents = await self._aretrieve_documents(state, config, question)
+        return {"documents": await asyncio.to_thread(self.chunk_store.put, documents), "source_type": "vectorstore"}
+
+
+    async def aspeculative_route(self , state: GraphState, config=None):
+        """
+        Async counterpart of speculative_route, the route that is not picked is cancelled.
+        """
+        logger.debug("---SPECULATIVE ROUTE QUESTION---")
+        question = state["question"]
+
+        retrieval = asyncio.create_task(self._aretrieve_documents(state, config, question))
+        web = asyncio.create_task(self.web_searcher.asearch_documents(question)) if self.speculative_web_search else None
+
+        try:
+            datasource = await self.aroute_question(state) or "vectorstore"
+        except BaseException:
+            retrieval.cancel()
+            if web is not None:
+                web.cancel()
+            raise
+
+        if datasource == "vectorstore":
+            if web is not None:
+                web.cancel()
+            logger.info("---SPECULATION: KEEP VECTORSTORE RETRIEVAL---")
             return {
-                "question": question,
-                "generation": answer,
-                "documents": documents,
-                "number_of_document_tries": attempts,
-                "upload_status": "failed",
-                "source_type": source_type
-            }
\ No newline at end of file
+                "documents": await asyncio.to_thread(self.chunk_store.put, await retrieval),
+                "source_type": "vectorstore",
+                "datasource": "vectorstore"
+            }
+
+        # Web search route, the retrieval is cancelled
+        retrieval.cancel()
+        if web is None:
+            return {"datasource": "web_search"}
+        logger.info("---SPECULATION: KEEP WEB SEARCH RESULTS---")
+        return {
+            "documents": await asyncio.to_thread(self.chunk_store.put, await web),
+            "source_type": "websearch",
+            "datasource": "web_search_done"
+        }
+
+
+    async def agenerate(self , state: GraphState, config=None):
+        """
+        Async counterpart of generate.
+        """
+        logger.debug("---GENERATE---")
+        question = state["question"]
+        # The chunk store and the tokenizer block, they run off the event loop
+        documents = await asyncio.to_thread(self.chunk_store.resolve, state["documents"])
+
+        # Near duplicates removed and the best documents fitted in the token budget
+        documents = await asyncio.to_thread(self._pack_context, documents, config)
+
+        # RAG generation
+        generation = await self.rag_chain.ainvoke({"context": context_packer.format(documents), "question": question})
+        return {"documents": await asyncio.to_thread(self.chunk_store.put, documents), "generation": generation}
+
+
+    async def agrade_documents(self, state: GraphState):
+        """
+        Async counterpart of grade_documents.
+        """
+        logger.debug("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
+        question = state["question"]
+        refs = state["documents"]
+
+        # Only the chunks not graded yet for this question are read back and sent to the graders
+        retry = self.retry_controller.state(state)
+        pending = await asyncio.to_thread(self.chunk_store.get, self.retry_controller.pending(retry, refs))
+        grades = await self._agrade(question, [d for _, d in pending])
+        retry, grades = self.retry_controller.record_grades(retry, refs, [r for r, _ in pending], grades)
+        filtered_refs = []
+        for ref, grade in zip(refs, grades):
+            if grade == "yes":
+                logger.debug("---GRADE: DOCUMENT RELEVANT---")
+                filtered_refs.append(ref)
+            else:
+                logger.debug("---GRADE: DOCUMENT NOT RELEVANT---")
+                continue
+        return {"documents": filtered_refs, "retry": retry}
+
+
+    async def atransform_query(self , state: GraphState):
+        """
+        Async counterpart of transform_query.
+        """
+        logger.debug("---TRANSFORM QUERY---")
+        question = state["question"]
+        current_attempts = state.get("number_of_document_tries", 0)
+
+        # Re-write question
+        better_question = await self.question_rewriter.ainvoke({"question": question})
+
+        # A rewrite nearly the same as a question already tried ends the retries
+        retry = await asyncio.to_thread(self.retry_controller.record_question, self.retry_controller.state(state), better_question)
+
+        # Increment the number of attempts
+        new_attempts = current_attempts + 1
+        logger.info(f"---INCREMENTING ATTEMPTS: {new_attempts}---")
+
+        return {"question": better_question, "number_of_document_tries": new_attempts, "retry": retry}
+
+
+    async def aweb_search(self , state: GraphState):
+        """
+        Async counterpart of web_search.
+        """
+        logger.debug("---WEB SEARCH---")
+        question = state["question"]
+
+        # Web search
+        web_results = await self.web_searcher.asearch_documents(question)
+
+        return {"documents": await asyncio.to_thread(self.chunk_store.put, web_results), "source_type": "websearch"}
+
+
+    async def aroute_question(self , state: GraphState):
+        """
+        Async counterpart of route_question.
+        """
+        logger.debug("---ROUTE QUESTION---")
+        question = state["question"]
+        datasource = await asyncio.to_thread(self._local_route, question)
+        if datasource is None:
+            source = await self.question_router.ainvoke({"question": question})
+            # Handle both dict and Pydantic model responses
+            datasource = source.datasource if hasattr(source, 'datasource') else source.get('datasource', 'vectorstore')
+
+        if datasource == "web_search":
+            logger.info("---ROUTE QUESTION TO WEB SEARCH---")
+            return "web_search"
+        elif datasource == "vectorstore":
+            logger.info("---ROUTE QUESTION TO RAG---")
+            return "vectorstore"
+
+
+    async def agrade_generation_v_documents_and_question(self , state: GraphState, config=None):
+        """
+        Async counterpart of grade_generation_v_documents_and_question.
+        """
+        logger.debug("---CHECK HALLUCINATIONS---")
+        question = state["question"]
+        documents = await asyncio.to_thread(self.chunk_store.resolve, state["documents"])
+        generation = state["generation"]
+        source_type = state.get("source_type", "unknown")
+
+        grounded, useful = await self._agrade_generation(question, documents, generation)
+        return self._generation_decision(grounded, useful, source_type, self.retry_controller.exhausted(config))
+
+
+    async def _agrade_generation(self, question, documents, generation):
+        """
+        Async counterpart of _grade_generation, in parallel mode the answer grade is cancelled
+        once the generation is found ungrounded.
+        """
+        if self.generation_grading_mode == "combined":
+            try:
+                result = await self.generation_grader.ainvoke({"documents": documents, "question": question, "generation": generation})
+                grades = self._parse_generation_grades(result)
+            except Exception as e:
+                logger.warning(f"---COMBINED GENERATION GRADER FAILED: {e}---")
+                grades = None
+            if grades is not None:
+                return grades
+            logger.warning("---COMBINED GENERATION GRADE UNUSABLE, FALLING BACK TO SEQUENTIAL GRADING---")
+
+        hallucination_input = {"documents": documents, "generation": generation}
+        answer_input = {"question": question, "generation": generation}
+        if self.generation_grading_mode == "parallel":
+            answer = asyncio.create_task(self.answer_grader.ainvoke(answer_input))
+            try:
+                grounded = self._binary_score(await self.hallucination_grader.ainvoke(hallucination_input))
+            except BaseException:
+                answer.cancel()
+                raise
+            if grounded != "yes":
+                answer.cancel()
+                return grounded, None
+            return grounded, self._binary_score(await answer)
+
+        grounded = self._binary_score(await self.hallucination_grader.ainvoke(hallucination_input))
+        if grounded != "yes":
+            return grounded, None
+        logger.debug("---GRADE GENERATION vs QUESTION---")
+        return grounded, self._binary_score(await self.answer_grader.ainvoke(answer_input))
+
+
+    async def aroute_after_speculation(self , state: GraphState):
+        """
+        Async counterpart of route_after_speculation, no I/O involved.
+        """
+        return self.route_after_speculation(state)
+
+
+    async def aroute_question_after_attempts(self , state: GraphState, config=None):
+        """
+        Async counterpart of route_question_after_attempts, no I/O involved.
+        """
+        return self.route_question_after_attempts(state, config)
+
+
+    async def aroute_after_transform(self , state: GraphState):
+        """
+        Async counterpart of route_after_transform, no I/O involved.
+        """
+        return self.route_after_transform(state)
+
+
+    async def ahuman_in_the_loop(self, state: GraphState):
+        """
+        Async counterpart of human_in_the_loop, no I/O involved.
+        """
+        return self.human_in_the_loop(state)
+
+
+    async def adecide_to_upload(self, state: GraphState):
+        """
+        Async counterpart of decide_to_upload, no I/O involved.
+        """
+        return self.decide_to_upload(state)
+
+
+    async def aaccept_answer(self, state: GraphState):
+        """
+        Async counterpart of accept_answer, no I/O involved.
+        """
+        return self.accept_answer(state)
+
+
+    async def asend_answer_vectorstore(self, state: GraphState):
+        """
+        Async counterpart of send_answer_vectorstore. The upload runs in a worker thread
+        so it does not block the event loop.
+        """
+        return await asyncio.to_thread(self.send_answer_vectorstore, state)
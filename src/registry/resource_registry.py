@@ -0,0 +1,120 @@
+from dotenv import load_dotenv
+import threading
+import httpx
+import os
+
+
+class resource_registry:
+    """
+    a class to represent the process wide registry of expensive, shareable resources
+
+    Resources (embedding model, LLM clients, vector store handles, pooled HTTP clients) are
+    created lazily on first use by the factory passed to get_or_create and reused afterwards.
+    """
+
+    def __init__(self):
+        load_dotenv()
+        self._resources = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+
+    def get_or_create(self, key, factory):
+        """
+        Return the resource registered under key, creating it with factory on first use.
+        Concurrent callers asking for the same key wait for a single creation.
+        """
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                resource = factory()
+                self._resources[key] = resource
+            return resource
+
+
+    def set(self, key, resource):
+        """
+        Register a resource explicitly, replacing any existing one (used to inject stand-ins).
+        """
+        with self._lock:
+            self._resources[key] = resource
+
+
+    def remove(self, key):
+        with self._lock:
+            return self._resources.pop(key, None)
+
+
+    def items(self, prefix):
+        """
+        Return the (key, resource) pairs registered under a key prefix.
+        """
+        with self._lock:
+            return [(key, resource) for key, resource in self._resources.items() if key.startswith(prefix)]
+
+
+    def get_http_client(self, provider):
+        """
+        Return the pooled synchronous HTTP client shared by every client of a provider.
+        """
+        return self.get_or_create(f"http_client:{provider}", lambda: httpx.Client(
+            limits=self._http_limits(), timeout=httpx.Timeout(60.0, connect=10.0)
+        ))
+
+
+    def get_async_http_client(self, provider):
+        """
+        Return the pooled asynchronous HTTP client shared by every client of a provider.
+        """
+        return self.get_or_create(f"http_async_client:{provider}", lambda: httpx.AsyncClient(
+            limits=self._http_limits(), timeout=httpx.Timeout(60.0, connect=10.0)
+        ))
+
+
+    @staticmethod
+    def _http_limits():
+        max_connections = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", 100))
+        max_keepalive = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", 20))
+        return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+
+
+    def close(self):
+        """
+        Close pooled HTTP clients and on-disk stores, shut worker pools down and forget every resource.
+        """
+        with self._lock:
+            resources = list(self._resources.items())
+            self._resources.clear()
+        for key, resource in resources:
+            if key.startswith("http_client:"):
+                resource.close()
+            elif key.startswith("process_pool:"):
+                resource.shutdown(cancel_futures=True)
+            elif key in ("ingestion_manifest", "llm_cache:store", "chunk_store", "semantic_cache:generations") or key.startswith(("local_index:", "bm25_index:")) \
+                    or (key.startswith("embedding:") and hasattr(resource, "close")):
+                resource.close()
+
+
+    async def aclose(self):
+        with self._lock:
+            async_clients = [r for k, r in self._resources.items() if k.startswith("http_async_client:")]
+        for client in async_clients:
+            await client.aclose()
+        self.close()
+
+
+
+_registry = resource_registry()
+
+
+def get_registry():
+    """
+    Return the process wide resource registry.
+    """
+    return _registry
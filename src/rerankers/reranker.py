@@ -0,0 +1,89 @@
+from src.embedding.embedding import embedding
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+import numpy as np
+import os
+
+RERANK_METHODS = ("embedding", "cross_encoder")
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# (keep, drop) thresholds per method, cosine similarity for "embedding", sigmoid score for "cross_encoder"
+DEFAULT_THRESHOLDS = {"embedding": (0.55, 0.2), "cross_encoder": (0.7, 0.05)}
+
+
+class reranker:
+    """
+    a class to represent a local relevance reranker placed in front of the LLM retrieval grader
+
+    Every retrieved document is scored against the question in one vectorized pass, either by
+    cosine similarity of the shared embeddings or by a small CPU cross-encoder. Documents scoring
+    at least `keep_threshold` are kept and below `drop_threshold` dropped without an LLM call,
+    only the borderline ones in between are left to the retrieval grader. Only the `top_n` best
+    scoring documents are considered at all.
+    """
+
+    def __init__(self, method=None, model_name=None, keep_threshold=None, drop_threshold=None, top_n=None):
+        load_dotenv()
+        self.method = method or os.getenv("RERANKER_METHOD", "embedding")
+        if self.method not in RERANK_METHODS:
+            raise ValueError(f"Unknown RERANKER_METHOD {self.method}, expected one of {RERANK_METHODS}")
+        self.model_name = model_name or os.getenv("RERANKER_MODEL", CROSS_ENCODER_MODEL)
+        default_keep, default_drop = DEFAULT_THRESHOLDS[self.method]
+        self.keep_threshold = float(keep_threshold if keep_threshold is not None else os.getenv("RERANKER_KEEP_THRESHOLD", default_keep))
+        self.drop_threshold = float(drop_threshold if drop_threshold is not None else os.getenv("RERANKER_DROP_THRESHOLD", default_drop))
+        if self.drop_threshold > self.keep_threshold:
+            raise ValueError("RERANKER_DROP_THRESHOLD must not be above RERANKER_KEEP_THRESHOLD")
+        self.top_n = int(top_n or os.getenv("RERANKER_TOP_N", 0)) or None
+
+        if self.method == "embedding":
+            self.embedder = embedding().get_embedding()
+        else:
+            self.cross_encoder = get_registry().get_or_create(
+                f"cross_encoder:{self.model_name}", self._create_cross_encoder
+            )
+
+
+    def _create_cross_encoder(self):
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(self.model_name, device="cpu")
+
+
+    @staticmethod
+    def _text(document):
+        return document.page_content if hasattr(document, "page_content") else str(document)
+
+
+    def score(self, question, documents):
+        """
+        Return one relevance score per document, in order.
+        """
+        if not documents:
+            return np.zeros(0, dtype=np.float32)
+        texts = [self._text(d) for d in documents]
+        if self.method == "cross_encoder":
+            logits = np.asarray(self.cross_encoder.predict([(question, t) for t in texts]), dtype=np.float32)
+            return 1.0 / (1.0 + np.exp(-logits))
+
+        query = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        matrix = np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        norms[norms == 0] = 1.0
+        return matrix @ query / norms
+
+
+    def decide(self, question, documents):
+        """
+        Return the scores and one decision per document: "yes" to keep, "no" to drop, None when
+        the score is borderline and the retrieval grader has to decide.
+        """
+        scores = self.score(question, documents)
+        considered = set(np.argsort(-scores)[:self.top_n].tolist()) if self.top_n else set(range(len(documents)))
+        decisions = []
+        for i, score in enumerate(scores):
+            if i not in considered or score < self.drop_threshold:
+                decisions.append("no")
+            elif score >= self.keep_threshold:
+                decisions.append("yes")
+            else:
+                decisions.append(None)
+        return scores, decisions
+
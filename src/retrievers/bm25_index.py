@@ -0,0 +1,245 @@
+"""
+Incremental BM25 index over the chunks of a collection.
+
+Usage:
+    python -m src.retrievers.bm25_index rebuild [--collection name]
+    python -m src.retrievers.bm25_index status [--collection name]
+"""
+from langchain_core.documents import Document
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+from collections import Counter
+import threading
+import argparse
+import sqlite3
+import math
+import json
+import time
+import os
+import re
+
+load_dotenv()
+
+# Tokens joined by a dash, dot or underscore stay whole, names and versions such as "gpt-4o" match exactly
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how i in is it its of on or that the this to was
+were what when where which who why will with you your do does did can about into than then
+""".split())
+
+
+def tokenize(text):
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    # Compound tokens are also indexed by their parts so "gpt-4o" matches "gpt 4o"
+    parts = [part for token in tokens if not token.isalnum() for part in re.split(r"[-_.]", token)]
+    return [t for t in tokens + parts if t not in STOPWORDS]
+
+
+
+class bm25_index:
+    """
+    a class to represent an incremental BM25 inverted index over the chunks of a collection
+
+    Postings, document lengths and document frequencies live in `index_dir`/<collection>/bm25.sqlite
+    and are updated in place on every upsert or delete, so nothing is ever rebuilt in bulk
+    except on request. Chunks are keyed by the same ids as in the vector store.
+    """
+
+    def __init__(self, collection_name, index_dir=None, k1=None, b=None):
+        self.collection_name = collection_name
+        self.k1 = float(k1 or os.getenv("BM25_K1", 1.5))
+        self.b = float(b or os.getenv("BM25_B", 0.75))
+        self.directory = os.path.join(index_dir or os.getenv("LOCAL_INDEX_DIR", ".local_index"), collection_name)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.directory, "bm25.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            );
+            CREATE INDEX IF NOT EXISTS postings_by_doc ON postings (doc_id);
+            CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        self._conn.commit()
+        self._doc_count, self._total_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+        ).fetchone()
+
+
+    def _remove(self, doc_ids):
+        removed = 0
+        for doc_id in doc_ids:
+            row = self._conn.execute("SELECT length FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                continue
+            terms = [t for (t,) in self._conn.execute("SELECT term FROM postings WHERE doc_id = ?", (doc_id,))]
+            self._conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(t,) for t in terms])
+            self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+            self._doc_count -= 1
+            self._total_length -= row[0]
+            removed += 1
+        if removed:
+            self._conn.execute("DELETE FROM terms WHERE df <= 0")
+        return removed
+
+
+    def upsert(self, ids, texts, metadatas=None):
+        """
+        Index chunks, replacing any previous version of the same ids.
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        # The last version of an id repeated in the batch wins
+        chunks = {doc_id: (text, metadata) for doc_id, text, metadata in zip(ids, texts, metadatas)}
+        with self._lock, self._conn:
+            self._remove(list(chunks))
+            for doc_id, (text, metadata) in chunks.items():
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self._conn.execute(
+                    "INSERT INTO docs (doc_id, length, content, metadata) VALUES (?, ?, ?, ?)",
+                    (doc_id, length, text, json.dumps(metadata, default=str))
+                )
+                self._conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                                       [(term, doc_id, tf) for term, tf in counts.items()])
+                self._conn.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in counts]
+                )
+                self._doc_count += 1
+                self._total_length += length
+            self._conn.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                                   [("synced_at", str(time.time()))])
+
+
+    def delete(self, ids):
+        with self._lock, self._conn:
+            return self._remove(list(ids)) > 0
+
+
+    def search(self, query, k=4):
+        """
+        Return the k best (Document, BM25 score) pairs for the query.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            if not self._doc_count:
+                return []
+            placeholders = ",".join("?" * len(terms))
+            df = dict(self._conn.execute(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms).fetchall())
+            postings = self._conn.execute(
+                f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id "
+                f"WHERE p.term IN ({placeholders})", terms
+            ).fetchall()
+            doc_count, average_length = self._doc_count, self._total_length / self._doc_count
+
+            scores = {}
+            for term, doc_id, tf, length in postings:
+                idf = math.log(1 + (doc_count - df[term] + 0.5) / (df[term] + 0.5))
+                norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            if not best:
+                return []
+            rows = dict((row[0], row[1:]) for row in self._conn.execute(
+                f"SELECT doc_id, content, metadata FROM docs WHERE doc_id IN ({','.join('?' * len(best))})",
+                [doc_id for doc_id, _ in best]
+            ))
+        return [
+            (Document(page_content=rows[doc_id][0], metadata=json.loads(rows[doc_id][1]), id=doc_id), score)
+            for doc_id, score in best
+        ]
+
+
+    def rebuild(self, source_vectorstore):
+        """
+        Re-index every chunk of the source collection.
+
+        Returns:
+            dict: the number of chunks indexed and the rebuild duration
+        """
+        start = time.perf_counter()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("DELETE FROM docs")
+            self._doc_count, self._total_length = 0, 0
+        source_vectorstore.astra_env.ensure_db_setup()
+        # The default projection leaves the vectors out, only text and metadata are needed
+        batch = []
+        for raw in source_vectorstore.astra_env.collection.find({}):
+            document = source_vectorstore.document_codec.decode(raw)
+            if document is None:
+                continue
+            batch.append(document)
+            if len(batch) >= 500:
+                self.upsert([d.id for d in batch], [d.page_content for d in batch], [d.metadata for d in batch])
+                batch = []
+        if batch:
+            self.upsert([d.id for d in batch], [d.page_content for d in batch], [d.metadata for d in batch])
+        return {"chunks": self._doc_count, "seconds": round(time.perf_counter() - start, 2)}
+
+
+    def status(self):
+        with self._lock:
+            terms = self._conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+            synced_at = self._conn.execute("SELECT value FROM meta WHERE name = 'synced_at'").fetchone()
+        return {
+            "chunks": self._doc_count, "terms": terms,
+            "average_length": self._total_length / self._doc_count if self._doc_count else 0.0,
+            "synced_at": float(synced_at[0]) if synced_at else None,
+        }
+
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+
+def bm25_index_enabled():
+    return os.getenv("BM25_INDEX_ENABLED", "False").lower() in ["true", "yes", "1"] \
+        or os.getenv("RETRIEVER_HYBRID", "False").lower() in ["true", "yes", "1"]
+
+
+def get_bm25_index(collection_name, enabled=None):
+    """
+    Return the process wide BM25 index of a collection, or None when it is disabled.
+    """
+    if not (bm25_index_enabled() if enabled is None else enabled):
+        return None
+    return get_registry().get_or_create(f"bm25_index:{collection_name}", lambda: bm25_index(collection_name))
+
+
+def main():
+    from src.vectorstores.astra_vectorstore import astra_vectorstore, DEFAULT_COLLECTION
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "status"])
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    args = parser.parse_args()
+
+    index = bm25_index(args.collection)
+    if args.command == "rebuild":
+        print(json.dumps(index.rebuild(astra_vectorstore(args.collection).get_vectorstore()), indent=2))
+    else:
+        print(json.dumps(index.status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
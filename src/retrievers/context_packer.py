@@ -0,0 +1,107 @@
+from langchain_core.documents import Document
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class context_packer:
+    """
+    a class to represent the packing of retrieved documents into the generation prompt
+
+    Documents are taken in rank order. A document whose word 3-shingles overlap an already packed
+    one by at least `dedup_threshold` (Jaccard) is dropped as a near duplicate, the others are
+    packed while they fit in the token budget. A first document larger than the whole budget is
+    truncated so the context is never empty.
+    """
+
+    def __init__(self, dedup_threshold=None, encoding_name=None):
+        load_dotenv()
+        self.dedup_threshold = float(dedup_threshold or os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.9))
+        self.encoding_name = encoding_name or os.getenv("CONTEXT_TOKEN_ENCODING", "cl100k_base")
+        self.encoding = self._get_encoding()
+
+
+    def _get_encoding(self):
+        try:
+            import tiktoken
+            return get_registry().get_or_create(f"tokenizer:{self.encoding_name}",
+                                                lambda: tiktoken.get_encoding(self.encoding_name))
+        except Exception as e:
+            # The encoding files are downloaded on first use, offline the size is estimated
+            logger.warning(f"tiktoken encoding {self.encoding_name} unavailable, estimating tokens: {e}")
+            return None
+
+
+    def count_tokens(self, text):
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+    def _truncate(self, text, tokens):
+        if self.encoding is None:
+            return text[:tokens * 4]
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:tokens])
+
+
+    @staticmethod
+    def _shingles(text):
+        words = WORD_PATTERN.findall(text.lower())
+        if len(words) < 3:
+            return {tuple(words)}
+        return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+    @staticmethod
+    def _text(document):
+        return document.page_content if hasattr(document, "page_content") else str(document)
+
+
+    def pack(self, documents, token_budget):
+        """
+        Return the documents that fit in token_budget, near duplicates removed. A single document
+        comes back as a single document.
+        """
+        single = not isinstance(documents, list)
+        documents = [documents] if single else documents
+        if not documents:
+            return documents
+
+        packed, packed_shingles, used = [], [], 0
+        for document in documents:
+            text = self._text(document)
+            shingles = self._shingles(text)
+            if any(len(shingles & other) / len(shingles | other) >= self.dedup_threshold for other in packed_shingles):
+                continue
+            tokens = self.count_tokens(text)
+            if used + tokens > token_budget:
+                if packed:
+                    # Smaller documents further down may still fit
+                    continue
+                text = self._truncate(text, token_budget)
+                tokens = token_budget
+                document = Document(page_content=text, metadata=getattr(document, "metadata", {}),
+                                    id=getattr(document, "id", None))
+            packed.append(document)
+            packed_shingles.append(shingles)
+            used += tokens
+
+        if len(packed) < len(documents):
+            logger.debug(f"---CONTEXT PACKED: {len(packed)} OF {len(documents)} DOCUMENTS, {used} TOKENS---")
+        return packed[0] if single else packed
+
+
+    @classmethod
+    def format(cls, documents):
+        """
+        Join the document texts for the prompt, without the Document reprs and metadata.
+        """
+        if not isinstance(documents, list):
+            documents = [documents]
+        return "\n\n".join(cls._text(d) for d in documents)
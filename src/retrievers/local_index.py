@@ -0,0 +1,546 @@
+"""
+Local ANN mirror of an Astra DB collection.
+
+Usage:
+    python -m src.retrievers.local_index rebuild [--collection name]
+    python -m src.retrievers.local_index status [--collection name]
+    python -m src.retrievers.local_index compact [--collection name]
+"""
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+from src.embedding.embedding import embedding
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+import numpy as np
+import threading
+import argparse
+import logging
+import sqlite3
+import json
+import time
+import uuid
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LOCAL_INDEX_TYPES = ("hnsw", "flat")
+# Metadata field stamped on every chunk written to a source collection, in epoch seconds
+INGESTED_AT_FIELD = "ingested_at"
+
+
+def stamp_ingested(metadatas):
+    """
+    Return copies of chunk metadatas stamped with the time they are written to the source
+    collection, the sync marker the mirrors compare against.
+    """
+    now = time.time()
+    return [{**(metadata or {}), INGESTED_AT_FIELD: now} for metadata in metadatas]
+
+
+class local_index(VectorStore):
+    """
+    a class to represent a local ANN index mirroring one Astra DB collection
+
+    Layout, in `index_dir`/<collection>:
+        base.faiss  - bulk built index, memory mapped read only so it opens instantly
+        docs.sqlite - content, metadata and normalized vector of every chunk
+    Upserts since the last build go to an in-RAM flat delta index, rebuilt from docs.sqlite on
+    start. A replaced or deleted chunk of the base index loses its docs.sqlite row, which acts
+    as its tombstone until the next compaction. Scores follow the Astra cosine scale (1 + cos) / 2.
+
+    The directory is shared by the processes of a host. Every build writes a new build version,
+    a process reloads the base index when it changes and adds the rows other processes upserted
+    to its delta before searching. Rebuilds keep the int ids of the chunks they already had.
+    """
+
+    def __init__(self, collection_name, embedder=None, index_dir=None, index_type=None):
+        import faiss
+
+        self.faiss = faiss
+        self.collection_name = collection_name
+        self.embedder = embedder or embedding().get_embedding()
+        self.index_type = index_type or os.getenv("LOCAL_INDEX_TYPE", "hnsw")
+        if self.index_type not in LOCAL_INDEX_TYPES:
+            raise ValueError(f"Unknown LOCAL_INDEX_TYPE {self.index_type}, expected one of {LOCAL_INDEX_TYPES}")
+        self.directory = os.path.join(index_dir or os.getenv("LOCAL_INDEX_DIR", ".local_index"), collection_name)
+        self.max_age_seconds = float(os.getenv("LOCAL_INDEX_MAX_AGE_SECONDS", 86400))
+        self.max_drift = int(os.getenv("LOCAL_INDEX_MAX_DRIFT", 0))
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._base_path = os.path.join(self.directory, "base.faiss")
+        self._conn = sqlite3.connect(os.path.join(self.directory, "docs.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                int_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL UNIQUE,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                in_base INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        self._conn.commit()
+        self._base = None
+        self._delta = None
+        self._build_version = None
+        self._delta_high = 0
+        self._load()
+
+
+    @property
+    def embeddings(self):
+        return self.embedder
+
+
+    def _meta(self, name, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+
+    def _set_meta(self, **values):
+        self._conn.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                               [(k, str(v)) for k, v in values.items()])
+
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+    def _new_delta(self, dimension):
+        return self.faiss.IndexIDMap2(self.faiss.IndexFlatIP(dimension))
+
+
+    def _load(self):
+        with self._lock:
+            # Read the version first, a build finishing meanwhile is picked up by the next refresh
+            self._build_version = self._meta("build_version")
+            self._base = None
+            if os.path.exists(self._base_path):
+                self._base = self.faiss.read_index(
+                    self._base_path, self.faiss.IO_FLAG_MMAP | self.faiss.IO_FLAG_READ_ONLY
+                )
+            dimension = self._dimension()
+            self._delta = self._new_delta(dimension) if dimension else None
+            self._delta_high = 0
+            self._catch_up()
+
+
+    def _catch_up(self):
+        """
+        Add the delta rows upserted since the last call, by any process. Row ids grow in commit
+        order, so the highest id seen is enough to know which rows are new.
+        """
+        rows = self._conn.execute(
+            "SELECT int_id, vector FROM docs WHERE in_base = 0 AND int_id > ? ORDER BY int_id", (self._delta_high,)
+        ).fetchall()
+        if not rows:
+            return
+        if self._delta is None:
+            self._delta = self._new_delta(len(rows[0][1]) // 4)
+        vectors = np.stack([np.frombuffer(v, dtype=np.float32) for _, v in rows])
+        self._delta.add_with_ids(vectors, np.array([i for i, _ in rows], dtype=np.int64))
+        self._delta_high = rows[-1][0]
+
+
+    def _refresh(self):
+        """
+        Pick up the builds and upserts of other processes, called with the lock held.
+        """
+        if self._meta("build_version") != self._build_version:
+            logger.info(f"---LOCAL INDEX {self.collection_name.upper()} REBUILT ELSEWHERE, RELOADING---")
+            self._load()
+        else:
+            self._catch_up()
+
+
+    def _dimension(self):
+        dimension = self._meta("dimension")
+        return int(dimension) if dimension else None
+
+
+    def is_ready(self):
+        """
+        True once a base index has been built.
+        """
+        return self._base is not None
+
+
+    def upsert_vectors(self, ids, texts, metadatas, vectors):
+        """
+        Mirror chunks already embedded and written to the source collection.
+        """
+        if not ids:
+            return
+        vectors = self._normalize(vectors)
+        metadatas = metadatas or [{} for _ in texts]
+        with self._lock:
+            if self._delta is None:
+                with self._conn:
+                    self._set_meta(dimension=vectors.shape[1])
+                self._delta = self._new_delta(vectors.shape[1])
+            self._remove(ids)
+            with self._conn:
+                for doc_id, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+                    self._conn.execute(
+                        "INSERT INTO docs (doc_id, content, metadata, vector, in_base) VALUES (?, ?, ?, ?, 0)",
+                        (doc_id, text, json.dumps(metadata, default=str), vector.tobytes())
+                    )
+                self._set_meta(synced_at=datetime.now(timezone.utc).isoformat())
+                self._advance_synced_to(metadatas)
+            # The new rows, and those other processes committed before them, join the delta
+            self._catch_up()
+
+
+    def _advance_synced_to(self, metadatas):
+        """
+        Move the sync marker to the newest ingestion time among mirrored chunks, never back.
+        """
+        stamps = [float(m[INGESTED_AT_FIELD]) for m in metadatas if (m or {}).get(INGESTED_AT_FIELD) is not None]
+        if stamps:
+            self._conn.execute(
+                "INSERT INTO meta (name, value) VALUES ('synced_to', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = max(CAST(value AS REAL), CAST(excluded.value AS REAL))",
+                (str(max(stamps)),)
+            )
+
+
+    def _remove(self, ids):
+        rows = []
+        for start in range(0, len(ids), 500):
+            batch = list(ids[start:start + 500])
+            rows += self._conn.execute(
+                f"SELECT int_id, in_base FROM docs WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+        if not rows:
+            return 0
+        delta_ids = [i for i, in_base in rows if not in_base]
+        if delta_ids and self._delta is not None:
+            self._delta.remove_ids(np.array(delta_ids, dtype=np.int64))
+        with self._conn:
+            self._conn.executemany("DELETE FROM docs WHERE int_id = ?", [(i,) for i, _ in rows])
+        return len(rows)
+
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        texts = list(texts)
+        if ids is None:
+            raise ValueError("The local index mirrors the source collection, ids are required")
+        self.upsert_vectors(list(ids), texts, metadatas, self.embedder.embed_documents(texts))
+        return list(ids)
+
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        with self._lock:
+            return self._remove(list(ids)) > 0
+
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, collection_name="default", **kwargs):
+        store = cls(collection_name, embedder=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+
+    def _search(self, vector, fetch_k):
+        """
+        Return (int_id, cosine) pairs of the nearest live chunks over the base and delta indexes.
+        """
+        query = self._normalize(vector)
+        candidates = {}
+        with self._lock:
+            self._refresh()
+            live = dict(self._conn.execute("SELECT in_base, COUNT(*) FROM docs GROUP BY in_base").fetchall())
+            for index in (self._base, self._delta):
+                if index is None or index.ntotal == 0:
+                    continue
+                # Overfetch by the tombstone count so deleted chunks do not shrink the result
+                tombstones = index.ntotal - live.get(1 if index is self._base else 0, 0)
+                scores, int_ids = index.search(query, min(index.ntotal, fetch_k + max(0, tombstones)))
+                for score, int_id in zip(scores[0], int_ids[0]):
+                    if int_id >= 0:
+                        candidates[int(int_id)] = max(float(score), candidates.get(int(int_id), -1.0))
+        return sorted(candidates.items(), key=lambda item: item[1], reverse=True)
+
+
+    def _rows(self, int_ids):
+        if not int_ids:
+            return {}
+        rows = self._conn.execute(
+            f"SELECT int_id, doc_id, content, metadata, vector FROM docs WHERE int_id IN ({','.join('?' * len(int_ids))})",
+            list(int_ids)
+        ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+
+    def _to_document(self, row):
+        doc_id, content, metadata, _ = row
+        return Document(page_content=content, metadata=json.loads(metadata), id=doc_id)
+
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        results = []
+        hits = self._search(embedding, k * 4 if filter else k)
+        rows = self._rows([int_id for int_id, _ in hits])
+        for int_id, score in hits:
+            if int_id not in rows:
+                continue
+            document = self._to_document(rows[int_id])
+            if filter and any(document.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            results.append((document, (1.0 + score) / 2.0))
+            if len(results) == k:
+                break
+        return results
+
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedder.embed_query(query), k, **kwargs)
+
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        hits = self._search(embedding, fetch_k)
+        rows = self._rows([int_id for int_id, _ in hits])
+        candidates = [rows[int_id] for int_id, _ in hits if int_id in rows]
+        if not candidates:
+            return []
+        vectors = [np.frombuffer(row[3], dtype=np.float32) for row in candidates]
+        selected = maximal_marginal_relevance(
+            self._normalize(embedding)[0], vectors, k=min(k, len(candidates)), lambda_mult=lambda_mult
+        )
+        return [self._to_document(candidates[i]) for i in selected]
+
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedder.embed_query(query), k, fetch_k, lambda_mult, **kwargs
+        )
+
+
+    def _write_base(self, int_ids, vectors):
+        """
+        Build a new base index from vectors and swap it in atomically.
+        """
+        dimension = vectors.shape[1]
+        if self.index_type == "hnsw":
+            inner = self.faiss.IndexHNSWFlat(dimension, int(os.getenv("LOCAL_INDEX_HNSW_M", 32)),
+                                             self.faiss.METRIC_INNER_PRODUCT)
+            inner.hnsw.efConstruction = int(os.getenv("LOCAL_INDEX_HNSW_EF_CONSTRUCTION", 200))
+            inner.hnsw.efSearch = int(os.getenv("LOCAL_INDEX_HNSW_EF_SEARCH", 64))
+        else:
+            inner = self.faiss.IndexFlatIP(dimension)
+        index = self.faiss.IndexIDMap2(inner)
+        if len(int_ids):
+            index.add_with_ids(vectors, np.asarray(int_ids, dtype=np.int64))
+        temporary = self._base_path + ".tmp"
+        self.faiss.write_index(index, temporary)
+        os.replace(temporary, self._base_path)
+
+
+    def rebuild(self, source_vectorstore, page_size=None):
+        """
+        Rebuild the whole mirror from the source collection, with the vectors it stores.
+
+        Returns:
+            dict: the number of chunks mirrored and the rebuild duration
+        """
+        start = time.perf_counter()
+        source_vectorstore.astra_env.ensure_db_setup()
+        cursor = source_vectorstore.astra_env.collection.find({}, projection={"*": True})
+
+        # Chunks keep their int id, so a process still searching the previous base resolves them
+        upsert = (
+            "INSERT INTO docs (doc_id, content, metadata, vector, in_base) VALUES (?, ?, ?, ?, 1) "
+            "ON CONFLICT(doc_id) DO UPDATE SET content = excluded.content, metadata = excluded.metadata, "
+            "vector = excluded.vector, in_base = 1"
+        )
+        with self._lock:
+            synced_to = None
+            with self._conn:
+                self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS rebuilt (doc_id TEXT PRIMARY KEY)")
+                self._conn.execute("DELETE FROM rebuilt")
+                batch = []
+                for raw in cursor:
+                    decoded = source_vectorstore.full_decode_astra_db_found_document(raw)
+                    if decoded is None or decoded.embedding is None:
+                        continue
+                    ingested_at = decoded.document.metadata.get(INGESTED_AT_FIELD)
+                    if ingested_at is not None:
+                        synced_to = max(float(ingested_at), synced_to or 0.0)
+                    batch.append((decoded.id, decoded.document.page_content,
+                                  json.dumps(decoded.document.metadata, default=str),
+                                  self._normalize(decoded.embedding)[0].tobytes()))
+                    if len(batch) >= (page_size or 1000):
+                        self._write_rebuilt(upsert, batch)
+                        batch = []
+                if batch:
+                    self._write_rebuilt(upsert, batch)
+                self._conn.execute("DELETE FROM docs WHERE doc_id NOT IN (SELECT doc_id FROM rebuilt)")
+                self._conn.execute("DELETE FROM rebuilt")
+                if synced_to is None:
+                    self._conn.execute("DELETE FROM meta WHERE name = 'synced_to'")
+                else:
+                    self._set_meta(synced_to=synced_to)
+            count = self._compact()
+            with self._conn:
+                self._set_meta(built_at=datetime.now(timezone.utc).isoformat(), built_at_epoch=time.time())
+        return {"chunks": count, "seconds": round(time.perf_counter() - start, 2)}
+
+
+    def _write_rebuilt(self, upsert, batch):
+        self._conn.executemany(upsert, batch)
+        self._conn.executemany("INSERT OR IGNORE INTO rebuilt (doc_id) VALUES (?)", [(row[0],) for row in batch])
+
+
+    def compact(self):
+        """
+        Merge the delta into a new base index and drop tombstones.
+        """
+        with self._lock:
+            return self._compact()
+
+
+    def _compact(self):
+        rows = self._conn.execute("SELECT int_id, vector FROM docs").fetchall()
+        if not rows:
+            dimension = self._dimension()
+            if dimension is None:
+                return 0
+            vectors = np.zeros((0, dimension), dtype=np.float32)
+        else:
+            vectors = np.stack([np.frombuffer(v, dtype=np.float32) for _, v in rows])
+        with self._conn:
+            self._set_meta(dimension=vectors.shape[1])
+            self._conn.execute("UPDATE docs SET in_base = 1")
+        self._write_base([i for i, _ in rows], vectors)
+        # Published once the new base is in place, other processes reload on seeing it
+        with self._conn:
+            self._set_meta(build_version=uuid.uuid4().hex)
+        self._load()
+        return len(rows)
+
+
+    @staticmethod
+    def _source_ahead(source_vectorstore, synced_to):
+        """
+        True when the source collection holds a chunk ingested after the sync marker.
+        """
+        newer = source_vectorstore.astra_env.collection.find_one(
+            {f"metadata.{INGESTED_AT_FIELD}": {"$gt": synced_to or 0.0}}, projection={"_id": True}
+        )
+        return newer is not None
+
+
+    @staticmethod
+    def _source_count(source_vectorstore):
+        """
+        Exact chunk count of the source collection, None above LOCAL_INDEX_COUNT_UPPER_BOUND.
+        """
+        collection = source_vectorstore.astra_env.collection
+        try:
+            return collection.count_documents({}, upper_bound=int(os.getenv("LOCAL_INDEX_COUNT_UPPER_BOUND", 1000)))
+        except Exception:
+            return None
+
+
+    def staleness(self, source_vectorstore=None):
+        """
+        Compare the mirror with the source collection.
+
+        The mirror is stale when a source chunk was ingested after the newest chunk it mirrors.
+        Deletions do not move that marker, they are caught by the count drift while the source
+        count is exact, and by the age of the last build otherwise.
+
+        Returns:
+            dict: local and source chunk counts, sync marker, age of the last build and whether
+                the mirror is stale
+        """
+        with self._lock:
+            self._refresh()
+            local_count = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+            built_at = self._meta("built_at")
+            built_at_epoch = float(self._meta("built_at_epoch", 0))
+            synced_at = self._meta("synced_at")
+            synced_to = self._meta("synced_to")
+        synced_to = float(synced_to) if synced_to is not None else None
+        age = time.time() - built_at_epoch if built_at_epoch else None
+        report = {
+            "ready": self.is_ready(), "local_count": local_count, "build_version": self._build_version,
+            "built_at": built_at, "synced_at": synced_at, "synced_to": synced_to, "age_seconds": age,
+        }
+        stale = not self.is_ready() or (self.max_age_seconds > 0 and (age is None or age > self.max_age_seconds))
+        if source_vectorstore is not None:
+            source_vectorstore.astra_env.ensure_db_setup()
+            report["source_ahead"] = self._source_ahead(source_vectorstore, synced_to)
+            report["source_count"] = self._source_count(source_vectorstore)
+            report["drift"] = abs(report["source_count"] - local_count) if report["source_count"] is not None else None
+            stale = stale or report["source_ahead"] or (report["drift"] is not None and report["drift"] > self.max_drift)
+        report["stale"] = stale
+        return report
+
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+
+def local_index_enabled():
+    return os.getenv("LOCAL_INDEX_ENABLED", "False").lower() in ["true", "yes", "1"] \
+        or os.getenv("RETRIEVER_BACKEND", "astra") == "local"
+
+
+def get_local_index(collection_name):
+    """
+    Return the process wide mirror of a collection, or None when the local index is disabled.
+    """
+    if not local_index_enabled():
+        return None
+    return get_registry().get_or_create(f"local_index:{collection_name}", lambda: local_index(collection_name))
+
+
+def main():
+    from src.vectorstores.astra_vectorstore import astra_vectorstore, DEFAULT_COLLECTION
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "status", "compact"])
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    args = parser.parse_args()
+
+    index = local_index(args.collection)
+    if args.command == "rebuild":
+        print(json.dumps(index.rebuild(astra_vectorstore(args.collection).get_vectorstore()), indent=2))
+    elif args.command == "compact":
+        print(json.dumps({"chunks": index.compact()}, indent=2))
+    else:
+        print(json.dumps(index.staleness(astra_vectorstore(args.collection).get_vectorstore()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
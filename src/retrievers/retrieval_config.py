@@ -0,0 +1,67 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, Literal
+from dotenv import load_dotenv
+import os
+
+
+class RetrievalConfig(BaseModel):
+    """
+    Retrieval parameters of one graph run, passed as config["configurable"]["retrieval"].
+    Unset fields take the RETRIEVAL_* environment defaults.
+    """
+
+    search_type: Literal["similarity", "mmr", "similarity_score_threshold"] = Field(
+        default_factory=lambda: os.getenv("RETRIEVAL_SEARCH_TYPE", "similarity"),
+        description="similarity, mmr for diverse results, or similarity_score_threshold"
+    )
+    k: int = Field(default_factory=lambda: int(os.getenv("RETRIEVAL_K", 4)), ge=1, le=50,
+                   description="Number of documents retrieved")
+    fetch_k: int = Field(default_factory=lambda: int(os.getenv("RETRIEVAL_FETCH_K", os.getenv("HYBRID_FETCH_K", 20))), ge=1, le=200,
+                         description="Candidates fetched before MMR selection or hybrid fusion")
+    lambda_mult: float = Field(default_factory=lambda: float(os.getenv("RETRIEVAL_LAMBDA_MULT", 0.5)), ge=0.0, le=1.0,
+                               description="MMR trade-off, 1 is pure relevance and 0 maximum diversity")
+    score_threshold: Optional[float] = Field(
+        default_factory=lambda: float(os.getenv("RETRIEVAL_SCORE_THRESHOLD")) if os.getenv("RETRIEVAL_SCORE_THRESHOLD") else None,
+        ge=0.0, le=1.0, description="Minimum relevance score, switches similarity search to similarity_score_threshold"
+    )
+    context_token_budget: int = Field(default_factory=lambda: int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000)), ge=1,
+                                      description="Tokens of retrieved context packed into the generation prompt")
+
+
+    @model_validator(mode="after")
+    def _check(self):
+        if self.search_type == "similarity" and self.score_threshold is not None:
+            self.search_type = "similarity_score_threshold"
+        if self.search_type == "similarity_score_threshold" and self.score_threshold is None:
+            raise ValueError("similarity_score_threshold needs a score_threshold")
+        self.fetch_k = max(self.fetch_k, self.k)
+        return self
+
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Read the retrieval parameters of a RunnableConfig, a dict or a RetrievalConfig.
+        """
+        load_dotenv()
+        retrieval = ((config or {}).get("configurable") or {}).get("retrieval")
+        if isinstance(retrieval, cls):
+            return retrieval
+        return cls(**(retrieval or {}))
+
+
+    def search_kwargs(self, k=None):
+        """
+        Arguments of as_retriever for this config, optionally with another k.
+        """
+        k = k or self.k
+        if self.search_type == "mmr":
+            return {"k": k, "fetch_k": max(self.fetch_k, k), "lambda_mult": self.lambda_mult}
+        if self.search_type == "similarity_score_threshold":
+            return {"k": k, "score_threshold": self.score_threshold}
+        return {"k": k}
+
+
+    def retriever_key(self):
+        # The context budget does not change which retriever serves the run
+        return tuple(sorted(self.model_dump(exclude={"context_token_budget"}).items()))
@@ -1,38 +1,165 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import WebBaseLoader
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings 
-from src.embedding.embedding import embedding 
-from langchain_astradb import AstraDBVectorStore
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field, PrivateAttr
+from src.vectorstores.astra_vectorstore import astra_vectorstore, DEFAULT_COLLECTION
+from src.retrievers.local_index import get_local_index
+from src.retrievers.bm25_index import get_bm25_index
+from src.retrievers.retrieval_config import RetrievalConfig
+from typing import Any
+import logging
+import asyncio
+import time
 import os 
 
+logger = logging.getLogger(__name__)
+
+RETRIEVER_BACKENDS = ("astra", "local")
+
+
+class tiered_retriever(BaseRetriever):
+    """
+    a class to represent a retriever serving from the local index while it is fresh
+
+    The Astra DB collection stays the source of truth: a stale, unbuilt or failing local
+    index sends the query to Astra. Staleness is checked at most every `staleness_check_seconds`.
+    """
+
+    local_index: Any
+    source: Any
+    search_type: str = "similarity"
+    search_kwargs: dict = Field(default_factory=dict)
+    staleness_check_seconds: float = 300.0
+
+    _checked_at: float = PrivateAttr(default=None)
+    _fresh: bool = PrivateAttr(default=False)
+
+
+    def _use_local(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at > self.staleness_check_seconds:
+            try:
+                self._fresh = not self.local_index.staleness(self.source)["stale"]
+            except Exception as e:
+                logger.warning(f"Local index staleness check failed: {e}")
+                self._fresh = False
+            self._checked_at = now
+        return self._fresh
+
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        if self._use_local():
+            try:
+                return self.local_index.as_retriever(
+                    search_type=self.search_type, search_kwargs=self.search_kwargs
+                ).invoke(query)
+            except Exception as e:
+                logger.warning(f"Local index search failed, falling back to Astra DB: {e}")
+        return self.source.as_retriever(search_type=self.search_type, search_kwargs=self.search_kwargs).invoke(query)
+
+
+
+class hybrid_retriever(BaseRetriever):
+    """
+    a class to represent a retriever fusing vector and BM25 results with reciprocal rank fusion
+
+    Both sides return `fetch_k` candidates, a chunk scores sum(1 / (rrf_k + rank)) over the lists
+    it appears in and the `k` best are kept. Chunks are matched by id, then by content.
+    """
+
+    vector_retriever: Any
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+
+    @staticmethod
+    def _key(document):
+        return document.id or document.page_content
+
+
+    def fuse(self, *rankings):
+        scores, documents = {}, {}
+        for ranking in rankings:
+            for rank, document in enumerate(ranking, start=1):
+                key = self._key(document)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank)
+                documents.setdefault(key, document)
+        best = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [documents[key] for key in best]
+
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        vector_documents = self.vector_retriever.invoke(query)
+        lexical_documents = [document for document, _ in self.lexical_index.search(query, self.fetch_k)]
+        return self.fuse(vector_documents, lexical_documents)
+
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        vector_documents, lexical_results = await asyncio.gather(
+            self.vector_retriever.ainvoke(query),
+            asyncio.to_thread(self.lexical_index.search, query, self.fetch_k),
+        )
+        return self.fuse(vector_documents, [document for document, _ in lexical_results])
+
+
 
 class retriever: 
-    def __init__(self):
-        self.embedder = embedding().get_embedding()
+    """
+    a class to represent the retriever of the RAG graph
+
+    Args:
+        backend: "astra" searches the Astra DB collection, "local" the local index mirror with
+            Astra DB as fallback. Defaults to the RETRIEVER_BACKEND environment variable, then "astra".
+        hybrid: fuse the vector results with a BM25 index through reciprocal rank fusion.
+            Defaults to the RETRIEVER_HYBRID environment variable, then False.
+        collection_name: the collection searched, a tenant collection or the shared default one.
+    """
+
+    def __init__(self, backend=None, hybrid=None, collection_name=DEFAULT_COLLECTION):
+        self.vectorstore = astra_vectorstore(collection_name)
+        self.backend = backend or os.getenv("RETRIEVER_BACKEND", "astra")
+        if self.backend not in RETRIEVER_BACKENDS:
+            raise ValueError(f"Unknown RETRIEVER_BACKEND {self.backend}, expected one of {RETRIEVER_BACKENDS}")
+        if hybrid is None:
+            hybrid = os.getenv("RETRIEVER_HYBRID", "False").lower() in ["true", "yes", "1"]
+        self.hybrid = hybrid
 
 
-    def get_retriever(self ): 
+    def get_retriever(self , retrieval_config=None): 
 
         try : 
-            vectorstore = AstraDBVectorStore(
-                embedding=self.embedder,
-                api_endpoint=os.getenv('ASTRA_DB_API_ENDPOINT'),
-                token=os.getenv('ASTRA_DB_APPLICATION_TOKEN'),
-                namespace= None,
-                collection_name="astra_vector_langchain", 
-            )
+            vectorstore = self.vectorstore.get_vectorstore()
+            config = retrieval_config or RetrievalConfig()
+
+            if self.hybrid:
+                return hybrid_retriever(
+                    vector_retriever=self._vector_retriever(vectorstore, config.search_type, config.search_kwargs(k=config.fetch_k)),
+                    lexical_index=get_bm25_index(self.vectorstore.collection_name, enabled=True),
+                    k=config.k,
+                    fetch_k=config.fetch_k,
+                    rrf_k=int(os.getenv("HYBRID_RRF_K", 60)),
+                )
 
-            retriever=vectorstore.as_retriever()
+            retriever=self._vector_retriever(vectorstore, config.search_type, config.search_kwargs())
             return retriever
         except Exception as e: 
             raise ValueError(f"Error occurred with exception : {e}")
-    
-
-
-
 
 
+    def _vector_retriever(self, vectorstore, search_type, search_kwargs):
+        if self.backend == "local":
+            return tiered_retriever(
+                local_index=get_local_index(self.vectorstore.collection_name),
+                source=vectorstore,
+                search_type=search_type,
+                search_kwargs=search_kwargs,
+                staleness_check_seconds=float(os.getenv("LOCAL_INDEX_STALENESS_CHECK_SECONDS", 300)),
+            )
+        return vectorstore.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+    
 
 
 
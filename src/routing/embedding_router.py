@@ -0,0 +1,145 @@
+from src.embedding.embedding import embedding
+from src.vectorstores.astra_vectorstore import astra_vectorstore
+from dotenv import load_dotenv
+import numpy as np
+import threading
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+# Topics the question_router prompt describes as covered by the vectorstore
+VECTORSTORE_TOPICS = [
+    "AI agents, planning, memory and tool use",
+    "prompt engineering techniques",
+    "adversarial attacks on large language models",
+]
+
+LABELLED_EXAMPLES = {
+    "vectorstore": [
+        "What are the components of an LLM powered autonomous agent?",
+        "How does task decomposition work for AI agents?",
+        "What is chain of thought prompting?",
+        "Explain few-shot prompting",
+        "What is a jailbreak prompt?",
+        "How do adversarial attacks on LLMs work?",
+        "What types of memory can an agent use?",
+        "What is retrieval augmented generation?",
+        "hi",
+        "hello, how are you?",
+    ],
+    "web_search": [
+        "What is the weather in Paris today?",
+        "Who won the football match last night?",
+        "What is the current price of bitcoin?",
+        "Latest news about the stock market",
+        "When is the next presidential election?",
+        "What movies are playing this weekend?",
+        "What is the exchange rate between the dollar and the euro today?",
+        "Who is the current CEO of OpenAI?",
+    ],
+}
+
+
+class embedding_router:
+    """
+    a class to represent a local question router
+
+    Questions are embedded with the shared MiniLM model and compared to one centroid per
+    datasource. The vectorstore centroid is built from the labelled examples and from chunks
+    sampled from the collection, the web_search centroid from the labelled examples. The
+    router only decides when the similarity margin between the two centroids is outside the
+    uncertain band, otherwise it returns None so the LLM question_router can decide.
+    """
+
+    def __init__(self, upper_margin=None, lower_margin=None, examples=None, sample_collection=None):
+        load_dotenv()
+        self.embedder = embedding().get_embedding()
+        self.upper_margin = float(upper_margin if upper_margin is not None else os.getenv("LOCAL_ROUTER_UPPER_MARGIN", 0.05))
+        self.lower_margin = float(lower_margin if lower_margin is not None else os.getenv("LOCAL_ROUTER_LOWER_MARGIN", -0.05))
+        self.examples = examples or self._load_examples()
+        if sample_collection is None:
+            sample_collection = os.getenv("LOCAL_ROUTER_SAMPLE_COLLECTION", "True").lower() in ["true", "yes", "1"]
+        self.sample_collection = sample_collection
+        self.samples_per_topic = int(os.getenv("LOCAL_ROUTER_SAMPLES_PER_TOPIC", 10))
+        self._centroids = None
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def _load_examples():
+        path = os.getenv("LOCAL_ROUTER_EXAMPLES")
+        if not path:
+            return LABELLED_EXAMPLES
+        with open(path) as f:
+            return json.load(f)
+
+
+    def _collection_samples(self):
+        try:
+            vectorstore = astra_vectorstore().get_vectorstore()
+            samples = []
+            for topic in VECTORSTORE_TOPICS:
+                samples.extend(d.page_content for d in vectorstore.similarity_search(topic, k=self.samples_per_topic))
+            return samples
+        except Exception as e:
+            logger.warning(f"Could not sample the collection for the local router, using labelled examples only: {e}")
+            return []
+
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+
+    def build_centroids(self):
+        """
+        Compute one normalized centroid per datasource.
+        """
+        centroids = {}
+        for datasource, examples in self.examples.items():
+            vectors = self._normalize(self.embedder.embed_documents(list(examples)))
+            centroid = vectors.mean(axis=0)
+            if datasource == "vectorstore" and self.sample_collection:
+                samples = self._collection_samples()
+                if samples:
+                    # Examples and collection chunks weigh the same in the centroid
+                    sample_centroid = self._normalize(self.embedder.embed_documents(samples)).mean(axis=0)
+                    centroid = (centroid + sample_centroid) / 2
+            centroids[datasource] = self._normalize(centroid)
+        return centroids
+
+
+    def _get_centroids(self):
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    self._centroids = self.build_centroids()
+        return self._centroids
+
+
+    def score(self, question):
+        """
+        Returns:
+            float: similarity to the vectorstore centroid minus similarity to the web_search centroid
+        """
+        centroids = self._get_centroids()
+        vector = self._normalize(self.embedder.embed_query(question))
+        return float(vector @ centroids["vectorstore"] - vector @ centroids["web_search"])
+
+
+    def route(self, question):
+        """
+        Returns:
+            tuple: ("vectorstore" | "web_search" | None, margin), None when the margin falls in
+                the uncertain band
+        """
+        margin = self.score(question)
+        if margin >= self.upper_margin:
+            return "vectorstore", margin
+        if margin <= self.lower_margin:
+            return "web_search", margin
+        return None, margin
@@ -0,0 +1,229 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from src.cache.llm_cache import served_from_cache
+from src.embedding.embedding import embedding
+from src.registry.resource_registry import get_registry
+from collections import OrderedDict
+from dotenv import load_dotenv
+import numpy as np
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class request_budget_tracker(BaseCallbackHandler):
+    """
+    a class to represent a callback handler tracking the LLM calls and wall time of the current
+    request of every thread
+
+    A request starts with the root run of the graph, a new question or a resumed thread alike.
+    LangGraph copies the thread_id of the run config into the metadata of every run. A call is
+    counted when it ends, unless the LLM response cache answered it. The last `max_threads`
+    threads are kept. One tracker is shared by the process, see
+    get_request_budget_tracker, and goes in the callbacks of every run config.
+    """
+
+    run_inline = True
+
+    def __init__(self, max_threads=None):
+        self.max_threads = int(max_threads or os.getenv("RETRY_MAX_TRACKED_THREADS", 10000))
+        self._requests = OrderedDict()
+        # Thread of every LLM call in flight, by run id
+        self._calls = {}
+        self._lock = threading.Lock()
+
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        thread_id = (metadata or {}).get("thread_id")
+        if parent_run_id is not None or thread_id is None:
+            return
+        with self._lock:
+            self._requests[thread_id] = {"started_at": time.monotonic(), "llm_calls": 0}
+            self._requests.move_to_end(thread_id)
+            while len(self._requests) > self.max_threads:
+                self._requests.popitem(last=False)
+
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        with self._lock:
+            self._calls[run_id] = (metadata or {}).get("thread_id")
+
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        with self._lock:
+            self._calls[run_id] = (metadata or {}).get("thread_id")
+
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            thread_id = self._calls.pop(run_id, None)
+            request = self._requests.get(thread_id)
+            if request is not None and not served_from_cache(response):
+                request["llm_calls"] += 1
+
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        # A failed call reached the provider, it counts too
+        with self._lock:
+            request = self._requests.get(self._calls.pop(run_id, None))
+            if request is not None:
+                request["llm_calls"] += 1
+
+
+    def usage(self, thread_id):
+        """
+        Return the LLM calls and seconds spent by the current request of the thread, None when
+        no request of the thread was seen.
+        """
+        with self._lock:
+            request = self._requests.get(thread_id)
+            if request is None:
+                return None
+            return request["llm_calls"], time.monotonic() - request["started_at"]
+
+
+def get_request_budget_tracker():
+    """
+    Return the process wide request budget tracker.
+    """
+    return get_registry().get_or_create("retry:budget_tracker", request_budget_tracker)
+
+
+
+class retry_controller:
+    """
+    a class to represent the retry controller of the retrieve -> grade_documents -> transform_query loop
+
+    Its state lives in the graph state under "retry" and follows one question and its rewrites:
+    the grade of every chunk already graded against the current question, so a chunk retrieved
+    again is not graded again until the question is rewritten, and the questions tried, so a
+    rewrite nearly the same as a previous one stops the retries. Their
+    embeddings stay out of the checkpointed state, the last `max_question_vectors` are kept in
+    process and the others are embedded again. The LLM calls and wall time of the request are read from the request budget
+    tracker, which must be in the callbacks of the run config for the budget to apply.
+
+    Args:
+        max_attempts: question rewrites before falling back to web search. Defaults to the
+            RETRY_MAX_ATTEMPTS environment variable, then 3.
+        max_llm_calls: LLM calls allowed per request before retries stop. Defaults to the
+            RETRY_MAX_LLM_CALLS environment variable, then 12.
+        max_seconds: wall time allowed per request before retries stop. Defaults to the
+            RETRY_MAX_SECONDS environment variable, then 60.
+        similarity_threshold: cosine similarity from which a rewrite counts as a question already
+            tried. Defaults to the RETRY_QUESTION_SIMILARITY environment variable, then 0.95.
+        max_question_vectors: question embeddings kept in process. Defaults to the
+            RETRY_MAX_QUESTION_VECTORS environment variable, then 1024.
+    """
+
+    def __init__(self, max_attempts=None, max_llm_calls=None, max_seconds=None, similarity_threshold=None,
+                 max_question_vectors=None):
+        load_dotenv()
+        self.max_attempts = int(max_attempts or os.getenv("RETRY_MAX_ATTEMPTS", 3))
+        self.max_llm_calls = int(max_llm_calls or os.getenv("RETRY_MAX_LLM_CALLS", 12))
+        self.max_seconds = float(max_seconds or os.getenv("RETRY_MAX_SECONDS", 60))
+        self.similarity_threshold = float(similarity_threshold or os.getenv("RETRY_QUESTION_SIMILARITY", 0.95))
+        self.max_question_vectors = int(max_question_vectors or os.getenv("RETRY_MAX_QUESTION_VECTORS", 1024))
+        self._embedder = None
+        self._vectors = OrderedDict()
+        self._vectors_lock = threading.Lock()
+
+
+    @staticmethod
+    def state(state):
+        """
+        Return the retry state of the question of the graph state, a new one when the question
+        is neither the original question nor one of its rewrites.
+        """
+        question = state["question"]
+        retry = state.get("retry")
+        if not retry or question not in retry.get("questions", []):
+            return {"questions": [question], "graded": {}, "graded_for": question, "stalled": False}
+        # Checkpoints written before the embeddings left the state still carry them
+        retry = {key: value for key, value in retry.items() if key != "question_vectors"}
+        # Grades only hold for the question they were given for
+        if retry.get("graded_for") != question:
+            retry = {**retry, "graded": {}, "graded_for": question}
+        return retry
+
+
+    def exhausted(self, config):
+        """
+        Return why the budget of the current request is spent, None while retries are allowed.
+        """
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        usage = get_request_budget_tracker().usage(thread_id)
+        if usage is None:
+            return None
+        llm_calls, seconds = usage
+        if llm_calls >= self.max_llm_calls:
+            return f"{llm_calls} LLM calls"
+        if seconds >= self.max_seconds:
+            return f"{seconds:.1f}s"
+        return None
+
+
+    @staticmethod
+    def pending(retry, refs):
+        """
+        Return the chunk references whose grade is not known yet, each chunk once.
+        """
+        graded = retry["graded"]
+        pending, keys = [], set()
+        for ref in refs:
+            if ref["chunk"] not in graded and ref["chunk"] not in keys:
+                keys.add(ref["chunk"])
+                pending.append(ref)
+        return pending
+
+
+    @staticmethod
+    def record_grades(retry, refs, graded_refs, grades):
+        """
+        Return the retry state with the grades of graded_refs, and the grade of every reference
+        in order, "no" for a chunk that could not be graded.
+        """
+        graded = {**retry["graded"], **{ref["chunk"]: g for ref, g in zip(graded_refs, grades)}}
+        if len(graded_refs) < len(refs):
+            logger.info(f"---GRADES REUSED FOR {len(refs) - len(graded_refs)} ALREADY GRADED DOCUMENTS---")
+        return {**retry, "graded": graded}, [graded.get(ref["chunk"], "no") for ref in refs]
+
+
+    def _embed(self, question):
+        with self._vectors_lock:
+            vector = self._vectors.get(question)
+            if vector is not None:
+                self._vectors.move_to_end(question)
+                return vector
+        if self._embedder is None:
+            self._embedder = embedding().get_embedding()
+        vector = np.asarray(self._embedder.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        with self._vectors_lock:
+            self._vectors[question] = vector
+            while len(self._vectors) > self.max_question_vectors:
+                self._vectors.popitem(last=False)
+        return vector
+
+
+    def record_question(self, retry, question):
+        """
+        Return the retry state with the rewritten question added, "stalled" when the rewrite is
+        nearly the same as a question already tried. The grades of the previous question are
+        dropped, the chunks are graded again against the rewrite.
+        """
+        questions = retry["questions"] + [question]
+        retry = {**retry, "graded": {}, "graded_for": question}
+        try:
+            vectors = np.stack([self._embed(q) for q in questions])
+        except Exception as e:
+            logger.warning(f"---QUESTION EMBEDDING FAILED, REWRITE NOT COMPARED: {e}---")
+            return {**retry, "questions": questions, "stalled": False}
+
+        similarity = float(np.max(vectors[:-1] @ vectors[-1]))
+        stalled = similarity >= self.similarity_threshold
+        if stalled:
+            logger.info(f"---REWRITE REPEATS A PREVIOUS QUESTION (SIMILARITY {similarity:.3f})---")
+        return {**retry, "questions": questions, "stalled": stalled}
@@ -7,6 +7,15 @@ class RAG(BaseModel) :
     source_documents : List[str] = Field(description="The source documents used to generate the answer")
 
 
+class ChunkRef(TypedDict, total=False):
+    """
+    Reference to a document body of the chunk store, see src.states.chunk_store.
+    """
+
+    chunk: str  # sha256 of the document text
+    score: float  # score of the document metadata, when it has one
+
+
 class GraphState(TypedDict):
     """
     Represents the state of our graph.
@@ -14,15 +23,28 @@ class GraphState(TypedDict):
     Attributes:
         question: question
         generation: LLM generation
-        documents: list of documents
+        documents: chunk references of the documents, their bodies are in the chunk store
+        answer_status: whether the generation was accepted, used to fill the semantic cache
+        cache_question: question the accepted answer is cached under, None when it is not cached
+        cache_generation: semantic cache generation read when the run started, see src.cache.semantic_cache
+        retry: retry controller state of the question, see src.routing.retry_controller
+        tenant: tenant whose collection is searched and written, None for the shared collection
+        retrieval: retrieval parameters overriding the defaults, restored in the config of a resumed run
     """
 
     question: str
     generation: str
     number_of_document_tries: int
-    documents: List[str]
+    documents: List[ChunkRef]
     upload_status: str
     source_type: str  # "vectorstore" or "websearch"
+    answer_status: str  # "accepted" once the generation passed grading or was approved by a human
+    cache_question: str  # set by the API at the start of a run, kept for the resumed run
+    cache_generation: int  # an answer is only cached while the generation is unchanged
+    datasource: str  # routing decision recorded by speculative routing
+    retry: dict  # chunks already graded and questions already tried for the current question
+    tenant: str  # selects the collection, see src.vectorstores.astra_vectorstore.collection_for
+    retrieval: dict  # RetrievalConfig.model_dump() of the request, None for the defaults
 
 
 
@@ -0,0 +1,384 @@
+from collections import OrderedDict
+from langchain_core.documents import Document
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+import threading
+import hashlib
+import logging
+import sqlite3
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_BACKENDS = ("memory", "sqlite", "postgres", "redis")
+
+# Expired bodies are deleted at most this often by the SQL backends
+PURGE_INTERVAL_SECONDS = 60
+# A body read is only marked used again once this share of its TTL went by, reads rarely write
+TOUCH_FRACTION = 0.1
+
+
+def _missing(package, backend):
+    return ValueError(f"The {backend} chunk store backend requires the {package} package, install it with: pip install {package}")
+
+
+
+class chunk_missing(LookupError):
+    """
+    Raised when chunk references of the graph state have no body in the chunk store, the thread
+    outlived its documents or was checkpointed where the chunk store does not reach.
+    """
+
+    def __init__(self, keys):
+        super().__init__(f"{len(keys)} documents of the thread are not in the chunk store : "
+                         f"{', '.join(key[:12] for key in keys)}")
+        self.keys = keys
+
+
+
+class memory_chunk_store:
+    """
+    a class to represent an in-memory LRU store of document bodies, for the memory checkpointer
+
+    A body is kept `ttl_seconds` after it was last stored or read, and at most `max_entries`
+    bodies are kept, the least recently used are evicted first.
+    """
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Ordered by last use, the expired bodies are at the front
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evictions = 0
+
+
+    def _purge(self, now):
+        while self._entries:
+            key, (_, used_at) = next(iter(self._entries.items()))
+            if now - used_at <= self.ttl_seconds:
+                break
+            del self._entries[key]
+            self.expired += 1
+
+
+    def put(self, entries):
+        now = time.time()
+        with self._lock:
+            for key, entry in entries.items():
+                self._entries[key] = (entry, now)
+                self._entries.move_to_end(key)
+            self._purge(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def get(self, keys):
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            found = {}
+            for key in keys:
+                stored = self._entries.get(key)
+                if stored is not None:
+                    self._entries[key] = (stored[0], now)
+                    self._entries.move_to_end(key)
+                    found[key] = stored[0]
+            return found
+
+
+    def count(self):
+        with self._lock:
+            return len(self._entries)
+
+
+    def close(self):
+        pass
+
+
+
+class sql_chunk_store:
+    """
+    a class to represent document bodies stored in the database of the checkpointer, SQLite or
+    Postgres, so every worker resuming a thread finds them
+
+    A body is kept `ttl_seconds` after it was last stored or read, expired rows are deleted at
+    most every PURGE_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, backend, url, ttl_seconds):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.expired = 0
+        self.evictions = None
+        if backend == "sqlite":
+            self._conn = sqlite3.connect(url, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._pool = None
+            self._p = "?"
+        else:
+            try:
+                from psycopg_pool import ConnectionPool
+            except ImportError:
+                raise _missing("psycopg[binary,pool]", backend)
+            self._conn = None
+            self._pool = ConnectionPool(url, kwargs={"autocommit": True, "prepare_threshold": 0})
+            self._p = "%s"
+        self._execute("""
+            CREATE TABLE IF NOT EXISTS chunk_bodies (
+                key TEXT PRIMARY KEY,
+                id TEXT,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                used_at DOUBLE PRECISION NOT NULL
+            )
+        """)
+        self._execute("CREATE INDEX IF NOT EXISTS chunk_bodies_by_used_at ON chunk_bodies (used_at)")
+
+
+    def _execute(self, sql, params=(), many=False, fetch=False):
+        sql = sql.replace("{p}", self._p)
+        if self._pool is None:
+            with self._lock:
+                cursor = self._conn.executemany(sql, params) if many else self._conn.execute(sql, params)
+                return cursor.fetchall() if fetch else cursor.rowcount
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            if many:
+                cursor.executemany(sql, params)
+            else:
+                cursor.execute(sql, params)
+            return cursor.fetchall() if fetch else cursor.rowcount
+
+
+    def _purge(self, now):
+        if now - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = now
+        deleted = self._execute("DELETE FROM chunk_bodies WHERE used_at < {p}", (now - self.ttl_seconds,))
+        self.expired += max(deleted, 0)
+
+
+    def put(self, entries):
+        now = time.time()
+        self._execute(
+            "INSERT INTO chunk_bodies (key, id, content, metadata, used_at) VALUES ({p}, {p}, {p}, {p}, {p}) "
+            "ON CONFLICT (key) DO UPDATE SET used_at = excluded.used_at",
+            [(key, doc_id, content, metadata, now) for key, (doc_id, content, metadata) in entries.items()],
+            many=True
+        )
+        self._purge(now)
+
+
+    def get(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        # Stay below the SQLite bound parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            marks = ",".join([self._p] * len(batch))
+            rows = self._execute(
+                f"SELECT key, id, content, metadata FROM chunk_bodies WHERE key IN ({marks}) AND used_at >= {{p}}",
+                (*batch, now - self.ttl_seconds), fetch=True
+            )
+            found.update({key: (doc_id, content, metadata) for key, doc_id, content, metadata in rows})
+            self._execute(
+                f"UPDATE chunk_bodies SET used_at = {{p}} WHERE key IN ({marks}) AND used_at < {{p}}",
+                (now, *batch, now - self.ttl_seconds * TOUCH_FRACTION)
+            )
+        return found
+
+
+    def count(self):
+        return self._execute("SELECT COUNT(*) FROM chunk_bodies", fetch=True)[0][0]
+
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+        else:
+            with self._lock:
+                self._conn.close()
+
+
+
+class redis_chunk_store:
+    """
+    a class to represent document bodies stored in the Redis of the checkpointer, which expires
+    them `ttl_seconds` after they were last stored or read
+    """
+
+    PREFIX = "chunk_store:"
+
+    def __init__(self, url, ttl_seconds):
+        try:
+            import redis
+        except ImportError:
+            raise _missing("redis", "redis")
+        self.ttl_seconds = ttl_seconds
+        self._redis = redis.Redis.from_url(url)
+        self.expired = None
+        self.evictions = None
+
+
+    def put(self, entries):
+        pipeline = self._redis.pipeline(transaction=False)
+        for key, entry in entries.items():
+            pipeline.set(self.PREFIX + key, json.dumps(entry), ex=int(self.ttl_seconds))
+        pipeline.execute()
+
+
+    def get(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._redis.mget([self.PREFIX + key for key in keys])
+        found = {key: tuple(json.loads(value)) for key, value in zip(keys, values) if value is not None}
+        if found:
+            pipeline = self._redis.pipeline(transaction=False)
+            for key in found:
+                pipeline.expire(self.PREFIX + key, int(self.ttl_seconds))
+            pipeline.execute()
+        return found
+
+
+    def count(self):
+        # Counting would scan the whole keyspace of the checkpointer
+        return None
+
+
+    def close(self):
+        self._redis.close()
+
+
+
+class chunk_store:
+    """
+    a class to represent the store of the documents the graph state refers to
+
+    Bodies are content addressed, the sha256 of the text, id and metadata is the key, so a chunk
+    retrieved again by another attempt or another thread is stored once, while the same text
+    from another source keeps its own metadata. The score of a retrieval is not part of the
+    body: the graph state only carries chunk references, {"chunk": key} plus the "score" of the
+    document metadata when it has one, which keeps checkpoints small.
+
+    Bodies live next to the checkpoints, so every worker able to resume a thread finds its
+    documents. They are kept as long as a checkpoint referring to them may be, `ttl_seconds`
+    after their last use, and a reference without a body raises chunk_missing.
+
+    Args:
+        backend: one of CHUNK_STORE_BACKENDS. Defaults to the CHUNK_STORE_BACKEND environment
+            variable, then the CHECKPOINTER_BACKEND.
+        url: SQLite path, Postgres or Redis URL. Defaults to the CHUNK_STORE_URL environment
+            variable, then the CHECKPOINTER_URL of the same backend, then .chunk_store.sqlite.
+        ttl_seconds: defaults to the CHUNK_STORE_TTL_SECONDS environment variable, then the
+            longest of CHECKPOINT_TTL_SECONDS and CHECKPOINT_INTERRUPTED_TTL_SECONDS.
+        max_entries: bodies the memory backend keeps, CHUNK_STORE_MAX_ENTRIES, then 50000.
+    """
+
+    def __init__(self, backend=None, url=None, ttl_seconds=None, max_entries=None):
+        load_dotenv()
+        checkpointer_backend = os.getenv("CHECKPOINTER_BACKEND", "memory").lower()
+        self.backend = (backend or os.getenv("CHUNK_STORE_BACKEND", checkpointer_backend)).lower()
+        if self.backend not in CHUNK_STORE_BACKENDS:
+            raise ValueError(f"Unknown chunk store backend : {self.backend}, expected one of {CHUNK_STORE_BACKENDS}")
+        checkpointer_url = os.getenv("CHECKPOINTER_URL", ".checkpoints.sqlite" if checkpointer_backend == "sqlite" else None)
+        self.url = url or os.getenv("CHUNK_STORE_URL") \
+            or (checkpointer_url if self.backend == checkpointer_backend else None) \
+            or (".chunk_store.sqlite" if self.backend == "sqlite" else None)
+        if self.backend in ("postgres", "redis") and not self.url:
+            raise ValueError(f"CHUNK_STORE_URL or CHECKPOINTER_URL must be set for the {self.backend} chunk store backend")
+        self.ttl_seconds = float(ttl_seconds or os.getenv("CHUNK_STORE_TTL_SECONDS") or max(
+            float(os.getenv("CHECKPOINT_TTL_SECONDS", 24 * 3600)),
+            float(os.getenv("CHECKPOINT_INTERRUPTED_TTL_SECONDS", 7 * 24 * 3600))
+        ))
+
+        if self.backend == "memory":
+            self.store = memory_chunk_store(self.ttl_seconds, int(max_entries or os.getenv("CHUNK_STORE_MAX_ENTRIES", 50000)))
+        elif self.backend == "redis":
+            self.store = redis_chunk_store(self.url, self.ttl_seconds)
+        else:
+            self.store = sql_chunk_store(self.backend, self.url, self.ttl_seconds)
+        self.missing = 0
+
+
+    @staticmethod
+    def body(document):
+        """
+        Return the key and the (id, text, metadata) body of a document, its score left out.
+        """
+        metadata = {k: v for k, v in document.metadata.items() if k != "score"}
+        body = (getattr(document, "id", None), document.page_content, json.dumps(metadata, default=str, sort_keys=True))
+        return hashlib.sha256(json.dumps(body).encode("utf-8")).hexdigest(), body
+
+
+    def put(self, documents):
+        """
+        Store the documents and return their chunk references, in the same order.
+        """
+        refs, entries = [], {}
+        for document in documents:
+            key, entries[key] = self.body(document)
+            ref = {"chunk": key}
+            score = document.metadata.get("score")
+            if isinstance(score, (int, float)):
+                ref["score"] = float(score)
+            refs.append(ref)
+        if entries:
+            self.store.put(entries)
+        return refs
+
+
+    def get(self, refs):
+        """
+        Return the (reference, Document) pairs of the references, in order.
+
+        Raises:
+            chunk_missing: when a reference has no body in the store
+        """
+        refs = refs or []
+        entries = self.store.get({ref["chunk"] for ref in refs})
+        missing = list(dict.fromkeys(ref["chunk"] for ref in refs if ref["chunk"] not in entries))
+        if missing:
+            self.missing += len(missing)
+            raise chunk_missing(missing)
+        pairs = []
+        for ref in refs:
+            doc_id, content, metadata = entries[ref["chunk"]]
+            metadata = json.loads(metadata)
+            if "score" in ref:
+                metadata["score"] = ref["score"]
+            pairs.append((ref, Document(page_content=content, metadata=metadata, id=doc_id)))
+        return pairs
+
+
+    def resolve(self, refs):
+        """
+        Return the Documents of the chunk references, see get.
+        """
+        return [document for _, document in self.get(refs)]
+
+
+    def stats(self):
+        return {"backend": self.backend, "entries": self.store.count(), "ttl_seconds": self.ttl_seconds,
+                "expired": self.store.expired, "evictions": self.store.evictions, "missing": self.missing}
+
+
+    def close(self):
+        self.store.close()
+
+
+
+def get_chunk_store():
+    """
+    Return the process wide chunk store.
+    """
+    return get_registry().get_or_create("chunk_store", chunk_store)
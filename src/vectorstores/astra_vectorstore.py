@@ -0,0 +1,110 @@
+from langchain_astradb import AstraDBVectorStore
+from src.embedding.embedding import embedding
+from src.registry.resource_registry import get_registry
+from collections import OrderedDict
+from dotenv import load_dotenv
+import threading
+import os
+import re
+
+DEFAULT_COLLECTION = "astra_vector_langchain"
+
+# Astra DB collection names take up to 48 letters, digits and underscores, the prefix included
+TENANT_PATTERN = re.compile(r"^[A-Za-z0-9_]{1,32}$")
+
+
+def collection_for(tenant=None):
+    """
+    Return the collection of a tenant, the shared default collection without one.
+
+    Tenant collections are named TENANT_COLLECTION_PREFIX (default "tenant_") + tenant. When the
+    TENANTS environment variable lists tenants (comma separated), any other tenant is refused.
+    """
+    if not tenant:
+        return DEFAULT_COLLECTION
+    if not TENANT_PATTERN.match(tenant):
+        raise ValueError(f"Invalid tenant : {tenant}, expected 1 to 32 letters, digits or underscores")
+    allowed = os.getenv("TENANTS")
+    if allowed and tenant not in {t.strip() for t in allowed.split(",")}:
+        raise ValueError(f"Unknown tenant : {tenant}")
+    return f"{os.getenv('TENANT_COLLECTION_PREFIX', 'tenant_')}{tenant}"
+
+
+
+class vectorstore_pool:
+    """
+    a class to represent a bounded LRU pool of warm vector store handles of tenant collections
+
+    The least recently used handle is dropped once `max_size` collections are open, it is
+    opened again on its next use.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = int(max_size or os.getenv("VECTORSTORE_POOL_SIZE", 16))
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+
+    def get_or_create(self, collection_name, factory):
+        with self._lock:
+            handle = self._handles.get(collection_name)
+            if handle is not None:
+                self._handles.move_to_end(collection_name)
+                return handle
+        # Opening a collection is a round trip to Astra DB, other collections are not held up
+        handle = factory()
+        with self._lock:
+            handle = self._handles.setdefault(collection_name, handle)
+            self._handles.move_to_end(collection_name)
+            while len(self._handles) > self.max_size:
+                self._handles.popitem(last=False)
+                self.evictions += 1
+            return handle
+
+
+    def stats(self):
+        with self._lock:
+            return {"collections": list(self._handles), "evictions": self.evictions}
+
+
+
+class astra_vectorstore:
+    """
+    a class to represent the shared Astra DB vector store handle of a collection
+
+    The default collection stays open for the life of the process, tenant collections share
+    the vectorstore_pool.
+    """
+
+    def __init__(self, collection_name=DEFAULT_COLLECTION):
+        load_dotenv()
+        self.collection_name = collection_name
+
+
+    def _create_vectorstore(self):
+        api_endpoint = os.getenv('ASTRA_DB_API_ENDPOINT')
+        token = os.getenv('ASTRA_DB_APPLICATION_TOKEN')
+
+        if not api_endpoint or not token:
+            raise ValueError("Astra DB API endpoint or token not set in environment variables.")
+
+        return AstraDBVectorStore(
+            embedding=embedding().get_embedding(),
+            api_endpoint=api_endpoint,
+            token=token,
+            namespace=None,
+            collection_name=self.collection_name,
+        )
+
+
+    def get_vectorstore(self):
+        try:
+            registry = get_registry()
+            if self.collection_name == DEFAULT_COLLECTION:
+                return registry.get_or_create(f"vectorstore:{self.collection_name}", self._create_vectorstore)
+            return registry.get_or_create("vectorstore_pool", vectorstore_pool).get_or_create(
+                self.collection_name, self._create_vectorstore
+            )
+        except Exception as e:
+            raise ValueError(f"Error occurred with exception : {e}")
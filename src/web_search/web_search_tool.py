@@ -1,8 +1,10 @@
 from langchain_community.tools.tavily_search import TavilySearchResults
+from src.registry.resource_registry import get_registry
 
 class web_search_tool: 
     def __init__(self): 
-        self.tool = TavilySearchResults(k=3)
+        # One client per process, registered so it can be swapped for a stand-in
+        self.tool = get_registry().get_or_create("web_search:tavily", lambda: TavilySearchResults(k=3))
         
     def get_web_search_tool(self): 
         try: 
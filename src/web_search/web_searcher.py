@@ -0,0 +1,241 @@
+from langchain_core.documents import Document
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.web_search.web_search_tool import web_search_tool
+from src.chains.web_query_expander import web_query_expander
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+import threading
+import logging
+import asyncio
+import time
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class web_search_cache:
+    """
+    a class to represent a TTL cache of web search results per normalized query
+
+    Queries are lowercased with their whitespace and trailing punctuation collapsed. The least
+    recently used query is evicted once `max_entries` is reached.
+    """
+
+    def __init__(self, ttl_seconds=None, max_entries=None):
+        load_dotenv()
+        self.ttl_seconds = float(ttl_seconds or os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", 900))
+        self.max_entries = int(max_entries or os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", 1000))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def normalize(query):
+        return WHITESPACE_PATTERN.sub(" ", query.lower()).strip().rstrip("?!. ")
+
+
+    def get(self, query):
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] > self.ttl_seconds:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[0])
+
+
+    def set(self, query, results):
+        key = self.normalize(query)
+        with self._lock:
+            self._entries[key] = (list(results), time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+
+class web_searcher:
+    """
+    a class to represent the web search layer of the graph
+
+    Results are cached per normalized query. With `query_variants` above 1, the question is
+    searched while the web_query_expander writes the other variants, which are then searched
+    concurrently. The result lists are merged by rank, without repeating a URL, up to
+    `max_results`, and every result becomes its own Document with its URL in the metadata.
+
+    Args:
+        query_variants: queries searched per question, the question itself included. Defaults to
+            the WEB_SEARCH_QUERY_VARIANTS environment variable, then 1.
+        max_results: results kept after merging. Defaults to the WEB_SEARCH_MAX_RESULTS
+            environment variable, then 6.
+        cache: cache the results per query. Defaults to the WEB_SEARCH_CACHE_ENABLED environment
+            variable, then True.
+    """
+
+    def __init__(self, query_variants=None, max_results=None, cache=None):
+        load_dotenv()
+        self.tool = web_search_tool().get_web_search_tool()
+        self.query_variants = int(query_variants or os.getenv("WEB_SEARCH_QUERY_VARIANTS", 1))
+        self.max_results = int(max_results or os.getenv("WEB_SEARCH_MAX_RESULTS", 6))
+        if cache is None:
+            cache = os.getenv("WEB_SEARCH_CACHE_ENABLED", "True").lower() in ["true", "yes", "1"]
+        # Shared by every graph of the process
+        self.cache = get_registry().get_or_create("web_search_cache", web_search_cache) if cache else None
+        self.expander = web_query_expander().get_web_query_expander() if self.query_variants > 1 else None
+        self._pool = None
+
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="web_search")
+        return self._pool
+
+
+    def search(self, query):
+        """
+        Return the raw results of one query, from the cache when possible.
+        """
+        if self.cache is not None:
+            results = self.cache.get(query)
+            if results is not None:
+                return results
+        results = self.tool.invoke({"query": query})
+        if self.cache is not None:
+            self.cache.set(query, results)
+        return results
+
+
+    async def asearch(self, query):
+        if self.cache is not None:
+            results = self.cache.get(query)
+            if results is not None:
+                return results
+        results = await self.tool.ainvoke({"query": query})
+        if self.cache is not None:
+            self.cache.set(query, results)
+        return results
+
+
+    def _variant_input(self, question):
+        return {"question": question, "count": self.query_variants - 1}
+
+
+    def _parse_variants(self, question, result):
+        queries = result.get("queries") if isinstance(result, dict) else None
+        if not isinstance(queries, list):
+            logger.warning("---WEB QUERY VARIANTS UNUSABLE, SEARCHING THE QUESTION ONLY---")
+            return []
+        seen = {web_search_cache.normalize(question)}
+        variants = []
+        for query in queries:
+            if isinstance(query, str) and web_search_cache.normalize(query) not in seen:
+                seen.add(web_search_cache.normalize(query))
+                variants.append(query)
+        return variants[:self.query_variants - 1]
+
+
+    def _variants(self, question):
+        try:
+            return self._parse_variants(question, self.expander.invoke(self._variant_input(question)))
+        except Exception as e:
+            logger.warning(f"---WEB QUERY EXPANSION FAILED: {e}---")
+            return []
+
+
+    async def _avariants(self, question):
+        try:
+            return self._parse_variants(question, await self.expander.ainvoke(self._variant_input(question)))
+        except Exception as e:
+            logger.warning(f"---WEB QUERY EXPANSION FAILED: {e}---")
+            return []
+
+
+    def merge(self, rankings):
+        """
+        Interleave the result lists by rank, skipping URLs (or contents) already taken.
+        """
+        # Tavily reports some failures as a string instead of a result list
+        rankings = [r for r in rankings if isinstance(r, list)]
+        merged, seen = [], set()
+        for rank in range(max((len(r) for r in rankings), default=0)):
+            for ranking in rankings:
+                if rank >= len(ranking):
+                    continue
+                result = ranking[rank]
+                key = result.get("url") or result.get("content")
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append(result)
+        return merged[:self.max_results]
+
+
+    @staticmethod
+    def to_documents(results):
+        return [
+            Document(
+                page_content=r.get("content", ""),
+                metadata={"url": r.get("url"), "title": r.get("title"), "source": "websearch"},
+            )
+            for r in results
+        ]
+
+
+    def search_documents(self, question):
+        """
+        Search the question, and its variants when enabled, and return one Document per result.
+        """
+        if self.expander is None:
+            return self.to_documents(self.merge([self.search(question)]))
+
+        pool = self._executor()
+        first = pool.submit(self.search, question)
+        variants = self._variants(question)
+        others = [pool.submit(self.search, q) for q in variants]
+        rankings = []
+        for future in [first] + others:
+            try:
+                rankings.append(future.result())
+            except Exception as e:
+                # A failed variant only loses its results, the question itself must succeed
+                if future is first:
+                    raise
+                logger.warning(f"---WEB SEARCH VARIANT FAILED: {e}---")
+        return self.to_documents(self.merge(rankings))
+
+
+    async def asearch_documents(self, question):
+        """
+        Async counterpart of search_documents.
+        """
+        if self.expander is None:
+            return self.to_documents(self.merge([await self.asearch(question)]))
+
+        first = asyncio.create_task(self.asearch(question))
+        try:
+            variants = await self._avariants(question)
+            results = await asyncio.gather(*(self.asearch(q) for q in variants), return_exceptions=True)
+            rankings = [await first]
+        except BaseException:
+            first.cancel()
+            raise
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.warning(f"---WEB SEARCH VARIANT FAILED: {result}---")
+            else:
+                rankings.append(result)
+        return self.to_documents(self.merge(rankings))
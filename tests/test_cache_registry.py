@@ -0,0 +1,56 @@
+from src.registry.resource_registry import get_registry
+from src.cache import semantic_cache as semantic_cache_module
+from src.cache.llm_cache import get_llm_cache, llm_cache_stats, memory_llm_store
+import pytest
+
+
+class fake_semantic_cache:
+    def __init__(self, tenant=None):
+        self.tenant = tenant
+        self.invalidated = False
+
+    def invalidate(self):
+        self.invalidated = True
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setenv("SEMANTIC_CACHE_ENABLED", "true")
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "true")
+    monkeypatch.setattr(semantic_cache_module, "semantic_cache", fake_semantic_cache)
+    registry = get_registry()
+    registry.set("llm_cache:store", memory_llm_store())
+    yield registry
+    for prefix in ("llm_cache:", "semantic_cache:tenant:"):
+        for key, _ in registry.items(prefix):
+            registry.remove(key)
+
+
+def test_llm_caches_are_registry_resources(registry):
+    cache = get_llm_cache("retrieval_grader")
+    assert get_llm_cache("retrieval_grader") is cache
+    assert registry.items("llm_cache:chain:") == [("llm_cache:chain:retrieval_grader", cache)]
+    assert set(llm_cache_stats()["chains"]) == {"retrieval_grader"}
+    # Resetting the registry resets the caches
+    registry.remove("llm_cache:chain:retrieval_grader")
+    assert get_llm_cache("retrieval_grader") is not cache
+
+
+def test_semantic_caches_of_the_least_recent_tenants_are_dropped(registry, monkeypatch):
+    monkeypatch.setenv("SEMANTIC_CACHE_MAX_TENANTS", "2")
+    shared = semantic_cache_module.get_semantic_cache()
+    first = semantic_cache_module.get_semantic_cache("first")
+    assert semantic_cache_module.get_semantic_cache() is shared
+    semantic_cache_module.get_semantic_cache("second")
+    assert sorted(key for key, _ in registry.items("semantic_cache:tenant:")) == \
+        ["semantic_cache:tenant:", "semantic_cache:tenant:second"]
+    assert semantic_cache_module.get_semantic_cache("first") is not first
+
+
+def test_invalidation_reaches_the_registered_cache(registry, monkeypatch):
+    bumped = []
+    monkeypatch.setattr(semantic_cache_module, "get_cache_generations",
+                        lambda: type("generations", (), {"bump": lambda self, tenant: bumped.append(tenant) or 1})())
+    cache = semantic_cache_module.get_semantic_cache("first")
+    assert semantic_cache_module.invalidate_semantic_cache("first") == 1
+    assert cache.invalidated and bumped == ["first"]
@@ -0,0 +1,72 @@
+from langgraph.graph import StateGraph, START, END
+from src.checkpointers.checkpointer import checkpointer
+from src.states.RAGState import GraphState
+import asyncio
+import pytest
+
+
+def build_graph(saver):
+    graph = StateGraph(GraphState)
+    graph.add_node("generate", lambda state: {"generation": "answer"})
+    graph.add_node("human_in_the_loop", lambda state: {"upload_status": state.get("upload_status", "no")})
+    graph.add_edge(START, "generate")
+    graph.add_conditional_edges("generate", lambda state: "ask" if state["question"] == "web" else "done",
+                                {"ask": "human_in_the_loop", "done": END})
+    graph.add_edge("human_in_the_loop", END)
+    return graph.compile(checkpointer=saver, interrupt_before=["human_in_the_loop"])
+
+
+def run_threads(graph):
+    graph.invoke({"question": "rag"}, {"configurable": {"thread_id": "finished"}})
+    graph.invoke({"question": "web"}, {"configurable": {"thread_id": "interrupted"}})
+
+
+def threads(graph):
+    return {t for t in ("finished", "interrupted") if graph.get_state({"configurable": {"thread_id": t}}).values}
+
+
+def test_prune_keeps_interrupted_threads_longer():
+    graph_checkpointer = checkpointer("memory")
+    graph = build_graph(graph_checkpointer.get_checkpointer())
+    run_threads(graph)
+
+    graph_checkpointer.ttl_seconds, graph_checkpointer.interrupted_ttl_seconds = 0, 3600
+    assert graph_checkpointer.prune(graph) == 1
+    assert threads(graph) == {"interrupted"}
+
+    graph_checkpointer.interrupted_ttl_seconds = 0
+    assert graph_checkpointer.prune(graph) == 1
+    assert threads(graph) == set()
+
+
+def test_sqlite_prune_is_claimed_by_one_worker_per_interval(tmp_path):
+    pytest.importorskip("langgraph.checkpoint.sqlite")
+    url = str(tmp_path / "checkpoints.sqlite")
+    worker, other_worker = checkpointer("sqlite", url=url), checkpointer("sqlite", url=url)
+    graph = build_graph(worker.get_checkpointer())
+    other_graph = build_graph(other_worker.get_checkpointer())
+    run_threads(graph)
+
+    for graph_checkpointer in (worker, other_worker):
+        graph_checkpointer.ttl_seconds = graph_checkpointer.interrupted_ttl_seconds = 0
+    assert worker.prune(graph) == 2
+    run_threads(graph)
+    # The other worker's turn only comes after the prune interval
+    assert other_worker.prune(other_graph) == 0
+    assert threads(graph) == {"finished", "interrupted"}
+
+
+def test_async_sqlite_prune(tmp_path):
+    pytest.importorskip("aiosqlite")
+    async def run():
+        graph_checkpointer = checkpointer("sqlite", url=str(tmp_path / "checkpoints.sqlite"))
+        graph = build_graph(await graph_checkpointer.aget_checkpointer())
+        await graph.ainvoke({"question": "rag"}, {"configurable": {"thread_id": "finished"}})
+        await graph.ainvoke({"question": "web"}, {"configurable": {"thread_id": "interrupted"}})
+        graph_checkpointer.ttl_seconds, graph_checkpointer.interrupted_ttl_seconds = 0, 3600
+        try:
+            return await graph_checkpointer.aprune(graph)
+        finally:
+            await graph_checkpointer.aclose()
+
+    assert asyncio.run(run()) == 1
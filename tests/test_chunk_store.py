@@ -0,0 +1,87 @@
+from langchain_core.documents import Document
+from src.states.chunk_store import chunk_store, chunk_missing
+import pytest
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = chunk_store(backend=request.param, url=str(tmp_path / "checkpoints.sqlite"), ttl_seconds=3600)
+    yield store
+    store.close()
+
+
+def test_references_resolve_to_their_documents(store):
+    refs = store.put([Document(page_content="alpha", metadata={"score": 0.8}, id="1"), Document(page_content="beta")])
+    assert refs[0]["score"] == 0.8 and "score" not in refs[1]
+    documents = store.resolve(refs)
+    assert [d.page_content for d in documents] == ["alpha", "beta"]
+    assert documents[0].id == "1" and documents[0].metadata == {"score": 0.8}
+
+
+def test_missing_body_raises(store):
+    with pytest.raises(chunk_missing) as error:
+        store.resolve([{"chunk": "0" * 64}])
+    assert error.value.keys == ["0" * 64]
+    assert store.stats()["missing"] == 1
+
+
+def test_bodies_expire_only_after_their_ttl(store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.states.chunk_store.time.time", lambda: now[0])
+    refs = store.put([Document(page_content="alpha")])
+    now[0] += 3000
+    # Reading a body keeps it for another TTL
+    store.resolve(refs)
+    now[0] += 3000
+    assert store.resolve(refs)[0].page_content == "alpha"
+    now[0] += 3601
+    with pytest.raises(chunk_missing):
+        store.resolve(refs)
+
+
+def test_workers_sharing_the_checkpointer_database_share_bodies(tmp_path):
+    url = str(tmp_path / "checkpoints.sqlite")
+    first, second = chunk_store(backend="sqlite", url=url), chunk_store(backend="sqlite", url=url)
+    refs = first.put([Document(page_content="alpha")])
+    assert second.resolve(refs)[0].page_content == "alpha"
+    first.close()
+    second.close()
+
+
+def test_backend_and_url_follow_the_checkpointer(tmp_path, monkeypatch):
+    monkeypatch.delenv("CHUNK_STORE_BACKEND", raising=False)
+    monkeypatch.delenv("CHUNK_STORE_URL", raising=False)
+    monkeypatch.setenv("CHECKPOINTER_BACKEND", "sqlite")
+    monkeypatch.setenv("CHECKPOINTER_URL", str(tmp_path / "checkpoints.sqlite"))
+    store = chunk_store()
+    assert (store.backend, store.url) == ("sqlite", str(tmp_path / "checkpoints.sqlite"))
+    store.close()
+
+
+def test_same_text_from_another_source_keeps_its_metadata(store):
+    web = Document(page_content="same text", metadata={"url": "https://example.com", "score": 0.5})
+    chunk = Document(page_content="same text", metadata={"source": "report.pdf", "page": 3, "score": 0.9}, id="c1")
+    refs = store.put([web, chunk])
+    assert refs[0]["chunk"] != refs[1]["chunk"]
+    web_doc, chunk_doc = store.resolve(refs)
+    assert web_doc.metadata == {"url": "https://example.com", "score": 0.5} and web_doc.id is None
+    assert chunk_doc.metadata == {"source": "report.pdf", "page": 3, "score": 0.9} and chunk_doc.id == "c1"
+
+
+def test_scores_of_another_retrieval_share_the_body(store):
+    first = store.put([Document(page_content="alpha", metadata={"score": 0.2})])
+    second = store.put([Document(page_content="alpha", metadata={"score": 0.7})])
+    assert first[0]["chunk"] == second[0]["chunk"]
+    assert store.resolve(first)[0].metadata["score"] == 0.2
+    assert store.resolve(second)[0].metadata["score"] == 0.7
+
+
+def test_memory_store_evicts_the_least_recently_used_bodies():
+    store = chunk_store(backend="memory", ttl_seconds=3600, max_entries=2)
+    alpha, beta = store.put([Document(page_content="alpha"), Document(page_content="beta")])
+    store.resolve([alpha])
+    gamma, = store.put([Document(page_content="gamma")])
+    assert [d.page_content for d in store.resolve([alpha, gamma])] == ["alpha", "gamma"]
+    with pytest.raises(chunk_missing):
+        store.resolve([beta])
+    assert store.stats()["evictions"] == 1 and store.stats()["entries"] == 2
@@ -0,0 +1,42 @@
+from langchain_core.documents import Document
+from src.retrievers.context_packer import context_packer
+import pytest
+
+
+@pytest.fixture
+def packer():
+    # An unknown encoding falls back to the len // 4 + 1 estimate, no download needed
+    return context_packer(dedup_threshold=0.9, encoding_name="no_such_encoding")
+
+
+def doc(text, id=None):
+    return Document(page_content=text, id=id)
+
+
+def test_documents_are_packed_in_rank_order_within_the_budget(packer):
+    documents = [doc("a" * 40, "1"), doc("b" * 40, "2"), doc("c" * 40, "3")]
+    # 11 estimated tokens each
+    assert [d.id for d in packer.pack(documents, 22)] == ["1", "2"]
+
+
+def test_smaller_documents_further_down_still_fit(packer):
+    documents = [doc("a" * 40, "1"), doc("b" * 80, "2"), doc("c" * 8, "3")]
+    assert [d.id for d in packer.pack(documents, 15)] == ["1", "3"]
+
+
+def test_near_duplicates_are_dropped(packer):
+    text = " ".join(f"word{i}" for i in range(50))
+    documents = [doc(text, "1"), doc(text + " tail", "2"), doc("something else entirely here", "3")]
+    assert [d.id for d in packer.pack(documents, 1000)] == ["1", "3"]
+
+
+def test_oversized_first_document_is_truncated(packer):
+    packed = packer.pack([doc("a" * 400, "1")], 10)
+    assert len(packed) == 1
+    assert packed[0].id == "1" and packed[0].page_content == "a" * 40
+
+
+def test_single_document_comes_back_single(packer):
+    packed = packer.pack(doc("web search result"), 100)
+    assert isinstance(packed, Document)
+    assert context_packer.format([doc("one"), doc("two")]) == "one\n\ntwo"
@@ -0,0 +1,96 @@
+from src.embedding.embedding import cached_embeddings
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import pytest
+
+
+class fake_model:
+    """
+    Deterministic float32 exact vectors, counts the texts it embeds.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [float(b) / 4 for b in digest[:8]]
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._vector(text)
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def test_hit_returns_the_model_vector(cache_dir):
+    model = fake_model()
+    cache = cached_embeddings(model, "fake", cache_dir=cache_dir, max_entries=10)
+    vector = cache.embed_query("hello")
+    assert cache.embed_query("hello") == vector
+    assert model.calls == 1
+    cache.close()
+
+
+def test_least_recently_used_row_is_reused(cache_dir):
+    model = fake_model()
+    cache = cached_embeddings(model, "fake", cache_dir=cache_dir, max_entries=2, touch_batch=1)
+    cache.embed_documents(["a", "b"])
+    cache.embed_documents(["a"])
+    cache.embed_documents(["c"])
+    assert cache.evictions == 1
+    assert cache._lookup([cache._key("document", "b")]) == {}
+    assert cache.embed_documents(["a", "c"]) == model.embed_documents(["a", "c"])
+    cache.close()
+
+
+def test_workers_sharing_a_directory_never_mix_vectors(cache_dir):
+    # Separate instances have separate connections and mappings, as separate processes do
+    workers = [cached_embeddings(fake_model(), "fake", cache_dir=cache_dir, max_entries=50) for _ in range(4)]
+    texts = [f"text {i}" for i in range(200)]
+
+    def work(index):
+        cache = workers[index]
+        for start in range(index, len(texts), 7):
+            batch = texts[start:start + 5]
+            assert cache.embed_documents(batch) == fake_model().embed_documents(batch)
+
+    with ThreadPoolExecutor(len(workers)) as pool:
+        list(pool.map(work, range(len(workers))))
+
+    reader = cached_embeddings(fake_model(), "fake", cache_dir=cache_dir, max_entries=50)
+    found = reader._lookup([reader._key("document", t) for t in texts])
+    assert 0 < len(found) <= 50
+    expected = {reader._key("document", t): fake_model()._vector(t) for t in texts}
+    assert all(vector == expected[key] for key, vector in found.items())
+    for cache in [*workers, reader]:
+        cache.close()
+
+
+def test_hits_do_not_write_until_a_batch_is_full(cache_dir):
+    cache = cached_embeddings(fake_model(), "fake", cache_dir=cache_dir, max_entries=10, touch_batch=3)
+    cache.embed_documents(["a", "b", "c"])
+    cache.embed_documents(["a", "b"])
+    assert len(cache._touched) == 2
+    cache.embed_documents(["c"])
+    assert cache._touched == {}
+    cache.close()
+
+
+def test_directory_of_another_model_is_reset(cache_dir):
+    first = cached_embeddings(fake_model(), "fake", cache_dir=cache_dir, max_entries=10)
+    first.embed_query("hello")
+    first.close()
+    model = fake_model()
+    cache = cached_embeddings(model, "other", cache_dir=cache_dir, max_entries=10)
+    cache.embed_query("hello")
+    assert model.calls == 1
+    assert cache.stats()["entries"] == 1
+    cache.close()
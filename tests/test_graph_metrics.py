@@ -0,0 +1,27 @@
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from src.metrics.graph_metrics import graph_metrics, graph_run_tracer
+from src.cache.llm_cache import FROM_CACHE
+from uuid import uuid4
+
+
+def llm_result(from_cache=False):
+    message = AIMessage(content="yes", usage_metadata={"input_tokens": 100, "output_tokens": 5, "total_tokens": 105})
+    return LLMResult(generations=[[ChatGeneration(message=message, generation_info={FROM_CACHE: True} if from_cache else None)]])
+
+
+def call(tracer, result):
+    run_id = uuid4()
+    tracer.on_chat_model_start({}, [], run_id=run_id, metadata={"langgraph_node": "grade_documents"})
+    tracer.on_llm_end(result, run_id=run_id)
+
+
+def test_cache_hits_are_not_counted_as_llm_calls():
+    metrics = graph_metrics()
+    tracer = graph_run_tracer("thread", metrics=metrics)
+    call(tracer, llm_result())
+    call(tracer, llm_result(from_cache=True))
+
+    breakdown = metrics.thread_breakdown("thread")
+    assert (breakdown["llm_calls"], breakdown["prompt_tokens"], breakdown["completion_tokens"]) == (1, 100, 5)
+    assert 'adaptive_rag_llm_calls_total{node="grade_documents"} 1' in metrics.render_prometheus()
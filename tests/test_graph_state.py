@@ -0,0 +1,24 @@
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END
+from src.states.RAGState import GraphState
+
+
+def build_graph():
+    # Nodes return only the keys they change, like RAG_nodes
+    graph = StateGraph(GraphState)
+    graph.add_node("generate", lambda state: {"generation": f"answer to {state['question']}"})
+    graph.add_node("accept_answer", lambda state: {"answer_status": "accepted"})
+    graph.add_edge(START, "generate")
+    graph.add_conditional_edges("generate", lambda state: "accept" if state["question"] == "good" else "reject",
+                                {"accept": "accept_answer", "reject": END})
+    graph.add_edge("accept_answer", END)
+    return graph.compile(checkpointer=MemorySaver())
+
+
+def test_reused_thread_does_not_inherit_answer_status():
+    graph = build_graph()
+    config = {"configurable": {"thread_id": "conversation_1"}}
+    assert graph.invoke({"question": "good", "answer_status": None}, config)["answer_status"] == "accepted"
+    # Same thread, as /ask_rag reuses it for the same question, the answer is not accepted this time
+    result = graph.invoke({"question": "bad", "answer_status": None}, config)
+    assert result["answer_status"] is None
@@ -0,0 +1,53 @@
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+import asyncio
+import pytest
+
+pytest.importorskip("langchain_astradb")
+
+from src.retrievers.retriever import hybrid_retriever
+from src.retrievers.bm25_index import bm25_index
+
+
+class fixed_retriever(BaseRetriever):
+    documents: list
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return list(self.documents)
+
+
+def doc(text, id=None):
+    return Document(page_content=text, id=id)
+
+
+def make_hybrid(vector_documents=(), lexical_index=None, k=4, rrf_k=60):
+    return hybrid_retriever(vector_retriever=fixed_retriever(documents=list(vector_documents)),
+                            lexical_index=lexical_index, k=k, rrf_k=rrf_k)
+
+
+def test_chunks_in_both_lists_rank_first():
+    hybrid = make_hybrid(k=2)
+    fused = hybrid.fuse([doc("a", "a"), doc("b", "b"), doc("c", "c")], [doc("c", "c"), doc("d", "d")])
+    # c scores 1/63 + 1/61, above a alone at 1/61
+    assert [d.id for d in fused] == ["c", "a"]
+
+
+def test_rank_constant_weights_the_top_ranks():
+    vector = [doc("a", "a"), doc("x", "x"), doc("b", "b")]
+    lexical = [doc("y", "y"), doc("z", "z"), doc("b", "b")]
+    # Two third places beat a single first place, unless the constant is small
+    assert [d.id for d in make_hybrid(k=1, rrf_k=60).fuse(vector, lexical)] == ["b"]
+    assert [d.id for d in make_hybrid(k=1, rrf_k=0).fuse(vector, lexical)] == ["a"]
+
+
+def test_chunks_without_ids_are_matched_by_content():
+    fused = make_hybrid(k=2).fuse([doc("same text"), doc("other")], [doc("same text")])
+    assert [d.page_content for d in fused] == ["same text", "other"]
+
+
+def test_fuses_vector_and_bm25_results(tmp_path):
+    lexical = bm25_index("docs", index_dir=str(tmp_path))
+    lexical.upsert(["1", "2"], ["reciprocal rank fusion", "unrelated chunk about cooking"])
+    hybrid = make_hybrid([doc("dense hit", "3"), doc("reciprocal rank fusion", "1")], lexical, k=2)
+    assert [d.id for d in hybrid.invoke("rank fusion")] == ["1", "3"]
+    assert [d.id for d in asyncio.run(hybrid.ainvoke("rank fusion"))] == ["1", "3"]
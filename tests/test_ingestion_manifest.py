@@ -0,0 +1,64 @@
+from utils.ingestion_manifest import ingestion_manifest, hash_text, hash_file, chunk_id, document_key
+import sqlite3
+import pytest
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = ingestion_manifest(str(tmp_path / "manifest.sqlite"))
+    yield manifest
+    manifest.close()
+
+
+def test_text_is_hashed_as_text_even_when_it_names_a_file(tmp_path):
+    path = tmp_path / "chunk.txt"
+    path.write_text("other content")
+    assert hash_text(str(path)) != hash_file(str(path))
+    assert chunk_id(str(path)) == hash_text(str(path))
+    assert hash_file(str(path)) == hash_text("other content")
+
+
+def test_same_named_files_are_separate_documents(manifest):
+    first, second = document_key(hash_text("first")), document_key(hash_text("second"))
+    manifest.record("docs", first, hash_text("first"), ["a", "b"], name="report.pdf")
+    manifest.record("docs", second, hash_text("second"), ["c"], name="report.pdf")
+
+    assert sorted(manifest.documents_named("docs", "report.pdf")) == sorted([first, second])
+    assert manifest.known_chunks("docs", ["a", "b", "c"]) == {"a", "b", "c"}
+    # Ingesting the second file again leaves the chunks of the first one alone
+    assert manifest.stale_chunks("docs", second, ["c"]) == []
+
+
+def test_replacing_deletes_only_unshared_chunks(manifest):
+    old, new, other = (document_key(hash_text(t)) for t in ("old", "new", "other"))
+    manifest.record("docs", old, hash_text("old"), ["a", "b"], name="report.pdf")
+    manifest.record("docs", other, hash_text("other"), ["b"], name="notes.pdf")
+
+    assert manifest.stale_chunks("docs", new, ["c"], replaces=[old]) == ["a"]
+    manifest.record("docs", new, hash_text("new"), ["c"], name="report.pdf", replaces=[old])
+    assert manifest.documents_named("docs", "report.pdf") == [new]
+    assert manifest.known_chunks("docs", ["a", "b", "c"]) == {"b", "c"}
+
+
+def test_unchanged_document_is_detected(manifest):
+    key = document_key(hash_text("content"))
+    assert not manifest.is_unchanged("docs", key, hash_text("content"))
+    manifest.record("docs", key, hash_text("content"), ["a"], name="a.pdf")
+    assert manifest.is_unchanged("docs", key, hash_text("content"))
+    assert not manifest.is_unchanged("other", key, hash_text("content"))
+
+
+def test_manifest_without_names_is_migrated(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE documents (collection TEXT NOT NULL, doc_key TEXT NOT NULL,
+                    content_hash TEXT NOT NULL, updated_at TEXT NOT NULL, PRIMARY KEY (collection, doc_key))""")
+    conn.execute("INSERT INTO documents VALUES ('docs', 'report.pdf', 'hash', 'now')")
+    conn.commit()
+    conn.close()
+
+    manifest = ingestion_manifest(path)
+    try:
+        assert manifest.documents_named("docs", "report.pdf") == ["report.pdf"]
+    finally:
+        manifest.close()
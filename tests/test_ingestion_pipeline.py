@@ -0,0 +1,68 @@
+from langchain_core.documents import Document
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+pytest.importorskip("langchain_astradb")
+
+from utils import ingestion_pipeline
+from utils.ingestion_manifest import ingestion_manifest
+
+
+class fake_store:
+    """
+    The parts of AstraDBVectorStore the pipeline uses.
+    """
+
+    def __init__(self):
+        self.collection_name = "docs"
+        self.embedding = None
+        self.rows = {}
+
+    def add_texts(self, texts, metadatas=None, ids=None, batch_size=None):
+        self.rows.update(zip(ids, texts))
+        return ids
+
+    def delete(self, ids):
+        for id in ids:
+            self.rows.pop(id, None)
+
+
+class fake_embedder:
+    def embed_documents(self, texts):
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+
+def parse_pdf(filename, source, chunk_size=1000, chunk_overlap=200):
+    # One chunk per line of the "PDF"
+    lines = source.decode("utf-8").splitlines()
+    return filename, 1, [Document(page_content=line, metadata={"source": filename}) for line in lines]
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion_pipeline, "parse_pdf", parse_pdf)
+    manifest = ingestion_manifest(str(tmp_path / "manifest.sqlite"))
+    pipeline = ingestion_pipeline.ingestion_pipeline(fake_store(), embedder=fake_embedder(), manifest=manifest)
+    pool = ThreadPoolExecutor(2)
+    monkeypatch.setattr(pipeline, "_parse_pool", lambda: pool)
+    yield pipeline
+    pool.shutdown()
+    manifest.close()
+
+
+def test_changed_upload_replaces_the_previous_version(pipeline):
+    pipeline.run([("report.pdf", b"kept\nold figures")])
+    stats = pipeline.run([("report.pdf", b"kept\nnew figures")])
+    assert sorted(pipeline.vectorstore.rows.values()) == ["kept", "new figures"]
+    assert stats["chunks_deleted"] == 1 and stats["chunk_hits"] == 1
+    assert len(pipeline.manifest.documents_named("docs", "report.pdf")) == 1
+
+
+def test_distinct_files_sharing_a_name_can_be_kept(pipeline):
+    pipeline.run([("report.pdf", b"first")])
+    pipeline.run([("report.pdf", b"second")], replace=False)
+    assert sorted(pipeline.vectorstore.rows.values()) == ["first", "second"]
+    assert len(pipeline.manifest.documents_named("docs", "report.pdf")) == 2
@@ -0,0 +1,94 @@
+from src.llms.llm_scheduler import llm_scheduler, _ticket
+from types import SimpleNamespace
+import threading
+import pytest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.llms.llm_scheduler.time.monotonic", lambda: now[0])
+    return now
+
+
+def make_scheduler(**budgets):
+    return llm_scheduler("test", max_retries=1, **{"max_concurrency": 16, **budgets})
+
+
+def queue(scheduler, priority=2, tokens=1):
+    # A waiting call, granted by the dispatches of the other calls
+    ticket = _ticket(priority, tokens, event=threading.Event())
+    scheduler._enqueue(ticket)
+    return ticket
+
+
+def dispatch(scheduler):
+    with scheduler._lock:
+        scheduler._dispatch()
+
+
+def test_request_bucket_refills_over_the_minute(clock):
+    scheduler = make_scheduler(rpm=2)
+    scheduler.acquire(0, 1)
+    scheduler.acquire(0, 1)
+    waiting = queue(scheduler)
+    dispatch(scheduler)
+    assert not waiting.granted and scheduler._delay() == pytest.approx(30)
+    clock[0] += 30
+    dispatch(scheduler)
+    assert waiting.granted
+
+
+def test_unused_estimated_tokens_go_back_to_the_bucket(clock):
+    scheduler = make_scheduler(tpm=1000)
+    ticket = scheduler.acquire(0, 800)
+    waiting = queue(scheduler, tokens=600)
+    dispatch(scheduler)
+    assert not waiting.granted
+    scheduler.release(ticket, used_tokens=300)
+    assert waiting.granted and scheduler._tokens == pytest.approx(100)
+
+
+def test_call_larger_than_the_bucket_starts_once_it_is_full(clock):
+    scheduler = make_scheduler(tpm=1000)
+    scheduler.release(scheduler.acquire(0, 500))
+    clock[0] += 1
+    waiting = queue(scheduler, tokens=5000)
+    dispatch(scheduler)
+    assert not waiting.granted
+    clock[0] += 30
+    dispatch(scheduler)
+    assert waiting.granted
+
+
+def test_waiting_head_holds_back_lower_priorities(clock):
+    scheduler = make_scheduler(tpm=1000)
+    scheduler.acquire(0, 1000)
+    grader, rag = queue(scheduler, priority=2, tokens=10), queue(scheduler, priority=0, tokens=600)
+    clock[0] += 6
+    dispatch(scheduler)
+    # 100 tokens refilled, enough for the grader but not for the generation ahead of it
+    assert not rag.granted and not grader.granted
+    clock[0] += 31
+    dispatch(scheduler)
+    assert rag.granted and grader.granted
+
+
+def test_rate_limit_pauses_the_provider_for_its_retry_after(clock):
+    scheduler = make_scheduler()
+    error = SimpleNamespace(status_code=429, response=SimpleNamespace(status_code=429, headers={"retry-after": "5"}))
+    assert scheduler.backoff(0, error) >= 5
+    waiting = queue(scheduler)
+    dispatch(scheduler)
+    assert not waiting.granted and scheduler._delay() == pytest.approx(5)
+    clock[0] += 5
+    dispatch(scheduler)
+    assert waiting.granted and scheduler.rate_limited == 1
+
+
+def test_abandoned_calls_give_their_slot_back(clock):
+    scheduler = make_scheduler(max_concurrency=1)
+    ticket = scheduler.acquire(0, 1)
+    waiting = queue(scheduler)
+    scheduler._abandon(ticket)
+    assert waiting.granted and scheduler.stats()["in_flight"] == 1
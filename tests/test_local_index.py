@@ -0,0 +1,109 @@
+from langchain_core.documents import Document
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from src.retrievers.local_index import local_index, stamp_ingested, INGESTED_AT_FIELD
+
+
+class fake_embedder:
+    """
+    One axis per word, the query "alpha" is nearest to the chunk "alpha".
+    """
+
+    words = ["alpha", "beta", "gamma", "delta", "epsilon"]
+
+    def embed_query(self, text):
+        return [1.0 if word == text else 0.0 for word in self.words]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+class fake_collection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def find(self, filter, projection=None):
+        return list(self.rows)
+
+    def find_one(self, filter, projection=None):
+        (field, condition), = filter.items()
+        key = field.split(".", 1)[1]
+        return next((r for r in self.rows if r["metadata"].get(key, 0) > condition["$gt"]), None)
+
+    def count_documents(self, filter, upper_bound):
+        if len(self.rows) > upper_bound:
+            raise RuntimeError("too many documents to count")
+        return len(self.rows)
+
+
+class fake_source:
+    """
+    The parts of AstraDBVectorStore the mirror uses.
+    """
+
+    def __init__(self, texts, ingested_at=1.0):
+        rows = [{"_id": t, "content": t, "metadata": {INGESTED_AT_FIELD: ingested_at}} for t in texts]
+        self.astra_env = SimpleNamespace(ensure_db_setup=lambda: None, collection=fake_collection(rows))
+
+    def full_decode_astra_db_found_document(self, raw):
+        return SimpleNamespace(id=raw["_id"], embedding=fake_embedder().embed_query(raw["content"]),
+                               document=Document(page_content=raw["content"], metadata=raw["metadata"]))
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path / "index")
+
+
+def make_index(index_dir):
+    return local_index("docs", embedder=fake_embedder(), index_dir=index_dir, index_type="flat")
+
+
+def test_rebuild_by_another_process_is_picked_up(index_dir):
+    server = make_index(index_dir)
+    cli = make_index(index_dir)
+    cli.rebuild(fake_source(["alpha", "beta"]))
+    assert server.similarity_search("alpha", k=1)[0].page_content == "alpha"
+
+    # A second rebuild keeps the ids of the chunks it already had and drops the others
+    alpha_id = cli._conn.execute("SELECT int_id FROM docs WHERE doc_id = 'alpha'").fetchone()
+    cli.rebuild(fake_source(["alpha", "gamma"]))
+    assert cli._conn.execute("SELECT int_id FROM docs WHERE doc_id = 'alpha'").fetchone() == alpha_id
+    assert server.similarity_search("gamma", k=1)[0].page_content == "gamma"
+    assert "beta" not in [d.page_content for d in server.similarity_search("beta", k=3)]
+    assert server.staleness()["build_version"] == cli.staleness()["build_version"]
+    server.close()
+    cli.close()
+
+
+def test_upserts_of_another_process_are_searched(index_dir):
+    first = make_index(index_dir)
+    second = make_index(index_dir)
+    first.rebuild(fake_source(["alpha"]))
+    second.upsert_vectors(["delta"], ["delta"], stamp_ingested([{}]), fake_embedder().embed_documents(["delta"]))
+    assert first.similarity_search("delta", k=1)[0].page_content == "delta"
+    first.close()
+    second.close()
+
+
+def test_staleness_compares_the_ingestion_marker(index_dir, monkeypatch):
+    monkeypatch.setenv("LOCAL_INDEX_COUNT_UPPER_BOUND", "1")
+    index = make_index(index_dir)
+    index.max_age_seconds = 0
+    source = fake_source(["alpha", "beta"], ingested_at=5.0)
+    index.rebuild(source)
+
+    report = index.staleness(source)
+    # Above the exact count bound the counts are not compared, the marker still is
+    assert report["source_count"] is None and report["synced_to"] == 5.0
+    assert not report["stale"]
+
+    source.astra_env.collection.rows.append({"_id": "gamma", "content": "gamma", "metadata": {INGESTED_AT_FIELD: 6.0}})
+    assert index.staleness(source)["stale"]
+    index.upsert_vectors(["gamma"], ["gamma"], [{INGESTED_AT_FIELD: 6.0}], fake_embedder().embed_documents(["gamma"]))
+    assert not index.staleness(source)["stale"]
+    index.close()
@@ -0,0 +1,41 @@
+from langchain_core.documents import Document
+from collections import OrderedDict
+import threading
+import asyncio
+import pytest
+
+pytest.importorskip("langchain_astradb")
+
+from src.nodes.RAG_nodes import RAG_nodes
+from src.states.chunk_store import chunk_store
+
+
+class fake_retriever:
+    def __init__(self):
+        self.built_on = None
+
+    async def ainvoke(self, question):
+        return [Document(page_content=question)]
+
+
+def make_nodes():
+    # Only the parts of RAG_nodes retrieval uses, without connecting to Astra DB
+    nodes = RAG_nodes.__new__(RAG_nodes)
+    nodes.chunk_store = chunk_store(backend="memory", ttl_seconds=60)
+    nodes._retrievers = OrderedDict()
+    nodes._retrievers_lock = threading.Lock()
+    nodes.retriever = fake_retriever()
+
+    def retriever_for(state, config):
+        nodes.retriever.built_on = threading.current_thread()
+        return nodes.retriever
+
+    nodes._retriever_for = retriever_for
+    return nodes
+
+
+def test_retrievers_are_built_off_the_event_loop():
+    nodes = make_nodes()
+    result = asyncio.run(nodes.aretrieve({"question": "alpha"}))
+    assert nodes.retriever.built_on is not threading.main_thread()
+    assert nodes.chunk_store.resolve(result["documents"])[0].page_content == "alpha"
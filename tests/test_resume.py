@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+import asyncio
+import pytest
+
+pytest.importorskip("langchain_astradb")
+
+from schemas import resumeRequest
+from routers import resume
+
+
+class fake_graph:
+    def __init__(self, values):
+        self.values = values
+        self.updates = []
+
+    async def aget_state(self, config):
+        return SimpleNamespace(values=self.values)
+
+    async def aupdate_state(self, config, values):
+        self.updates.append(values)
+
+
+def run_resume(monkeypatch, values):
+    graph, runs = fake_graph(values), []
+
+    async def run_graph_and_response(input_state, config, debug=False):
+        runs.append(config)
+
+    monkeypatch.setattr(resume, "get_compiled_graph", lambda: graph)
+    monkeypatch.setattr(resume, "run_graph_and_response", run_graph_and_response)
+    asyncio.run(resume.resume_graph(resumeRequest(thread_id="thread", upload_status="yes")))
+    assert graph.updates == [{"upload_status": "yes"}]
+    return runs[0]
+
+
+def test_resume_restores_the_retrieval_override(monkeypatch):
+    retrieval = {"search_type": "mmr", "k": 8, "fetch_k": 40}
+    config = run_resume(monkeypatch, {"question": "q", "retrieval": retrieval})
+    assert config["configurable"] == {"thread_id": "thread", "retrieval": retrieval}
+
+
+def test_resume_without_override_uses_the_defaults(monkeypatch):
+    config = run_resume(monkeypatch, {"question": "q", "retrieval": None})
+    assert "retrieval" not in config["configurable"]
@@ -0,0 +1,103 @@
+from langchain_core.language_models import FakeListChatModel
+from src.cache.llm_cache import llm_response_cache, memory_llm_store
+from src.routing.retry_controller import retry_controller, request_budget_tracker
+from uuid import uuid4
+import numpy as np
+import pytest
+
+
+class fake_embedder:
+    """
+    Questions sharing their first word get the same vector.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        seed = sum(text.split()[0].encode("utf-8"))
+        return np.random.default_rng(seed).normal(size=8).tolist()
+
+
+@pytest.fixture
+def controller():
+    controller = retry_controller(max_attempts=3, max_llm_calls=2, max_seconds=60, similarity_threshold=0.95)
+    controller._embedder = fake_embedder()
+    return controller
+
+
+def start_request(tracker, thread_id):
+    tracker.on_chain_start({}, {}, run_id=uuid4(), parent_run_id=None, metadata={"thread_id": thread_id})
+
+
+def test_cache_hits_do_not_count_against_the_budget():
+    tracker = request_budget_tracker()
+    start_request(tracker, "thread")
+    model = FakeListChatModel(responses=["yes", "no"], cache=llm_response_cache("test", memory_llm_store()))
+    config = {"callbacks": [tracker], "metadata": {"thread_id": "thread"}}
+
+    assert model.invoke("is it relevant?", config=config).content == "yes"
+    assert model.invoke("is it relevant?", config=config).content == "yes"
+    assert tracker.usage("thread")[0] == 1
+    model.invoke("another prompt", config=config)
+    assert tracker.usage("thread")[0] == 2
+
+
+def test_budget_is_exhausted_by_llm_calls(controller, monkeypatch):
+    tracker = request_budget_tracker()
+    monkeypatch.setattr("src.routing.retry_controller.get_request_budget_tracker", lambda: tracker)
+    start_request(tracker, "thread")
+    config = {"configurable": {"thread_id": "thread"}}
+    model = FakeListChatModel(responses=["a", "b"])
+    model.invoke("first", config={"callbacks": [tracker], "metadata": {"thread_id": "thread"}})
+    assert controller.exhausted(config) is None
+    model.invoke("second", config={"callbacks": [tracker], "metadata": {"thread_id": "thread"}})
+    assert controller.exhausted(config) == "2 LLM calls"
+    assert controller.exhausted({"configurable": {"thread_id": "unknown"}}) is None
+
+
+def test_grades_are_reused_for_chunks_already_graded(controller):
+    retry = controller.state({"question": "what is rag?"})
+    refs = [{"chunk": "a"}, {"chunk": "b"}, {"chunk": "a"}]
+    pending = controller.pending(retry, refs)
+    assert pending == [{"chunk": "a"}, {"chunk": "b"}]
+    retry, grades = controller.record_grades(retry, refs, pending, ["yes", "no"])
+    assert grades == ["yes", "no", "yes"]
+    assert controller.pending(retry, refs + [{"chunk": "c"}]) == [{"chunk": "c"}]
+
+
+def test_rewrite_grades_the_chunks_again(controller):
+    retry = controller.state({"question": "what is rag?"})
+    refs = [{"chunk": "a"}, {"chunk": "b"}]
+    retry, _ = controller.record_grades(retry, refs, refs, ["no", "yes"])
+    retry = controller.record_question(retry, "how does retrieval augmented generation work?")
+    retry = controller.state({"question": "how does retrieval augmented generation work?", "retry": retry})
+    assert controller.pending(retry, refs) == refs
+    retry, grades = controller.record_grades(retry, refs, refs, ["yes", "yes"])
+    assert grades == ["yes", "yes"]
+
+
+def test_grades_of_another_question_are_not_reused(controller):
+    # Checkpoints written before the grades were scoped do not say which question they are for
+    retry = {"questions": ["q", "rewrite"], "graded": {"a": "no"}, "stalled": False}
+    assert controller.state({"question": "rewrite", "retry": retry})["graded"] == {}
+
+
+def test_repeated_rewrite_stalls_and_vectors_stay_out_of_the_state(controller):
+    retry = controller.state({"question": "what is rag?"})
+    retry = controller.record_question(retry, "how does retrieval work?")
+    assert not retry["stalled"]
+    retry = controller.record_question(retry, "what does rag mean?")
+    assert retry["stalled"]
+    assert set(retry) == {"questions", "graded", "graded_for", "stalled"}
+    # Each question is embedded once
+    assert controller._embedder.calls == 3
+    # The state follows the rewrites of the question, a new question starts over
+    assert controller.state({"question": "what does rag mean?", "retry": retry}) == retry
+    assert controller.state({"question": "new question", "retry": retry})["questions"] == ["new question"]
+
+
+def test_checkpointed_question_vectors_are_dropped(controller):
+    retry = {"questions": ["q"], "question_vectors": [[1.0]], "graded": {}, "stalled": False}
+    assert "question_vectors" not in controller.state({"question": "q", "retry": retry})
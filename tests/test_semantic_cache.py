@@ -0,0 +1,59 @@
+from src.cache.semantic_cache import semantic_cache, cache_generations
+import hashlib
+import numpy as np
+import pytest
+
+
+class fake_embedder:
+    """
+    Deterministic unit vectors, the same text always gets the same vector.
+    """
+
+    def embed_query(self, text):
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).normal(size=16)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+@pytest.fixture
+def generations_path(tmp_path):
+    return str(tmp_path / "generations.sqlite")
+
+
+def make_cache(generations_path, tenant=None):
+    return semantic_cache(embedder=fake_embedder(), tenant=tenant, generations=cache_generations(generations_path))
+
+
+def test_lookup_hits_a_stored_answer(generations_path):
+    cache = make_cache(generations_path)
+    assert cache.store("what is rag?", "retrieval augmented generation", ["doc"], "vectorstore")
+    hit = cache.lookup("what is rag?")
+    assert hit["generation"] == "retrieval augmented generation"
+    assert hit["sources"] == ["doc"]
+    assert cache.lookup("something else entirely") is None
+
+
+def test_invalidation_by_another_worker_drops_answers(generations_path):
+    cache = make_cache(generations_path)
+    cache.store("what is rag?", "answer")
+    # Another worker writes to the collection and bumps the shared generation
+    cache_generations(generations_path).bump(None)
+    assert cache.lookup("what is rag?") is None
+
+
+def test_answer_of_a_run_started_before_an_invalidation_is_not_stored(generations_path):
+    cache = make_cache(generations_path)
+    started = cache.current_generation()
+    cache_generations(generations_path).bump(None)
+    assert not cache.store("what is rag?", "stale answer", cache_generation=started)
+    assert cache.lookup("what is rag?") is None
+    assert cache.store("what is rag?", "fresh answer", cache_generation=cache.current_generation())
+    assert cache.lookup("what is rag?")["generation"] == "fresh answer"
+
+
+def test_generations_are_per_tenant(generations_path):
+    generations = cache_generations(generations_path)
+    assert generations.bump("acme") == 1
+    assert generations.bump("acme") == 2
+    assert generations.get("acme") == 2
+    assert generations.get(None) == 0
@@ -0,0 +1,67 @@
+from src.llms.admission_controller import admission_controller
+from src.registry.resource_registry import get_registry
+from fastapi import HTTPException
+import asyncio
+import pytest
+
+pytest.importorskip("langchain_astradb")
+
+from schemas import initRequest
+from routers import stream
+from routers.stream import admitted_events
+
+
+async def graph_events():
+    yield "event: node\n\n"
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def test_slot_is_held_while_streaming_and_released_after():
+    admission = admission_controller(max_in_flight=1)
+    events = admitted_events(graph_events(), admission)
+
+    async def first_event():
+        event = await events.__anext__()
+        assert admission.stats()["in_flight"] == 1
+        await events.aclose()
+        return event
+
+    assert asyncio.run(first_event()) == "event: node\n\n"
+    assert admission.stats()["in_flight"] == 0
+
+
+def test_stream_dropped_before_it_starts_takes_no_slot():
+    admission = admission_controller(max_in_flight=1)
+    admitted_events(graph_events(), admission)
+    assert admission.stats() == {"in_flight": 0, "max_in_flight": 1, "admitted": 0, "rejected": 0}
+
+
+def test_rejected_stream_is_an_error_event():
+    admission = admission_controller(max_in_flight=1)
+    admission.admit()
+    events = asyncio.run(collect(admitted_events(graph_events(), admission)))
+    assert len(events) == 1 and events[0].startswith("event: error") and "retry_after" in events[0]
+    assert admission.stats()["in_flight"] == 1
+
+
+def test_saturated_stream_is_a_503_before_the_response_starts(monkeypatch):
+    admission = admission_controller(max_in_flight=1)
+    admission.admit()
+    get_registry().set("admission_controller", admission)
+
+    async def cache_state(question, tenant=None):
+        return {"cache_question": None, "cache_generation": None, "answer_status": None}
+
+    monkeypatch.setattr(stream, "get_compiled_graph", lambda: object())
+    monkeypatch.setattr(stream, "cache_state", cache_state)
+    try:
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(stream.stream_graph(initRequest(question="q", retrieval={"k": 4})))
+    finally:
+        get_registry().remove("admission_controller")
+    assert error.value.status_code == 503 and int(error.value.headers["Retry-After"]) >= 1
+    # The check takes no slot
+    assert admission.stats()["in_flight"] == 1
@@ -0,0 +1,58 @@
+from langchain_core.runnables import RunnableLambda
+from src.registry.resource_registry import get_registry
+import asyncio
+import pytest
+
+pytest.importorskip("langchain_groq")
+
+from src.web_search.web_searcher import web_searcher
+
+
+def result(url, content=None):
+    return {"url": url, "content": content or f"content of {url}"}
+
+
+RESULTS = {
+    "question": [result("a"), result("b"), result("c")],
+    "variant one": [result("b"), result("d")],
+    "variant two": [result("e")],
+}
+
+
+def search(payload):
+    if payload["query"] == "broken variant":
+        raise RuntimeError("search failed")
+    return RESULTS[payload["query"]]
+
+
+async def asearch(payload):
+    return search(payload)
+
+
+@pytest.fixture
+def searcher():
+    registry = get_registry()
+    registry.set("web_search:tavily", RunnableLambda(search, afunc=asearch))
+    yield web_searcher(query_variants=1, max_results=4, cache=False)
+    registry.remove("web_search:tavily")
+
+
+def test_merge_interleaves_by_rank_without_repeating_urls(searcher):
+    merged = searcher.merge([RESULTS["question"], RESULTS["variant one"], RESULTS["variant two"]])
+    assert [r["url"] for r in merged] == ["a", "b", "e", "d"]
+
+
+def test_merge_matches_results_without_url_by_content_and_skips_failures(searcher):
+    rankings = [[{"content": "same"}, result("x")], "Tavily error message", [{"content": "same"}, result("y")]]
+    assert [r.get("url") for r in searcher.merge(rankings)] == [None, "x", "y"]
+    assert searcher.merge([]) == []
+
+
+def test_variants_are_searched_and_merged(searcher):
+    searcher.query_variants = 4
+    # The question itself and a failing variant are dropped from the expansion or the merge
+    searcher.expander = RunnableLambda(lambda _: {"queries": ["Question?", "variant one", "broken variant", "variant two"]})
+    documents = searcher.search_documents("question")
+    assert [d.metadata["url"] for d in documents] == ["a", "b", "e", "d"]
+    documents = asyncio.run(searcher.asearch_documents("question"))
+    assert [d.metadata["url"] for d in documents] == ["a", "b", "e", "d"]
@@ -1,62 +1,41 @@
-import os
-import tempfile
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from src.embedding.embedding import embedding
-from langchain_astradb import AstraDBVectorStore
+from src.vectorstores.astra_vectorstore import astra_vectorstore, collection_for
+from src.cache.semantic_cache import invalidate_semantic_cache
+from utils.ingestion_pipeline import ingestion_pipeline
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class PDFChunksUploader:
-    def __init__(self, files):
+    def __init__(self, files, tenant=None, replace=True):
         self.files = files
-        self.embedder = embedding().get_embedding()
+        self.tenant = tenant
+        self.replace = replace
 
     def get_vectorstore(self):
-        api_endpoint = os.getenv('ASTRA_DB_API_ENDPOINT')
-        token = os.getenv('ASTRA_DB_APPLICATION_TOKEN')
-        
+        # Each tenant ingests into its own collection
+        return astra_vectorstore(collection_for(self.tenant)).get_vectorstore()
 
-        if not api_endpoint or not token:
-            raise ValueError("Astra DB API endpoint or token not set in environment variables.")
-
-        return AstraDBVectorStore(
-            embedding=self.embedder,
-            api_endpoint=api_endpoint,
-            token=token,
-            collection_name="astra_vector_langchain",
-        )
-
-    def process_pdf_and_split(self, vectorstore):
+    def process_pdf_and_split(self, vectorstore, progress_callback=None, cancel_event=None):
         try:
-            total_chunks_uploaded = 0
-            for filename, file_bytes in self.files:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                    tmp.write(file_bytes)
-                    tmp_path = tmp.name
-
-                loader = PyMuPDFLoader(tmp_path)
-                documents = loader.load()
-
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=200,
-                )
-                pdf_chunks = text_splitter.split_documents(documents)
-
-                vectorstore.add_documents(pdf_chunks)
-                total_chunks_uploaded += len(pdf_chunks)
-                os.remove(tmp_path)
+            pipeline = ingestion_pipeline(vectorstore, collection_name=collection_for(self.tenant))
+            stats = None
+            try:
+                stats = pipeline.run(self.files, progress_callback=progress_callback, cancel_event=cancel_event,
+                                     replace=self.replace)
+            finally:
+                # Cached answers may be outdated by the new content, re-uploading unchanged files keeps them
+                if stats is None or stats["chunks_written"] or stats["chunks_deleted"]:
+                    invalidate_semantic_cache(self.tenant)
 
             return {
                 "message": "Upload and processing complete.",
-                "total_chunks_uploaded": total_chunks_uploaded
+                "total_chunks_uploaded": stats["chunks_written"],
+                "stats": stats
             }
 
         except Exception as e:
             raise ValueError(f"Error while processing PDFs: {e}")
 
-    def start_pdf_upload(self):
+    def start_pdf_upload(self, progress_callback=None, cancel_event=None):
         vectorstore = self.get_vectorstore()
-        return self.process_pdf_and_split(vectorstore)
+        return self.process_pdf_and_split(vectorstore, progress_callback=progress_callback, cancel_event=cancel_event)
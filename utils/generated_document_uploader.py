@@ -1,52 +1,67 @@
-from db_test import test_astra_connection
-from langchain_astradb import AstraDBVectorStore
-from src.embedding.embedding import embedding
-import os
+from src.vectorstores.astra_vectorstore import astra_vectorstore, collection_for
+from src.cache.semantic_cache import invalidate_semantic_cache
+from utils.ingestion_manifest import get_ingestion_manifest, hash_text
+from src.retrievers.local_index import get_local_index, stamp_ingested
+from src.retrievers.bm25_index import get_bm25_index
 from dotenv import load_dotenv
 from langchain_core.documents import Document
+import logging
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class upload_generated_answers:
 
-    def __init__ (self, documents, answer): 
+    def __init__ (self, documents, answer, tenant=None): 
         self.source_documents = documents
         self.answer = answer
-        self.embedder = embedding().get_embedding()
+        self.tenant = tenant
         self.vectorstore = None
+        self.cache_generation = None
 
 
     def upload_answer(self):
         try: 
-            api_endpoint = os.getenv('ASTRA_DB_API_ENDPOINT')
-            token = os.getenv('ASTRA_DB_APPLICATION_TOKEN')
-
-            testing_db = test_astra_connection()
-            if testing_db == True : 
-                print("Connected to Astra DB successfully!")
-                self.vectorstore = AstraDBVectorStore(
-                embedding=self.embedder,
-                api_endpoint=api_endpoint,
-                token=token,
-                collection_name="astra_vector_langchain",
+            # Shared handle, the collection is only opened once per process
+            self.vectorstore = astra_vectorstore(collection_for(self.tenant)).get_vectorstore()
+
+            # Extract text content from documents for metadata (JSON serializable)
+            if hasattr(self.source_documents, 'page_content'):
+                # Single document
+                source_text = [self.source_documents.page_content]
+            elif isinstance(self.source_documents, list):
+                # List of documents
+                source_text = [doc.page_content if hasattr(doc, 'page_content') else str(doc) for doc in self.source_documents]
+            else:
+                # Fallback
+                source_text = [str(self.source_documents)]
+            
+            Document_to_upload = Document(
+                page_content=self.answer,
+                metadata=stamp_ingested([{"source_documents": source_text, "producer" : "Generated_Web_Search_Answer"}])[0]
             )
-                # Extract text content from documents for metadata (JSON serializable)
-                if hasattr(self.source_documents, 'page_content'):
-                    # Single document
-                    source_text = [self.source_documents.page_content]
-                elif isinstance(self.source_documents, list):
-                    # List of documents
-                    source_text = [doc.page_content if hasattr(doc, 'page_content') else str(doc) for doc in self.source_documents]
-                else:
-                    # Fallback
-                    source_text = [str(self.source_documents)]
-                
-                Document_to_upload = Document(
-                    page_content=self.answer,
-                    metadata={"source_documents": source_text, "producer" : "Generated_Web_Search_Answer"}
-                )
-
-            print("Uploading answer and source documents to Astra DB...")
-            self.vectorstore.add_documents([Document_to_upload])
+
+            # The same answer is only stored once, its content hash is its id
+            manifest = get_ingestion_manifest()
+            collection = getattr(self.vectorstore, "collection_name", None) or "default"
+            answer_id = hash_text(self.answer)
+            if manifest is not None:
+                if manifest.known_chunks(collection, [answer_id]):
+                    return "Answer already uploaded"
+                Document_to_upload.id = answer_id
+
+            logger.info("Uploading answer and source documents to Astra DB...")
+            ids = self.vectorstore.add_documents([Document_to_upload])
+            mirror = get_local_index(collection)
+            if mirror is not None:
+                mirror.add_documents([Document_to_upload], ids=ids)
+            lexical = get_bm25_index(collection)
+            if lexical is not None:
+                lexical.upsert(ids, [Document_to_upload.page_content], [Document_to_upload.metadata])
+            if manifest is not None:
+                manifest.record(collection, f"generated:{answer_id}", answer_id, [answer_id])
+            # Cached answers may be outdated by the new content
+            self.cache_generation = invalidate_semantic_cache(self.tenant)
 
             return "Upload successful"
         except Exception as e: 
@@ -0,0 +1,234 @@
+from utils.documents_uplaoder import PDFChunksUploader
+from utils.ingestion_pipeline import ingestion_cancelled
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+from uuid import uuid4
+import threading
+import logging
+import shutil
+import queue
+import json
+import os
+import re
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Progress counters reported by the ingestion pipeline
+PROGRESS_FIELDS = (
+    "files_parsed", "files_skipped", "pages", "chunks", "chunk_hits", "chunk_misses",
+    "chunks_embedded", "chunks_written", "chunks_deleted",
+)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ingestion_job_manager:
+    """
+    a class to represent the background PDF ingestion jobs
+
+    Uploads are spooled to `spool_dir` and queued on a local in-process queue, a pool of
+    `workers` threads runs them through PDFChunksUploader. Each job keeps its status and
+    progress in memory and in a job.json file next to its spooled files.
+    """
+
+    def __init__(self, spool_dir=None, workers=None):
+        self.spool_dir = spool_dir or os.getenv("INGEST_SPOOL_DIR", ".ingest_spool")
+        self.workers = int(workers or os.getenv("INGEST_WORKERS", 2))
+        self.keep_job_records = os.getenv("INGEST_KEEP_JOB_RECORDS", "False").lower() in ["true", "yes", "1"]
+        self.max_finished_jobs = int(os.getenv("INGEST_MAX_FINISHED_JOBS", 1000))
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingestion_worker_{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+
+    def shutdown(self):
+        for event in list(self._cancel_events.values()):
+            event.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads.clear()
+
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.spool_dir, job_id)
+
+
+    @staticmethod
+    def _safe_filename(filename):
+        return re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or "upload.pdf"))
+
+
+    def spool(self, uploads, tenant=None, replace=True):
+        """
+        Copy uploads to the spool directory and queue them as one job.
+
+        Args:
+            uploads: list of (filename, file object opened for binary reading)
+            tenant: tenant whose collection receives the chunks, None for the shared collection
+            replace: each file replaces the documents ingested before under its filename, False
+                keeps distinct files sharing a name side by side
+
+        Returns:
+            str: the job id
+        """
+        job_id = str(uuid4())
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+
+        files = []
+        for index, (filename, fileobj) in enumerate(uploads):
+            path = os.path.join(job_dir, f"{index}_{self._safe_filename(filename)}")
+            # Streamed in blocks, the upload is never held in memory as a whole
+            with open(path, "wb") as out:
+                shutil.copyfileobj(fileobj, out, length=1024 * 1024)
+            files.append((filename, path))
+
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "files": [filename for filename, _ in files],
+            "tenant": tenant,
+            "replace": replace,
+            "progress": {field: 0 for field in PROGRESS_FIELDS},
+            "errors": [],
+            "result": None,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._forget_finished_jobs()
+            self._jobs[job_id] = job
+            self._cancel_events[job_id] = threading.Event()
+        self._persist(job_id)
+        self._queue.put((job_id, files, tenant, replace))
+        return job_id
+
+
+    def get(self, job_id):
+        """
+        Return a copy of the job record, or None for an unknown job.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job is not None else None
+
+
+    def cancel(self, job_id):
+        """
+        Ask a job to stop. Queued jobs are cancelled before they start, running jobs stop
+        at the next pipeline step.
+
+        Returns:
+            dict: the job record, or None for an unknown job
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] in ("queued", "running"):
+                self._cancel_events[job_id].set()
+                if job["status"] == "queued":
+                    job["status"] = "cancelled"
+                    job["finished_at"] = _now()
+        self._persist(job_id)
+        return self.get(job_id)
+
+
+    def _forget_finished_jobs(self):
+        # Jobs are kept in insertion order, the oldest finished ones are dropped first
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs + 1)]:
+            del self._jobs[job_id]
+            self._cancel_events.pop(job_id, None)
+
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+
+    def _persist(self, job_id):
+        job = self.get(job_id)
+        if job is None or not os.path.isdir(self._job_dir(job_id)):
+            return
+        with open(os.path.join(self._job_dir(job_id), "job.json"), "w") as f:
+            json.dump(job, f)
+
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, files, tenant, replace = item
+            try:
+                self._run(job_id, files, tenant, replace)
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+
+    def _run(self, job_id, files, tenant=None, replace=True):
+        cancel_event = self._cancel_events[job_id]
+        if cancel_event.is_set():
+            self._cleanup(job_id)
+            return
+
+        self._update(job_id, status="running", started_at=_now())
+        self._persist(job_id)
+
+        def on_progress(stats):
+            self._update(
+                job_id,
+                progress={field: stats.get(field, 0) for field in PROGRESS_FIELDS},
+                errors=stats.get("errors", [])
+            )
+
+        try:
+            result = PDFChunksUploader(files=files, tenant=tenant, replace=replace).start_pdf_upload(
+                progress_callback=on_progress, cancel_event=cancel_event
+            )
+            stats = result["stats"]
+            on_progress(stats)
+            self._update(job_id, status="completed", result=result)
+        except Exception as e:
+            if cancel_event.is_set() or isinstance(e.__context__, ingestion_cancelled):
+                self._update(job_id, status="cancelled")
+            else:
+                with self._lock:
+                    self._jobs[job_id]["errors"].append({"file": None, "error": str(e)})
+                self._update(job_id, status="failed")
+                logger.error(f"Ingestion job {job_id} failed: {e}")
+        finally:
+            self._update(job_id, finished_at=_now())
+            self._persist(job_id)
+            self._cleanup(job_id)
+
+
+    def _cleanup(self, job_id):
+        # Spooled PDFs are removed once processed, job.json is kept with INGEST_KEEP_JOB_RECORDS
+        job_dir = self._job_dir(job_id)
+        if not os.path.isdir(job_dir):
+            return
+        for name in os.listdir(job_dir):
+            if name != "job.json" or not self.keep_job_records:
+                os.remove(os.path.join(job_dir, name))
+        if not os.listdir(job_dir):
+            os.rmdir(job_dir)
@@ -0,0 +1,188 @@
+from src.registry.resource_registry import get_registry
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+import threading
+import hashlib
+import sqlite3
+import os
+
+load_dotenv()
+
+
+def hash_text(text):
+    """
+    sha256 of a text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_bytes(data):
+    """
+    sha256 of bytes.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    """
+    sha256 of the content of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(text):
+    """
+    Stable id of a chunk, derived from its content so identical chunks share one vector store entry.
+    """
+    return hash_text(text)
+
+
+def document_key(document_hash):
+    """
+    Manifest key of an uploaded file. Files are keyed by their content, two different files
+    sharing a name are two documents and a file only replaces another one on request.
+    """
+    return f"file:{document_hash}"
+
+
+
+class ingestion_manifest:
+    """
+    a class to represent the local manifest of what has been ingested in each collection
+
+    Stores the content hash and name of every ingested document and the ids of the chunks it
+    produced. Chunk ids are content hashes, a chunk shared by several documents is stored once
+    and only deleted from the vector store when no document references it any more.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("INGEST_MANIFEST_PATH", ".ingestion_manifest.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                collection TEXT NOT NULL,
+                doc_key TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                name TEXT,
+                PRIMARY KEY (collection, doc_key)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                collection TEXT NOT NULL,
+                doc_key TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (collection, doc_key, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_by_id ON chunks (collection, chunk_id);
+        """)
+        # Manifests written before documents had names were keyed by file name
+        if "name" not in {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN name TEXT")
+            self._conn.execute("UPDATE documents SET name = doc_key")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_by_name ON documents (collection, name)")
+        self._conn.commit()
+
+
+    def is_unchanged(self, collection, doc_key, document_hash):
+        """
+        True when the document was already ingested with the same content.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM documents WHERE collection = ? AND doc_key = ?",
+                (collection, doc_key)
+            ).fetchone()
+        return row is not None and row[0] == document_hash
+
+
+    def known_chunks(self, collection, chunk_ids):
+        """
+        Return the subset of chunk_ids already stored in the collection, by any document.
+        """
+        chunk_ids = list(chunk_ids)
+        known = set()
+        with self._lock:
+            # Stay below the SQLite bound parameter limit
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT DISTINCT chunk_id FROM chunks WHERE collection = ? AND chunk_id IN ({','.join('?' * len(batch))})",
+                    (collection, *batch)
+                ).fetchall()
+                known.update(row[0] for row in rows)
+        return known
+
+
+    def documents_named(self, collection, name):
+        """
+        Return the keys of the documents of the collection ingested under a name.
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT doc_key FROM documents WHERE collection = ? AND name = ?", (collection, name)
+            )]
+
+
+    def stale_chunks(self, collection, doc_key, chunk_ids, replaces=()):
+        """
+        Return the chunks the previous version of a document, and the documents it replaces,
+        produced that neither its new version nor any other document still references, they can
+        be deleted from the vector store.
+        """
+        chunk_ids = set(chunk_ids)
+        doc_keys = [doc_key, *replaces]
+        marks = ",".join("?" * len(doc_keys))
+        with self._lock:
+            previous = {row[0] for row in self._conn.execute(
+                f"SELECT chunk_id FROM chunks WHERE collection = ? AND doc_key IN ({marks})", (collection, *doc_keys)
+            )}
+            stale = []
+            for candidate in previous - chunk_ids:
+                shared = self._conn.execute(
+                    f"SELECT 1 FROM chunks WHERE collection = ? AND chunk_id = ? AND doc_key NOT IN ({marks}) LIMIT 1",
+                    (collection, candidate, *doc_keys)
+                ).fetchone()
+                if shared is None:
+                    stale.append(candidate)
+        return stale
+
+
+    def record(self, collection, doc_key, document_hash, chunk_ids, name=None, replaces=()):
+        """
+        Record the current version of a document once its chunks are written, and forget the
+        documents it replaces.
+        """
+        with self._lock, self._conn:
+            for replaced in replaces:
+                self._conn.execute("DELETE FROM documents WHERE collection = ? AND doc_key = ?", (collection, replaced))
+                self._conn.execute("DELETE FROM chunks WHERE collection = ? AND doc_key = ?", (collection, replaced))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (collection, doc_key, content_hash, updated_at, name) VALUES (?, ?, ?, ?, ?)",
+                (collection, doc_key, document_hash, datetime.now(timezone.utc).isoformat(), name or doc_key)
+            )
+            self._conn.execute("DELETE FROM chunks WHERE collection = ? AND doc_key = ?", (collection, doc_key))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks (collection, doc_key, chunk_id) VALUES (?, ?, ?)",
+                [(collection, doc_key, c) for c in chunk_ids]
+            )
+
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+
+def get_ingestion_manifest():
+    """
+    Return the process wide manifest, or None when INGEST_DEDUP is disabled.
+    """
+    if os.getenv("INGEST_DEDUP", "True").lower() not in ["true", "yes", "1"]:
+        return None
+    return get_registry().get_or_create("ingestion_manifest", ingestion_manifest)
@@ -0,0 +1,332 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.embeddings import Embeddings
+from src.embedding.embedding import embedding
+from src.registry.resource_registry import get_registry
+from src.retrievers.local_index import get_local_index, stamp_ingested
+from src.retrievers.bm25_index import get_bm25_index
+from utils.ingestion_manifest import get_ingestion_manifest, hash_bytes, hash_file, chunk_id, document_key
+from dotenv import load_dotenv
+import multiprocessing
+import threading
+import copy
+import time
+import os
+
+load_dotenv()
+
+
+class ingestion_cancelled(Exception):
+    """
+    Raised by the pipeline when its cancel event is set.
+    """
+
+
+def parse_pdf(filename, source, chunk_size=1000, chunk_overlap=200):
+    """
+    Parse a PDF with PyMuPDF and split it into chunks. Runs in a worker process.
+
+    Args:
+        filename: name reported in the chunk metadata
+        source: the PDF bytes, or the path of a PDF file on disk
+
+    Returns:
+        tuple: filename, number of pages and the list of chunk documents
+    """
+    import pymupdf
+
+    # Opened straight from memory, no temporary file
+    pdf = pymupdf.open(source) if isinstance(source, str) else pymupdf.open(stream=source, filetype="pdf")
+    try:
+        pdf_metadata = {k: v for k, v in (pdf.metadata or {}).items() if isinstance(v, (str, int, float)) and v != ""}
+        texts, metadatas = [], []
+        for page_number, page in enumerate(pdf):
+            texts.append(page.get_text())
+            metadatas.append({
+                **pdf_metadata,
+                "source": filename,
+                "file_path": filename,
+                "page": page_number,
+                "total_pages": pdf.page_count,
+            })
+        page_count = pdf.page_count
+    finally:
+        pdf.close()
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    return filename, page_count, text_splitter.create_documents(texts, metadatas)
+
+
+
+class precomputed_embeddings(Embeddings):
+    """
+    a class to represent embeddings computed ahead of the insert
+
+    The vector store embeds the texts it inserts, this hands back the vectors produced by
+    the embedding stage instead of computing them a second time.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.vectors = {}
+
+    def put(self, texts, vectors):
+        self.vectors.update(zip(texts, vectors))
+
+    def discard(self, texts):
+        for text in texts:
+            self.vectors.pop(text, None)
+
+    def embed_documents(self, texts):
+        missing = [t for t in texts if t not in self.vectors]
+        if missing:
+            self.put(missing, self.base.embed_documents(missing))
+        return [self.vectors[t] for t in texts]
+
+    def embed_query(self, text):
+        return self.base.embed_query(text)
+
+
+
+class ingestion_pipeline:
+    """
+    a class to represent the PDF ingestion pipeline
+
+    Stages run concurrently:
+        parse  - PDFs are parsed and split in a process pool, straight from memory
+        embed  - chunks are embedded in batches of `embedding_batch_size` as soon as they are parsed
+        insert - embedded batches are bulk inserted with at most `insert_concurrency` batches in flight
+
+    With a manifest, files already ingested with the same content are skipped before parsing,
+    chunks get content derived ids so only new chunks are embedded and upserted. Documents are
+    keyed by their content, a file replaces the documents ingested before under its name unless
+    the run is asked not to, and the chunks nothing references any more are deleted.
+    """
+
+    def __init__(self, vectorstore, embedder=None, parse_workers=None, embedding_batch_size=None,
+                 insert_batch_size=None, insert_concurrency=None, chunk_size=1000, chunk_overlap=200,
+                 manifest=None, collection_name=None):
+        self.vectorstore = vectorstore
+        self.manifest = manifest if manifest is not None else get_ingestion_manifest()
+        self.collection_name = collection_name or getattr(vectorstore, "collection_name", None) or "default"
+        self.mirror = get_local_index(self.collection_name)
+        self.lexical = get_bm25_index(self.collection_name)
+        self.embedder = embedder or embedding().get_embedding()
+        self.parse_workers = int(parse_workers or os.getenv("INGEST_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+        self.embedding_batch_size = int(embedding_batch_size or os.getenv("INGEST_EMBEDDING_BATCH_SIZE", 64))
+        self.insert_batch_size = int(insert_batch_size or os.getenv("INGEST_INSERT_BATCH_SIZE", 20))
+        self.insert_concurrency = int(insert_concurrency or os.getenv("INGEST_INSERT_CONCURRENCY", 4))
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+
+    def _parse_pool(self):
+        # Shared by every upload of the process, spawned workers do not inherit the model threads
+        return get_registry().get_or_create(
+            f"process_pool:pdf_parse:{self.parse_workers}",
+            lambda: ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        )
+
+
+    def run(self, files, progress_callback=None, cancel_event=None, replace=True):
+        """
+        Ingest files into the vector store. A file that fails to parse is reported in
+        stats["errors"] and does not stop the other files.
+
+        Args:
+            files: list of (filename, source) where source is the PDF bytes or a file path
+            progress_callback: optional callable receiving the stats dict after every stage step
+            cancel_event: optional threading.Event, the run raises ingestion_cancelled once it is set
+            replace: each file replaces the documents ingested before under the same filename,
+                False keeps distinct files sharing a name side by side
+
+        Returns:
+            dict: counters and per-stage throughput
+        """
+        stats = {
+            "files": len(files), "files_parsed": 0, "pages": 0,
+            "chunks": 0, "chunks_embedded": 0, "chunks_written": 0, "errors": [],
+            "files_skipped": 0, "chunk_hits": 0, "chunk_misses": 0, "chunks_deleted": 0,
+            "parse_seconds": 0.0, "embed_seconds": 0.0, "insert_seconds": 0.0,
+        }
+        lock = threading.Lock()
+        start = time.perf_counter()
+
+        def report():
+            if progress_callback is not None:
+                with lock:
+                    snapshot = {**stats, "errors": list(stats["errors"])}
+                progress_callback(snapshot)
+
+        def check_cancelled():
+            if cancel_event is not None and cancel_event.is_set():
+                for future in futures:
+                    future.cancel()
+                raise ingestion_cancelled("Ingestion cancelled")
+
+        embeddings = precomputed_embeddings(self.embedder)
+        # Shallow copy sharing the collection handle, only its embedding is swapped
+        store = copy.copy(self.vectorstore)
+        store.embedding = embeddings
+
+        insert_window = []
+
+        def insert(documents):
+            texts = [d.page_content for d in documents]
+            batch_start = time.perf_counter()
+            ids = [d.id for d in documents] if self.manifest is not None else None
+            metadatas = stamp_ingested([d.metadata for d in documents])
+            written_ids = store.add_texts(texts, metadatas=metadatas, ids=ids, batch_size=self.insert_batch_size)
+            if self.mirror is not None:
+                self.mirror.upsert_vectors(written_ids, texts, metadatas, embeddings.embed_documents(texts))
+            if self.lexical is not None:
+                self.lexical.upsert(written_ids, texts, metadatas)
+            embeddings.discard(texts)
+            with lock:
+                stats["chunks_written"] += len(documents)
+                # Batches overlap, the stage time is the span from the first insert to the last
+                insert_window.extend([batch_start, time.perf_counter()])
+                stats["insert_seconds"] = max(insert_window) - min(insert_window)
+            report()
+
+        in_flight = set()
+        buffer = []
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.insert_concurrency, thread_name_prefix="ingest_insert") as insert_pool:
+
+            def embed_and_submit(documents):
+                check_cancelled()
+                batch_start = time.perf_counter()
+                texts = [d.page_content for d in documents]
+                embeddings.put(texts, self.embedder.embed_documents(texts))
+                with lock:
+                    stats["chunks_embedded"] += len(documents)
+                    stats["embed_seconds"] += time.perf_counter() - batch_start
+                report()
+
+                # Bounded concurrency, wait for a slot before queuing another batch
+                while len(in_flight) >= self.insert_concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        in_flight.discard(future)
+                        future.result()
+                in_flight.add(insert_pool.submit(insert, documents))
+
+            # (filename, source, doc_key, content hash) of every file to ingest, keys only with a manifest
+            pending_files = [(filename, source, None, None) for filename, source in files]
+            replaced = {}
+            if self.manifest is not None:
+                changed, keys = [], set()
+                for filename, source, _, _ in pending_files:
+                    file_hash = hash_file(source) if isinstance(source, str) else hash_bytes(bytes(source))
+                    doc_key = document_key(file_hash)
+                    if replace:
+                        replaced[doc_key] = [k for k in self.manifest.documents_named(self.collection_name, filename) if k != doc_key]
+                    if doc_key in keys or (self.manifest.is_unchanged(self.collection_name, doc_key, file_hash) and not replaced.get(doc_key)):
+                        stats["files_skipped"] += 1
+                    else:
+                        keys.add(doc_key)
+                        changed.append((filename, source, doc_key, file_hash))
+                pending_files = changed
+                report()
+
+            parse_pool = self._parse_pool()
+            futures = {
+                parse_pool.submit(parse_pdf, filename, source if isinstance(source, str) else bytes(source),
+                                  self.chunk_size, self.chunk_overlap): (filename, doc_key, file_hash)
+                for filename, source, doc_key, file_hash in pending_files
+            }
+            parsed_ids = {}
+            seen_ids = set()
+            for future in as_completed(futures):
+                check_cancelled()
+                filename, doc_key, _ = futures[future]
+                try:
+                    _, page_count, chunks = future.result()
+                except Exception as e:
+                    with lock:
+                        stats["errors"].append({"file": filename, "error": str(e)})
+                    report()
+                    continue
+                with lock:
+                    stats["files_parsed"] += 1
+                    stats["pages"] += page_count
+                    stats["chunks"] += len(chunks)
+                    stats["parse_seconds"] = time.perf_counter() - start
+
+                if self.manifest is not None:
+                    chunks, hits = self._new_chunks(doc_key, chunks, parsed_ids, seen_ids)
+                    with lock:
+                        stats["chunk_hits"] += hits
+                        stats["chunk_misses"] += len(chunks)
+                report()
+
+                buffer.extend(chunks)
+                while len(buffer) >= self.embedding_batch_size:
+                    batch, buffer = buffer[:self.embedding_batch_size], buffer[self.embedding_batch_size:]
+                    embed_and_submit(batch)
+
+            if buffer:
+                embed_and_submit(buffer)
+            for future in in_flight:
+                future.result()
+
+        # Only once every chunk is written, an interrupted run leaves the manifest untouched
+        if self.manifest is not None:
+            for filename, doc_key, file_hash in futures.values():
+                if doc_key not in parsed_ids:
+                    continue
+                ids = parsed_ids[doc_key]
+                stale = self.manifest.stale_chunks(self.collection_name, doc_key, ids, replaced.get(doc_key, ()))
+                if stale:
+                    store.delete(ids=stale)
+                    if self.mirror is not None:
+                        self.mirror.delete(ids=stale)
+                    if self.lexical is not None:
+                        self.lexical.delete(stale)
+                    stats["chunks_deleted"] += len(stale)
+                self.manifest.record(self.collection_name, doc_key, file_hash, ids, name=filename,
+                                     replaces=replaced.get(doc_key, ()))
+
+        stats["total_seconds"] = time.perf_counter() - start
+        stats.update(self.throughput(stats))
+        return stats
+
+
+    def _new_chunks(self, doc_key, chunks, parsed_ids, seen_ids):
+        """
+        Give chunks their content derived ids and keep only the ones not already stored.
+
+        Returns:
+            tuple: the chunks to embed and insert, and the number of chunks skipped
+        """
+        ids = []
+        for chunk in chunks:
+            chunk.id = chunk_id(chunk.page_content)
+            ids.append(chunk.id)
+        parsed_ids[doc_key] = list(dict.fromkeys(ids))
+
+        known = self.manifest.known_chunks(self.collection_name, parsed_ids[doc_key])
+        new_chunks = []
+        for chunk in chunks:
+            # Duplicates within this run are embedded once
+            if chunk.id in known or chunk.id in seen_ids:
+                continue
+            seen_ids.add(chunk.id)
+            new_chunks.append(chunk)
+        return new_chunks, len(chunks) - len(new_chunks)
+
+
+    @staticmethod
+    def throughput(stats):
+        def rate(count, seconds):
+            return round(count / seconds, 2) if seconds > 0 else None
+        return {
+            "pages_per_second": rate(stats["pages"], stats["parse_seconds"]),
+            "chunks_per_second": rate(stats["chunks_written"], stats["total_seconds"]),
+            "embeddings_per_second": rate(stats["chunks_embedded"], stats["embed_seconds"]),
+            "writes_per_second": rate(stats["chunks_written"], stats["insert_seconds"]),
+        }